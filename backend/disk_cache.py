@@ -0,0 +1,143 @@
+import os
+import json
+import hashlib
+import tempfile
+import threading
+import time
+from typing import Any, Optional
+
+
+class DiskCache:
+    """
+    JSON으로 직렬화 가능한 값을 디스크에 저장하는 내용 주소 기반 캐시.
+
+    키는 SHA-256으로 해시되어 파일 이름이 되며, 여러 프로세스가 같은 디렉토리를 공유해도
+    원자적 교체(os.replace)로 안전하게 쓸 수 있습니다. 전체 크기가 max_bytes를 넘으면
+    가장 오래 사용되지 않은(mtime 기준) 항목부터 삭제합니다.
+    ttl_seconds를 지정하면 저장 시각으로부터 그 시간이 지난 항목은 없는 것으로 취급하고 삭제합니다.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, ttl_seconds: Optional[float] = None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds or None
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self._size = None  # 디렉토리 전체 크기 추정치 (처음 쓸 때 계산)
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def make_key(*parts: Any) -> str:
+        """여러 구성 요소(딕셔너리, 문자열 등)로부터 안정적인 캐시 키를 만드는 함수."""
+        payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, digest[:2], f"{digest}.json")
+
+    def get(self, key: str) -> Optional[Any]:
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                value = json.load(f)
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+
+        if self.ttl_seconds:
+            # TTL 캐시는 {"expires_at": ..., "value": ...} 형식으로 저장됩니다.
+            if not isinstance(value, dict) or value.get("expires_at", 0) < time.time():
+                removed = 0
+                try:
+                    removed = os.path.getsize(path)
+                    os.remove(path)
+                except OSError:
+                    pass
+                with self._lock:
+                    self.misses += 1
+                    self.expired += 1
+                    if self._size is not None:
+                        self._size -= removed
+                return None
+            value = value.get("value")
+
+        try:
+            os.utime(path)  # LRU 순서를 위해 마지막 사용 시각 갱신
+        except OSError:
+            pass
+        with self._lock:
+            self.hits += 1
+        return value
+
+    def set(self, key: str, value: Any) -> None:
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if self.ttl_seconds:
+            value = {"expires_at": time.time() + self.ttl_seconds, "value": value}
+        data = json.dumps(value, ensure_ascii=False).encode("utf-8")
+
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Cache write failed for {path}: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+
+        with self._lock:
+            if self._size is None:
+                self._size = self._scan()[1]
+            else:
+                self._size += len(data)
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _scan(self) -> tuple:
+        """캐시 파일 목록 [(mtime, size, path)]과 전체 크기를 반환하는 함수."""
+        entries = []
+        total = 0
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith(".json"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+                total += st.st_size
+        return entries, total
+
+    def _evict(self) -> None:
+        """전체 크기가 max_bytes의 90% 이하가 될 때까지 오래된 항목부터 삭제하는 함수."""
+        entries, total = self._scan()
+        target = int(self.max_bytes * 0.9)
+        for _, size, path in sorted(entries):
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                continue
+        self._size = total
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "expired": self.expired,
+            "ttl_seconds": self.ttl_seconds,
+            "size_bytes": self._size,
+            "max_bytes": self.max_bytes,
+        }
@@ -0,0 +1,122 @@
+import os
+import asyncio
+from typing import Callable, Dict, List, Optional
+
+import anthropic
+from dotenv import load_dotenv
+
+from llm_cache import create_message, store_response
+from llm_client import AI_ENABLED, llm_call
+
+load_dotenv()
+
+# 해설 일괄 생성 설정
+# auto: 배치 API(Message Batches, 비용 절반)를 먼저 시도하고 지원되지 않으면 직접 호출로 대체
+# batch: 배치 API만 사용, direct: 속도 제한을 둔 동시 호출만 사용
+EXPLAIN_BATCH_MODE = os.getenv("EXPLAIN_BATCH_MODE", "auto")
+EXPLAIN_BATCH_POLL_SECONDS = float(os.getenv("EXPLAIN_BATCH_POLL_SECONDS", "30"))
+EXPLAIN_DIRECT_CONCURRENCY = int(os.getenv("EXPLAIN_DIRECT_CONCURRENCY", "4"))
+EXPLAIN_DIRECT_REQUESTS_PER_MINUTE = int(os.getenv("EXPLAIN_DIRECT_REQUESTS_PER_MINUTE", "50"))
+
+# 배치 API를 쓸 수 없음을 뜻하는 HTTP 상태 (엔드포인트 없음, 권한 없음, 지원하지 않는 메서드)
+BATCH_UNAVAILABLE_STATUSES = (403, 404, 405, 501)
+
+
+class BatchUnavailable(Exception):
+    """배치 API를 사용할 수 없을 때 발생하는 예외 (직접 호출로 대체)."""
+
+
+async def run_batch(requests: List[dict], batch_id: Optional[str] = None,
+                    on_submitted: Optional[Callable[[str], None]] = None,
+                    on_progress: Optional[Callable[[int, int], None]] = None) -> Dict[str, dict]:
+    """
+    요청들을 Message Batches API로 한 번에 제출하고 끝날 때까지 기다려 결과를 반환하는 함수.
+
+    requests의 각 항목은 {"custom_id", "model", "messages", "params"} 형식이며, 반환값은
+    custom_id -> {"text", "stop_reason"} 딕셔너리입니다 (실패한 요청은 빠짐).
+    batch_id를 넘기면 새로 제출하지 않고 이미 제출한 배치를 이어서 기다립니다(회수된 작업 재개).
+    on_submitted(batch_id)는 제출 직후, on_progress(완료 수, 전체 수)는 상태를 확인할 때마다 호출됩니다.
+    """
+    if not AI_ENABLED:
+        raise BatchUnavailable("Anthropic 클라이언트가 설정되지 않았습니다.")
+
+    if batch_id is None:
+        batch_requests = [
+            {"custom_id": request["custom_id"],
+             "params": {"model": request["model"], "messages": request["messages"], **request["params"]}}
+            for request in requests
+        ]
+        try:
+            batch = await llm_call(lambda client: client.messages.batches.create(requests=batch_requests),
+                                   priority="background")
+        except anthropic.APIStatusError as e:
+            if e.status_code in BATCH_UNAVAILABLE_STATUSES:
+                raise BatchUnavailable(f"배치 API를 사용할 수 없습니다 (HTTP {e.status_code})") from e
+            raise
+        batch_id = batch.id
+        print(f"DEBUG: Submitted explanation batch {batch_id} ({len(requests)} requests)")
+        if on_submitted:
+            on_submitted(batch_id)
+
+    while True:
+        batch = await llm_call(lambda client: client.messages.batches.retrieve(batch_id), priority="background")
+        counts = batch.request_counts
+        finished = counts.succeeded + counts.errored + counts.canceled + counts.expired
+        if on_progress:
+            on_progress(finished, finished + counts.processing)
+        if batch.processing_status == "ended":
+            break
+        await asyncio.sleep(EXPLAIN_BATCH_POLL_SECONDS)
+
+    by_id = {request["custom_id"]: request for request in requests}
+    results = {}
+    async for entry in await llm_call(lambda client: client.messages.batches.results(batch_id),
+                                        priority="background"):
+        if entry.result.type != "succeeded" or entry.custom_id not in by_id:
+            continue
+        message = entry.result.message
+        response = {"text": message.content[0].text, "stop_reason": message.stop_reason}
+        results[entry.custom_id] = response
+        # 같은 프롬프트의 /explain 요청이 캐시를 재사용하도록 create_message와 같은 키로 저장
+        request = by_id[entry.custom_id]
+        await store_response("explain_batch", request["model"], request["messages"], response, **request["params"])
+    print(f"DEBUG: Explanation batch {batch_id} ended: {len(results)}/{len(requests)} succeeded")
+    return results
+
+
+async def run_direct(requests: List[dict], on_result: Optional[Callable[[str, dict], None]] = None,
+                     use_cache: bool = True) -> Dict[str, dict]:
+    """
+    배치 API 대신 요청을 직접 보내는 함수. 동시에 EXPLAIN_DIRECT_CONCURRENCY개까지,
+    분당 EXPLAIN_DIRECT_REQUESTS_PER_MINUTE개를 넘지 않도록 시작 간격을 두고 호출합니다.
+    on_result(custom_id, 응답)는 요청이 성공할 때마다 호출됩니다. use_cache=False이면 LLM 응답 캐시를 건너뜁니다.
+    """
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(max(1, EXPLAIN_DIRECT_CONCURRENCY))
+    interval = 60.0 / EXPLAIN_DIRECT_REQUESTS_PER_MINUTE if EXPLAIN_DIRECT_REQUESTS_PER_MINUTE > 0 else 0.0
+    next_start = loop.time()
+    results = {}
+
+    async def call(request: dict) -> None:
+        nonlocal next_start
+        async with semaphore:
+            now = loop.time()
+            wait = next_start - now
+            next_start = max(now, next_start) + interval
+            if wait > 0:
+                await asyncio.sleep(wait)
+            try:
+                response = await create_message("explain_precompute", model=request["model"],
+                                                messages=request["messages"], use_cache=use_cache,
+                                                priority="background", **request["params"])
+            except Exception as e:
+                print(f"Explanation request {request['custom_id']} failed: {e}")
+                return
+        if response is None:
+            return
+        results[request["custom_id"]] = response
+        if on_result:
+            on_result(request["custom_id"], response)
+
+    await asyncio.gather(*(call(request) for request in requests))
+    return results
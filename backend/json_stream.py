@@ -0,0 +1,138 @@
+import json
+import re
+from typing import List
+
+# 배열 안에서 구조를 바꾸는 글자(문자열 시작, 괄호)와 문자열 안에서 의미 있는 글자(끝 따옴표, 이스케이프)
+_STRUCTURE_PATTERN = re.compile(r'["{}\[\]]')
+_STRING_PATTERN = re.compile(r'["\\]')
+# 대상 배열의 시작: '[' 다음에 (공백을 건너뛰고) '{' 또는 ']'가 오는 위치
+_ARRAY_START_PATTERN = re.compile(r"\[(\s*)")
+
+
+class JSONArrayStream:
+    """
+    LLM 응답을 조각 단위로 받아, 응답 속 JSON 배열의 객체 원소를 닫히는 즉시 돌려주는 점진적 파서.
+
+    배열은 '[' 다음에 '{'(또는 빈 배열의 ']')가 오는 첫 위치로 찾으므로 코드 블록(```json), 앞뒤 설명 문장,
+    {"questions": [...]}처럼 객체로 감싼 응답도 처리합니다. JSON으로 읽히지 않는 원소는 그 원소만 건너뛰고(skipped),
+    응답이 중간에 끊기면(max_tokens, 연결 오류) 그때까지 닫힌 원소는 이미 반환된 상태로 남습니다.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.pos = 0  # buffer에서 다음에 검사할 위치
+        self.in_array = False
+        self.done = False  # 배열의 닫는 괄호까지 받음
+        self.depth = 0  # 배열 안에서 현재 원소의 중첩 깊이 (0이면 원소 사이)
+        self.start = None  # 현재 원소가 시작된 buffer 위치
+        self.in_string = False
+        self.count = 0
+        self.skipped = 0
+
+    @property
+    def truncated(self) -> bool:
+        """배열이 시작됐지만 닫히기 전에 응답이 끝났는지 여부 (feed를 모두 마친 뒤 확인)."""
+        return self.in_array and not self.done
+
+    def feed(self, text: str) -> List[dict]:
+        """응답 조각을 넣고, 이번 조각으로 닫힌 객체 원소들을 반환하는 함수."""
+        if self.done:
+            return []
+        self.buffer += text
+        objects = []
+        while not self.done:
+            if not self.in_array:
+                if not self._find_array():
+                    break
+            elif not self._scan(objects):
+                break
+        self._compact()
+        return objects
+
+    def _find_array(self) -> bool:
+        """대상 배열의 시작을 찾는 함수. 판단하려면 다음 조각이 필요하면 False."""
+        while True:
+            match = _ARRAY_START_PATTERN.search(self.buffer, self.pos)
+            if match is None:
+                # 끝의 '['는 다음 조각을 봐야 판단할 수 있으므로 남겨 둠
+                self.pos = len(self.buffer)
+                return False
+            if match.end() >= len(self.buffer):
+                self.pos = match.start()
+                return False
+            following = self.buffer[match.end()]
+            if following == "{":
+                self.in_array = True
+                self.pos = match.end()
+                return True
+            if following == "]":
+                self.done = True
+                return False
+            self.pos = match.start() + 1
+
+    def _scan(self, objects: List[dict]) -> bool:
+        """배열 안을 다음 구조 글자까지 읽는 함수. 버퍼 끝에 닿으면 False."""
+        if self.in_string:
+            match = _STRING_PATTERN.search(self.buffer, self.pos)
+            if match is None:
+                self.pos = len(self.buffer)
+                return False
+            if match.group() == "\\":
+                if match.end() >= len(self.buffer):
+                    # 이스케이프된 글자가 아직 도착하지 않음
+                    self.pos = match.start()
+                    return False
+                self.pos = match.end() + 1
+                return True
+            self.in_string = False
+            self.pos = match.end()
+            return True
+
+        match = _STRUCTURE_PATTERN.search(self.buffer, self.pos)
+        if match is None:
+            self.pos = len(self.buffer)
+            return False
+        char, index = match.group(), match.start()
+        self.pos = match.end()
+        if char == '"':
+            self.in_string = True
+        elif char in "{[":
+            if self.depth == 0:
+                self.start = index
+            self.depth += 1
+        elif self.depth == 0:
+            # 원소 사이의 ']'는 배열의 끝
+            self.done = char == "]"
+        else:
+            self.depth -= 1
+            if self.depth == 0:
+                self._close(self.buffer[self.start:self.pos], objects)
+                self.start = None
+        return True
+
+    def _close(self, element: str, objects: List[dict]) -> None:
+        try:
+            value = json.loads(element)
+        except ValueError as e:
+            self.skipped += 1
+            print(f"DEBUG: JSON 배열 원소를 읽을 수 없어 건너뜀: {e} ({element[:100]!r})")
+            return
+        if isinstance(value, dict):
+            self.count += 1
+            objects.append(value)
+        else:
+            self.skipped += 1
+
+    def _compact(self) -> None:
+        # 이미 읽은 부분은 버려서 긴 응답에서도 버퍼가 원소 하나 크기로 유지되게 함
+        cut = self.pos if self.start is None else self.start
+        if cut:
+            self.buffer = self.buffer[cut:]
+            self.pos -= cut
+            if self.start is not None:
+                self.start -= cut
+
+
+def parse_json_array(text: str) -> List[dict]:
+    """전체 응답 텍스트에서 JSON 배열의 객체 원소를 읽는 함수 (잘린 응답이면 닫힌 원소까지만)."""
+    return JSONArrayStream().feed(text)
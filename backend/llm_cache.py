@@ -0,0 +1,248 @@
+import os
+import re
+import asyncio
+import threading
+import weakref
+from typing import AsyncIterator, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from disk_cache import DiskCache
+from llm_client import AI_ENABLED, llm_call, llm_stream
+from token_budget import estimate_message_tokens
+
+load_dotenv()
+
+# LLM 응답 캐시: 모델, 호출 파라미터, 정규화한 프롬프트가 같으면 이전 응답을 재사용합니다.
+# 같은 문제의 해설처럼 여러 사용자가 반복해서 요청하는 호출에서 API 비용과 지연 시간을 줄입니다.
+# LLM_CACHE_DIR를 빈 값으로 설정하면 캐시를 사용하지 않습니다.
+LLM_CACHE_DIR = os.getenv("LLM_CACHE_DIR", "llm_cache")
+LLM_CACHE_MAX_MB = int(os.getenv("LLM_CACHE_MAX_MB", "256"))
+LLM_CACHE_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL_SECONDS", str(30 * 24 * 3600)))
+LLM_CACHE = (DiskCache(LLM_CACHE_DIR, LLM_CACHE_MAX_MB * 1024 * 1024, ttl_seconds=LLM_CACHE_TTL_SECONDS)
+             if LLM_CACHE_DIR else None)
+
+# 용도(explain, generate, parse 등)별 적중/실패/합류 횟수 (프로세스 단위)
+_purpose_stats = {}
+_stats_lock = threading.Lock()
+
+# 이벤트 루프별로 캐시 키 -> 진행 중인 API 호출(_Flight)
+# 같은 문제를 여러 학생이 동시에 열면 첫 요청만 API를 호출하고 나머지는 그 결과를 함께 받습니다.
+_flights = weakref.WeakKeyDictionary()
+
+
+def normalize_prompt(text: str) -> str:
+    """공백 차이만 있는 프롬프트가 같은 캐시 키를 갖도록 연속된 공백/줄바꿈을 하나의 공백으로 합치는 함수."""
+    return re.sub(r"\s+", " ", text or "").strip()
+
+
+def llm_cache_key(model: str, messages: List[dict], params: dict) -> str:
+    """모델, 호출 파라미터(max_tokens, temperature 등), 정규화한 메시지로 캐시 키를 만드는 함수."""
+    normalized = [(message["role"], normalize_prompt(message["content"])) for message in messages]
+    return DiskCache.make_key("messages", model, params, normalized)
+
+
+def _count(purpose: str, field: str) -> None:
+    with _stats_lock:
+        counters = _purpose_stats.setdefault(purpose, {"hits": 0, "misses": 0, "calls": 0, "coalesced": 0})
+        counters[field] += 1
+
+
+class _Flight:
+    """
+    같은 캐시 키로 진행 중인 API 호출 하나 (single-flight).
+    처음 요청한 호출자가 task로 API를 호출하고, 같은 키의 다른 호출자는 새로 호출하지 않고
+    지금까지 도착한 텍스트 조각(chunks)과 최종 응답(task 결과)을 함께 받습니다.
+    """
+
+    def __init__(self):
+        self.chunks = []
+        self.task = None
+        self._updated = asyncio.Event()
+
+    def push(self, text: str) -> None:
+        self.chunks.append(text)
+        self.notify()
+
+    def notify(self) -> None:
+        updated, self._updated = self._updated, asyncio.Event()
+        updated.set()
+
+    async def response(self) -> dict:
+        # 기다리던 호출자가 취소되어도(클라이언트 연결 끊김) 다른 호출자를 위해 API 호출은 계속 진행
+        return await asyncio.shield(self.task)
+
+    async def follow(self) -> AsyncIterator[str]:
+        """처음부터 지금까지의 조각을 내보낸 뒤 새 조각이 도착할 때마다 이어서 내보내는 함수. 호출 오류는 그대로 전달."""
+        index = 0
+        while True:
+            if index < len(self.chunks):
+                index += 1
+                yield self.chunks[index - 1]
+            elif self.task.done():
+                self.task.result()
+                return
+            else:
+                await self._updated.wait()
+
+
+def _loop_flights() -> dict:
+    loop = asyncio.get_running_loop()
+    flights = _flights.get(loop)
+    if flights is None:
+        flights = _flights[loop] = {}
+    return flights
+
+
+def _start_flight(key: str, call) -> _Flight:
+    """call(flight) 코루틴을 task로 시작하고 끝날 때까지 key의 진행 중인 호출로 등록하는 함수."""
+    flights = _loop_flights()
+    flight = _Flight()
+    flight.task = asyncio.ensure_future(call(flight))
+    flights[key] = flight
+
+    def finished(task: asyncio.Task) -> None:
+        if flights.get(key) is flight:
+            del flights[key]
+        if not task.cancelled():
+            task.exception()  # 기다리는 호출자가 없어도 "exception was never retrieved" 경고가 나지 않도록
+        flight.notify()
+
+    flight.task.add_done_callback(finished)
+    return flight
+
+
+async def _find(purpose: str, key: str) -> Tuple[Optional[dict], Optional[_Flight]]:
+    """캐시에 저장된 응답 또는 같은 키로 진행 중인 호출을 찾는 함수. 둘 다 없으면 (None, None)."""
+    flights = _loop_flights()
+    flight = flights.get(key)
+    if flight is None and LLM_CACHE is not None:
+        cached = await asyncio.to_thread(LLM_CACHE.get, key)
+        if cached is not None:
+            _count(purpose, "hits")
+            return cached, None
+        _count(purpose, "misses")
+        # 캐시를 조회하는 동안 다른 호출자가 같은 호출을 시작했을 수 있음
+        flight = flights.get(key)
+    if flight is not None:
+        _count(purpose, "coalesced")
+        print(f"DEBUG: Joined in-flight LLM call ({purpose})")
+    return None, flight
+
+
+async def create_message(purpose: str, model: str, messages: List[dict], use_cache: bool = True,
+                         hedge: bool = False, priority: str = "interactive", **params) -> Optional[dict]:
+    """
+    캐시를 거쳐 LLM 게이트웨이(llm_client)로 Anthropic messages API를 호출하는 함수.
+
+    반환값은 {"text", "stop_reason", "cached"} 딕셔너리입니다. 캐시에 있으면 API를 호출하지 않으며,
+    개발 모드(클라이언트 없음)에서도 캐시에 있는 응답은 그대로 돌려줍니다. 캐시에 없고 클라이언트도 없으면 None을 반환합니다.
+    같은 키의 호출(stream_message 포함)이 진행 중이면 새로 호출하지 않고 그 결과를 함께 받습니다.
+    use_cache=False이면 캐시와 진행 중인 호출을 건너뛰고 새로 호출한 결과로 캐시를 갱신합니다.
+    hedge=True이면 응답이 늦을 때 중복 요청으로 꼬리 지연을 줄입니다 (llm_client.llm_call 참고).
+    priority는 게이트웨이 대기열의 우선순위 부류입니다: "interactive"(기본값) 또는 "background"(대량 작업).
+    API 오류(재시도 후에도 계속되면 LLMUnavailable)는 호출한 쪽에서 처리하도록 그대로 전달합니다 (합류한 호출자 모두에게).
+    """
+    key = llm_cache_key(model, messages, params)
+    if use_cache:
+        cached, flight = await _find(purpose, key)
+        if cached is not None:
+            print(f"DEBUG: LLM cache hit ({purpose})")
+            return {**cached, "cached": True}
+        if flight is not None:
+            return {**await flight.response(), "cached": False}
+
+    if not AI_ENABLED:
+        return None
+
+    async def call(flight: _Flight) -> dict:
+        message = await llm_call(lambda client: client.messages.create(model=model, messages=messages, **params),
+                                 model=model, tokens=estimate_message_tokens(messages), hedge=hedge,
+                                 priority=priority)
+        _count(purpose, "calls")
+        response = {"text": message.content[0].text, "stop_reason": message.stop_reason}
+        flight.push(response["text"])
+        if LLM_CACHE is not None:
+            await asyncio.to_thread(LLM_CACHE.set, key, response)
+        return response
+
+    return {**await _start_flight(key, call).response(), "cached": False}
+
+
+async def store_response(purpose: str, model: str, messages: List[dict], response: dict, **params) -> None:
+    """다른 경로(예: 배치 API)로 받은 응답을 create_message와 같은 키로 캐시에 저장하는 함수."""
+    _count(purpose, "calls")
+    if LLM_CACHE is not None:
+        key = llm_cache_key(model, messages, params)
+        await asyncio.to_thread(LLM_CACHE.set, key, {"text": response["text"], "stop_reason": response["stop_reason"]})
+
+
+async def stream_message(purpose: str, model: str, messages: List[dict], use_cache: bool = True,
+                         priority: str = "interactive", result: Optional[dict] = None,
+                         **params) -> AsyncIterator[str]:
+    """
+    create_message의 스트리밍 버전: 응답 텍스트를 도착하는 대로 조각(str) 단위로 내보내는 비동기 제너레이터.
+
+    캐시 키가 create_message와 같아서 두 함수가 서로의 응답과 진행 중인 호출을 공유합니다. 캐시에 있으면 전체 텍스트를
+    한 번에 내보내고, 같은 키의 호출이 진행 중이면 지금까지 도착한 조각부터 이어서 내보냅니다.
+    그 외에는 API 스트림을 중계하며, 호출자가 중간에 끊어도 스트림은 끝까지 받아 완료된 경우에만 전체 텍스트를 캐시에 저장합니다.
+    캐시에 없고 클라이언트도 없으면(개발 모드) 아무것도 내보내지 않습니다.
+    result 딕셔너리를 넘기면 스트림이 끝까지 전달된 뒤 create_message와 같은 {"text", "stop_reason", "cached"}가
+    기록되므로, 응답이 max_tokens에서 잘렸는지 확인할 수 있습니다 (중간에 오류가 나면 비어 있음).
+    """
+    key = llm_cache_key(model, messages, params)
+    flight = None
+    if use_cache:
+        cached, flight = await _find(purpose, key)
+        if cached is not None:
+            print(f"DEBUG: LLM cache hit ({purpose}, stream)")
+            yield cached["text"]
+            if result is not None:
+                result.update(cached, cached=True)
+            return
+
+    if flight is None:
+        if not AI_ENABLED:
+            return
+
+        async def call(flight: _Flight) -> dict:
+            async with llm_stream(model, messages, priority=priority, **params) as stream:
+                _count(purpose, "calls")
+                async for text in stream.text_stream:
+                    flight.push(text)
+                message = await stream.get_final_message()
+            response = {"text": "".join(flight.chunks), "stop_reason": message.stop_reason}
+            if LLM_CACHE is not None:
+                await asyncio.to_thread(LLM_CACHE.set, key, response)
+            return response
+
+        flight = _start_flight(key, call)
+
+    async for text in flight.follow():
+        yield text
+    if result is not None:
+        result.update(flight.task.result(), cached=False)
+
+
+def llm_cache_stats() -> dict:
+    """캐시 적중률과 크기, 용도별 적중/실패/API 호출/합류 횟수, 진행 중인 호출 수를 반환하는 함수."""
+    with _stats_lock:
+        coalesced = sum(counters["coalesced"] for counters in _purpose_stats.values())
+        by_purpose = {}
+        for purpose, counters in _purpose_stats.items():
+            lookups = counters["hits"] + counters["misses"]
+            by_purpose[purpose] = {
+                **counters,
+                "hit_rate": round(counters["hits"] / lookups, 3) if lookups else 0.0,
+            }
+    return {
+        "enabled": LLM_CACHE is not None,
+        "directory": LLM_CACHE_DIR or None,
+        **(LLM_CACHE.stats() if LLM_CACHE is not None else {}),
+        # 진행 중인 호출에 합류해 절약한 API 호출 수
+        "single_flight": {
+            "in_flight": sum(len(flights) for flights in list(_flights.values())),
+            "coalesced": coalesced,
+        },
+        "by_purpose": by_purpose,
+    }
@@ -0,0 +1,641 @@
+import os
+import time
+import random
+import asyncio
+import threading
+import weakref
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Awaitable, Callable, List, Optional
+
+import anthropic
+import httpx
+from dotenv import load_dotenv
+
+from token_budget import estimate_message_tokens
+
+load_dotenv()
+
+# LLM 게이트웨이 설정: 모든 Anthropic 호출은 이 모듈(llm_call, llm_stream)을 거칩니다.
+# 이벤트 루프마다 클라이언트 하나(= 커넥션 풀 하나)를 만들어 모든 LLM 호출이 연결을 재사용합니다.
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "120"))
+# 재시도 (지터를 준 지수 백오프, 408/409/429/5xx(501 제외)/529와 연결 오류만 재시도)
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_BACKOFF_BASE_SECONDS = float(os.getenv("LLM_BACKOFF_BASE_SECONDS", "1"))
+LLM_BACKOFF_MAX_SECONDS = float(os.getenv("LLM_BACKOFF_MAX_SECONDS", "30"))
+# 토큰 버킷 속도 제한 (계정 한도 기준, 프로세스 단위이므로 API 서버와 워커 프로세스 수로 나눠 설정, 0이면 제한 없음)
+LLM_REQUESTS_PER_MINUTE = int(os.getenv("LLM_REQUESTS_PER_MINUTE", "50"))
+LLM_INPUT_TOKENS_PER_MINUTE = int(os.getenv("LLM_INPUT_TOKENS_PER_MINUTE", "40000"))
+# 모델별 동시 호출 수 (프로세스 단위)
+LLM_MODEL_CONCURRENCY = int(os.getenv("LLM_MODEL_CONCURRENCY", "8"))
+# 우선순위 스케줄러: 속도 제한/동시 호출 자리를 기다리는 요청 중 interactive(사용자가 기다리는 해설)를 먼저 보내고,
+# background(PDF 파싱, 문제 생성, 해설 일괄 생성)에는 두 부류가 함께 기다릴 때 최소 LLM_BACKGROUND_MIN_SHARE 비율의 자리를 보장
+LLM_BACKGROUND_MIN_SHARE = float(os.getenv("LLM_BACKGROUND_MIN_SHARE", "0.2"))
+# 회로 차단기: 연속 LLM_BREAKER_FAILURES번 제공자 장애(5xx/529/연결 오류)가 나면
+# LLM_BREAKER_COOLDOWN_SECONDS 동안 호출하지 않고 바로 실패한 뒤, 한 번 시험 호출해 회복 여부를 확인
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_COOLDOWN_SECONDS = float(os.getenv("LLM_BREAKER_COOLDOWN_SECONDS", "30"))
+# 헤징(hedged request): hedge=True로 호출한 요청이 전송 후 최근 응답 시간의 LLM_HEDGE_PERCENTILE 백분위를 넘기면
+# 같은 요청을 하나 더 보내 먼저 끝난 응답을 사용 (추가 요청은 헤징 대상 호출의 LLM_HEDGE_BUDGET_PERCENT% 이내)
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+LLM_HEDGE_BUDGET_PERCENT = float(os.getenv("LLM_HEDGE_BUDGET_PERCENT", "5"))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+LLM_LATENCY_WINDOW = int(os.getenv("LLM_LATENCY_WINDOW", "200"))
+
+api_key = os.getenv("ANTHROPIC_API_KEY")
+# API 주소 재정의 (예: 로컬 스텁 서버 scripts/stub_llm_provider.py로 테스트할 때 http://127.0.0.1:9999)
+ANTHROPIC_BASE_URL = os.getenv("ANTHROPIC_BASE_URL") or None
+# 개발 모드(API 키 없음)에서는 AI 기능 비활성화
+AI_ENABLED = bool(api_key) and api_key != "sk-test-key"
+
+# httpx 커넥션 풀은 생성된 이벤트 루프에 묶이므로 루프별로 클라이언트를 보관합니다.
+# (API 서버는 루프가 하나뿐이고, 작업 워커는 run_sync 호출마다 새 루프를 씁니다.)
+_clients = weakref.WeakKeyDictionary()
+
+
+def get_async_client() -> Optional[anthropic.AsyncAnthropic]:
+    """현재 이벤트 루프의 공유 AsyncAnthropic 클라이언트를 반환하는 함수. 개발 모드에서는 None."""
+    if not AI_ENABLED:
+        return None
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        limits = httpx.Limits(max_connections=LLM_MAX_CONNECTIONS,
+                              max_keepalive_connections=LLM_MAX_CONNECTIONS)
+        client = anthropic.AsyncAnthropic(
+            api_key=api_key,
+            base_url=ANTHROPIC_BASE_URL,
+            timeout=LLM_TIMEOUT_SECONDS,
+            max_retries=0,  # 재시도는 llm_call/llm_stream이 백오프와 회로 차단기를 적용해 직접 처리
+            http_client=anthropic.DefaultAsyncHttpxClient(limits=limits, timeout=LLM_TIMEOUT_SECONDS),
+        )
+        _clients[loop] = client
+        print(f"DEBUG: Async Anthropic client initialized (max {LLM_MAX_CONNECTIONS} connections)")
+    return client
+
+
+async def close_async_client() -> None:
+    """현재 이벤트 루프의 클라이언트와 커넥션 풀을 닫는 함수 (서버 종료 시, run_sync 종료 시 호출)."""
+    scheduler = _schedulers.pop(asyncio.get_running_loop(), None)
+    if scheduler is not None:
+        scheduler.close()
+    client = _clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.close()
+
+
+def run_sync(coro):
+    """
+    동기 코드(작업 워커 프로세스, 스크립트)에서 비동기 LLM 호출을 실행하는 함수.
+    새 이벤트 루프에서 코루틴을 실행하고, 그 루프에서 만든 클라이언트는 끝날 때 닫습니다.
+    이벤트 루프 안(async 엔드포인트)에서는 사용할 수 없으므로 코루틴을 직접 await하세요.
+    """
+    async def runner():
+        try:
+            return await coro
+        finally:
+            await close_async_client()
+
+    return asyncio.run(runner())
+
+
+UNAVAILABLE_MESSAGE = "AI 서비스가 일시적으로 혼잡합니다. 잠시 후 다시 시도해 주세요."
+
+
+class LLMUnavailable(Exception):
+    """회로 차단기가 열려 있거나 재시도 후에도 제공자 오류가 계속될 때 발생하는 예외 (잠시 후 다시 시도)."""
+
+
+class TokenBucket:
+    """
+    분당 rate_per_minute만큼 채워지는 토큰 버킷 (용량 = 분당 한도).
+    여러 이벤트 루프(스레드)에서 함께 쓸 수 있으며, 누가 먼저 토큰을 가져갈지는 LLMScheduler가 정합니다.
+    """
+
+    def __init__(self, rate_per_minute: int):
+        self.capacity = float(rate_per_minute)
+        self.rate = rate_per_minute / 60.0
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """amount만큼 토큰이 찰 때까지 남은 시간(초). 지금 가져갈 수 있으면 0."""
+        with self._lock:
+            self._refill()
+            missing = min(amount, self.capacity) - self._tokens
+            return missing / self.rate if missing > 0 else 0.0
+
+    def take(self, amount: float) -> None:
+        with self._lock:
+            self._refill()
+            self._tokens -= min(amount, self.capacity)
+
+
+class CircuitBreaker:
+    """
+    연속 장애 횟수로 여닫는 회로 차단기 (closed -> open -> half_open -> closed).
+    open 동안에는 바로 LLMUnavailable을 발생시키고, 대기 시간이 지나면 시험 호출 하나만 통과시킵니다.
+    시험 호출은 before_call이 돌려준 토큰으로 구분하므로, 다른 호출이 끝나거나 취소되어도 진행 중인 시험 호출을
+    반납한 것으로 보지 않습니다 (결과를 기록할 때 before_call의 반환값을 그대로 넘기세요).
+    """
+
+    def __init__(self, failure_threshold: int, cooldown_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe = None  # 진행 중인 시험 호출의 토큰
+        self._probes = 0
+        self._lock = threading.Lock()
+
+    def before_call(self) -> Optional[int]:
+        """
+        호출을 보내도 되는지 확인하는 함수. 보낼 수 없으면 LLMUnavailable을 발생시킵니다.
+        반열림 상태의 시험 호출이면 그 호출의 토큰을, 일반 호출이면 None을 반환합니다.
+        """
+        with self._lock:
+            if self.state == "closed" or self.failure_threshold <= 0:
+                return None
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.cooldown_seconds:
+                self.state = "half_open"
+            if self.state == "half_open" and self._probe is None:
+                self._probes += 1
+                self._probe = self._probes
+                return self._probe
+            _count("fail_fast")
+        raise LLMUnavailable(UNAVAILABLE_MESSAGE)
+
+    def _end_probe(self, probe: Optional[int]) -> None:
+        if probe is not None and probe == self._probe:
+            self._probe = None
+
+    def record_success(self, probe: Optional[int] = None) -> None:
+        with self._lock:
+            if self.state != "closed":
+                print("DEBUG: LLM circuit breaker closed")
+            self.state = "closed"
+            self.failures = 0
+            self._probe = None
+
+    def record_failure(self, probe: Optional[int] = None) -> None:
+        with self._lock:
+            self.failures += 1
+            self._end_probe(probe)
+            if self.failure_threshold > 0 and (self.state == "half_open" or self.failures >= self.failure_threshold):
+                if self.state != "open":
+                    print(f"DEBUG: LLM circuit breaker opened after {self.failures} consecutive failures")
+                    _count("breaker_opened")
+                self.state = "open"
+                self.opened_at = time.monotonic()
+                # 다음 반열림 때 새 시험 호출을 보낼 수 있도록 (이전 시험 호출의 토큰은 더 이상 맞지 않음)
+                self._probe = None
+
+    def release(self, probe: Optional[int] = None) -> None:
+        """장애 여부를 판단할 수 없는 결과(예: 429, 400, 취소)로 끝난 호출을 반납하는 함수. 시험 호출일 때만 자리를 비웁니다."""
+        with self._lock:
+            self._end_probe(probe)
+
+
+_request_bucket = TokenBucket(LLM_REQUESTS_PER_MINUTE) if LLM_REQUESTS_PER_MINUTE > 0 else None
+_input_token_bucket = TokenBucket(LLM_INPUT_TOKENS_PER_MINUTE) if LLM_INPUT_TOKENS_PER_MINUTE > 0 else None
+_breaker = CircuitBreaker(LLM_BREAKER_FAILURES, LLM_BREAKER_COOLDOWN_SECONDS)
+# 이벤트 루프별 LLMScheduler
+_schedulers = weakref.WeakKeyDictionary()
+PRIORITIES = ("interactive", "background")
+# 모델별 최근 성공 호출의 응답 시간(초), 헤징 기준 계산용
+_latencies = {}
+# 우선순위 부류별 대기열 통계와 최근 대기 시간(초)
+_priority_stats = {priority: {"waiting": 0, "granted": 0, "wait_seconds": 0.0, "max_wait_seconds": 0.0}
+                   for priority in PRIORITIES}
+_priority_waits = {priority: deque(maxlen=LLM_LATENCY_WINDOW) for priority in PRIORITIES}
+
+_gateway_stats = {"calls": 0, "retries": 0, "failures": 0, "fail_fast": 0, "breaker_opened": 0,
+                  "hedge_eligible": 0, "hedges": 0, "hedge_wins": 0, "hedge_budget_denied": 0}
+_stats_lock = threading.Lock()
+
+
+def _count(field: str, amount=1) -> None:
+    # CircuitBreaker가 자기 잠금을 잡은 채로 부르므로 통계는 별도 잠금을 사용
+    with _stats_lock:
+        _gateway_stats[field] += amount
+
+
+def _retryable(error: Exception) -> bool:
+    if isinstance(error, anthropic.APIConnectionError):
+        return True
+    if isinstance(error, anthropic.APIStatusError):
+        return error.status_code in (408, 409, 429) or (error.status_code >= 500 and error.status_code != 501)
+    return False
+
+
+def _provider_failure(error: Exception) -> bool:
+    """회로 차단기에 장애로 기록할 오류인지 (429는 계정 한도 문제이므로 제외)."""
+    return _retryable(error) and getattr(error, "status_code", None) not in (408, 409, 429)
+
+
+def _backoff_seconds(attempt: int, error: Exception) -> float:
+    """전체 지터(full jitter) 지수 백오프. 제공자가 retry-after를 보내면 그보다 짧게 기다리지 않습니다."""
+    delay = random.uniform(0, min(LLM_BACKOFF_MAX_SECONDS, LLM_BACKOFF_BASE_SECONDS * (2 ** attempt)))
+    response = getattr(error, "response", None)
+    try:
+        retry_after = float(response.headers.get("retry-after")) if response is not None else None
+    except (TypeError, ValueError):
+        retry_after = None
+    if retry_after is not None:
+        delay = max(delay, min(retry_after, LLM_BACKOFF_MAX_SECONDS))
+    return delay
+
+
+def _handle_error(error: Exception, attempt: int, probe: Optional[int] = None) -> float:
+    """
+    실패한 시도를 회로 차단기에 기록하고 재시도까지 기다릴 시간을 반환하는 함수. 재시도하지 않으면 예외를 발생시킵니다.
+    probe는 그 시도가 before_call에서 받은 시험 호출 토큰입니다.
+    """
+    if _provider_failure(error):
+        _breaker.record_failure(probe)
+    else:
+        _breaker.release(probe)
+    if not _retryable(error):
+        raise error
+    if attempt >= LLM_MAX_RETRIES or _breaker.state == "open":
+        _count("failures")
+        print(f"DEBUG: LLM call failed after {attempt + 1} attempts: {error}")
+        raise LLMUnavailable(UNAVAILABLE_MESSAGE) from error
+    _count("retries")
+    delay = _backoff_seconds(attempt, error)
+    print(f"DEBUG: LLM call failed ({error.__class__.__name__}), retry {attempt + 1}/{LLM_MAX_RETRIES} in {delay:.1f}s")
+    return delay
+
+
+class LLMScheduler:
+    """
+    LLM 호출의 우선순위 대기열 (이벤트 루프마다 하나).
+
+    요청 수/입력 토큰 버킷과 모델별 동시 호출 자리(LLM_MODEL_CONCURRENCY)를 얻을 때까지 요청을 부류별 대기열에 두고,
+    자리가 나면 interactive 요청부터 보냅니다. 단, 두 부류가 함께 기다리는 동안 background 요청이
+    LLM_BACKGROUND_MIN_SHARE 비율 이상 자리를 얻도록 interactive 요청 여러 개마다 background 요청 하나를 끼워 넣습니다.
+    토큰을 기다리는 중에 더 급한 요청이 들어오면 다시 선택하므로 대기 중인 background 요청을 앞지를 수 있습니다.
+    """
+
+    def __init__(self):
+        self.queues = {priority: deque() for priority in PRIORITIES}
+        self.active = {}
+        self.background_credit = 0.0
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    async def acquire(self, priority: str, model: Optional[str], tokens: int) -> None:
+        """차례가 되어 요청 토큰과 모델 자리를 얻을 때까지 기다리는 함수. 끝나면 release(model)를 호출해야 합니다."""
+        if priority not in self.queues:
+            raise ValueError(f"unknown LLM priority: {priority}")
+        future = asyncio.get_running_loop().create_future()
+        entry = (future, model, tokens, time.monotonic())
+        self.queues[priority].append(entry)
+        _queue_stats(priority, "waiting", 1)
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._dispatch())
+        self._wakeup.set()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release(model)  # 자리를 얻은 직후 취소된 경우
+            else:
+                _queue_stats(priority, "waiting", -1)
+            raise
+
+    def close(self) -> None:
+        """대기열을 처리하는 task를 멈추는 함수 (루프를 닫기 전에 호출, 남은 task가 경고 없이 정리되도록)."""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def release(self, model: Optional[str]) -> None:
+        if model is not None:
+            self.active[model] -= 1
+        self._wakeup.set()
+
+    def _has_slot(self, model: Optional[str]) -> bool:
+        return model is None or LLM_MODEL_CONCURRENCY <= 0 or self.active.get(model, 0) < LLM_MODEL_CONCURRENCY
+
+    def _waiting(self, priority: str) -> bool:
+        return any(not entry[0].done() for entry in self.queues[priority])
+
+    def _first_ready(self, priority: str):
+        queue = self.queues[priority]
+        while queue and queue[0][0].done():
+            queue.popleft()  # 기다리다 취소된 요청
+        for entry in queue:
+            if not entry[0].done() and self._has_slot(entry[1]):
+                return entry
+        return None
+
+    def _pick(self):
+        interactive = self._first_ready("interactive")
+        background = self._first_ready("background")
+        if not self._waiting("background"):
+            self.background_credit = 0.0  # 기다리는 background 요청이 없으면 몫을 쌓아 두지 않음
+        if background is None:
+            return ("interactive", interactive) if interactive is not None else None
+        if interactive is None or self.background_credit >= 1.0:
+            return "background", background
+        return "interactive", interactive
+
+    async def _dispatch(self) -> None:
+        while True:
+            picked = self._pick()
+            if picked is None:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            priority, entry = picked
+            future, model, tokens, queued_at = entry
+            wait = 0.0
+            if _request_bucket is not None:
+                wait = max(wait, _request_bucket.wait_time(1))
+            if _input_token_bucket is not None and tokens:
+                wait = max(wait, _input_token_bucket.wait_time(tokens))
+            if wait > 0:
+                # 토큰이 찰 때까지 기다리되, 그 사이 새 요청이 들어오거나 자리가 나면 다시 선택
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            if _request_bucket is not None:
+                _request_bucket.take(1)
+            if _input_token_bucket is not None and tokens:
+                _input_token_bucket.take(tokens)
+            if model is not None:
+                self.active[model] = self.active.get(model, 0) + 1
+            self.queues[priority].remove(entry)
+            if priority == "background":
+                self.background_credit = max(0.0, self.background_credit - 1.0)
+            elif self._waiting("background"):
+                self.background_credit += LLM_BACKGROUND_MIN_SHARE / max(1e-9, 1.0 - LLM_BACKGROUND_MIN_SHARE)
+            _queue_stats(priority, "waiting", -1)
+            _record_wait(priority, time.monotonic() - queued_at)
+            future.set_result(None)
+
+
+def _scheduler() -> LLMScheduler:
+    loop = asyncio.get_running_loop()
+    scheduler = _schedulers.get(loop)
+    if scheduler is None:
+        scheduler = _schedulers[loop] = LLMScheduler()
+    return scheduler
+
+
+def _queue_stats(priority: str, field: str, amount=1) -> None:
+    with _stats_lock:
+        _priority_stats[priority][field] += amount
+
+
+def _record_wait(priority: str, seconds: float) -> None:
+    with _stats_lock:
+        counters = _priority_stats[priority]
+        counters["granted"] += 1
+        counters["wait_seconds"] += seconds
+        counters["max_wait_seconds"] = max(counters["max_wait_seconds"], seconds)
+        _priority_waits[priority].append(seconds)
+
+
+@asynccontextmanager
+async def _slot(priority: str, model: Optional[str], tokens: int) -> AsyncIterator[None]:
+    """우선순위 대기열에서 차례(요청/토큰 버킷, 모델별 동시 호출 자리)를 얻는 함수 (회로 차단기는 호출자가 먼저 확인)."""
+    scheduler = _scheduler()
+    await scheduler.acquire(priority, model, tokens)
+    try:
+        yield
+    finally:
+        scheduler.release(model)
+
+
+def _record_latency(model: str, seconds: float) -> None:
+    with _stats_lock:
+        window = _latencies.get(model)
+        if window is None:
+            window = _latencies[model] = deque(maxlen=LLM_LATENCY_WINDOW)
+        window.append(seconds)
+
+
+def latency_percentile(model: str, percentile: float) -> Optional[float]:
+    """모델의 최근 응답 시간 백분위(초). 표본이 LLM_HEDGE_MIN_SAMPLES개보다 적으면 None."""
+    with _stats_lock:
+        samples = sorted(_latencies.get(model, ()))
+    if not samples or len(samples) < LLM_HEDGE_MIN_SAMPLES:
+        return None
+    index = min(len(samples) - 1, int(round(percentile / 100 * (len(samples) - 1))))
+    return samples[index]
+
+
+def _take_hedge_budget() -> bool:
+    """헤징 예산(헤징 대상 호출 수의 LLM_HEDGE_BUDGET_PERCENT%)이 남아 있으면 하나 사용하는 함수."""
+    with _stats_lock:
+        if _gateway_stats["hedges"] + 1 > _gateway_stats["hedge_eligible"] * LLM_HEDGE_BUDGET_PERCENT / 100:
+            _gateway_stats["hedge_budget_denied"] += 1
+            return False
+        _gateway_stats["hedges"] += 1
+        return True
+
+
+async def _call_with_retries(client: anthropic.AsyncAnthropic, call: Callable[[anthropic.AsyncAnthropic], Awaitable],
+                             model: Optional[str], tokens: int, priority: str,
+                             on_send: Optional[Callable[[], None]] = None):
+    attempt = 0
+    while True:
+        probe = None
+        try:
+            probe = _breaker.before_call()
+            async with _slot(priority, model, tokens):
+                _count("calls")
+                if on_send:
+                    on_send()
+                started = time.monotonic()
+                result = await call(client)
+        except Exception as e:
+            delay = _handle_error(e, attempt, probe)
+        except BaseException:
+            _breaker.release(probe)  # 호출자가 취소된 경우 (자리를 기다리던 중, 헤징에서 진 요청 포함)
+            raise
+        else:
+            _breaker.record_success(probe)
+            if model is not None:
+                _record_latency(model, time.monotonic() - started)
+            return result
+        attempt += 1
+        await asyncio.sleep(delay)
+
+
+async def _hedged_call(client: anthropic.AsyncAnthropic, call: Callable[[anthropic.AsyncAnthropic], Awaitable],
+                       model: str, tokens: int, priority: str):
+    """
+    첫 요청이 실제로 전송된 뒤 최근 응답 시간의 백분위(기본 p95)가 지나도록 끝나지 않으면 같은 요청을 하나 더 보내고,
+    먼저 성공한 응답을 반환하는 함수. 남은 요청은 취소합니다. 표본이 부족하거나 예산이 없으면 첫 요청만 기다립니다.
+    취소된 요청은 응답 시간 표본에 전송 후 경과 시간(최소 헤징 기준 시간)을 남깁니다. 빠른 쪽 응답만 기록되면
+    백분위 기준이 점점 내려가 헤징이 갈수록 자주 일어나기 때문입니다.
+    """
+    _count("hedge_eligible")
+    threshold = latency_percentile(model, LLM_HEDGE_PERCENTILE)
+    sent_at = []
+    primary = asyncio.ensure_future(_call_with_retries(client, call, model, tokens, priority,
+                                                       on_send=lambda: sent_at.append(time.monotonic())))
+    tasks = [primary]
+    sends = [sent_at]
+    try:
+        if threshold is None:
+            return await primary
+        # 속도 제한이나 동시 호출 제한으로 대기 중인 시간은 제외하고, 전송 후 경과 시간으로 판단
+        while not primary.done():
+            elapsed = time.monotonic() - sent_at[-1] if sent_at else 0.0
+            if sent_at and elapsed >= threshold:
+                break
+            await asyncio.wait([primary], timeout=threshold - elapsed)
+        if primary.done() or not _take_hedge_budget():
+            return await primary
+
+        print(f"DEBUG: Hedging LLM call ({model}) after {threshold:.2f}s")
+        hedge_sent_at = []
+        tasks.append(asyncio.ensure_future(_call_with_retries(client, call, model, tokens, priority,
+                                                              on_send=lambda: hedge_sent_at.append(time.monotonic()))))
+        sends.append(hedge_sent_at)
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is not primary:
+                        _count("hedge_wins")
+                    return task.result()
+        # 둘 다 실패하면 첫 요청의 오류를 전달
+        return primary.result()
+    finally:
+        for task, sent in zip(tasks, sends):
+            if not task.done():
+                task.cancel()
+                if len(tasks) > 1 and sent:
+                    # 진 요청의 실제 응답 시간은 최소한 이만큼 (헤징해서 두 요청이 경쟁한 경우에만)
+                    _record_latency(model, max(time.monotonic() - sent[-1], threshold))
+
+
+async def llm_call(call: Callable[[anthropic.AsyncAnthropic], Awaitable], model: Optional[str] = None,
+                   tokens: int = 0, hedge: bool = False, priority: str = "interactive"):
+    """
+    call(client) 코루틴 함수를 게이트웨이 정책(회로 차단기, 토큰 버킷, 모델별 동시 호출 제한, 백오프 재시도)으로 실행하는 함수.
+    tokens는 입력 토큰 추정치(estimate_message_tokens), model이 없으면(배치 API 등) 동시 호출 제한을 적용하지 않습니다.
+    hedge=True이면 느린 응답에 중복 요청을 보내 꼬리 지연을 줄입니다 (사용자가 기다리는 호출에만 사용, _hedged_call 참고).
+    priority는 "interactive"(사용자가 기다리는 호출) 또는 "background"(PDF 파싱, 문제 생성 등 대량 작업, LLMScheduler 참고).
+    개발 모드(클라이언트 없음)에서는 None을 반환합니다.
+    """
+    client = get_async_client()
+    if client is None:
+        return None
+    if hedge and model is not None:
+        return await _hedged_call(client, call, model, tokens, priority)
+    return await _call_with_retries(client, call, model, tokens, priority)
+
+
+@asynccontextmanager
+async def llm_stream(model: str, messages: List[dict], priority: str = "interactive",
+                     **params) -> AsyncIterator[Optional[object]]:
+    """
+    client.messages.stream의 게이트웨이 버전 (async with로 사용, 개발 모드에서는 None).
+    스트림을 여는 요청까지만 재시도하고, 응답을 받기 시작한 뒤의 오류는 그대로 전달합니다.
+    모델별 동시 호출 자리는 스트림이 끝날 때까지 유지합니다.
+    """
+    client = get_async_client()
+    if client is None:
+        yield None
+        return
+    tokens = estimate_message_tokens(messages)
+    attempt = 0
+    while True:
+        probe = None
+        opened = False
+        try:
+            probe = _breaker.before_call()
+            async with _slot(priority, model, tokens):
+                _count("calls")
+                manager = client.messages.stream(model=model, messages=messages, **params)
+                stream = await manager.__aenter__()
+                opened = True
+                try:
+                    yield stream
+                except BaseException as e:
+                    await manager.__aexit__(type(e), e, e.__traceback__)
+                    raise
+                await manager.__aexit__(None, None, None)
+        except Exception as e:
+            if not opened:
+                delay = _handle_error(e, attempt, probe)
+            else:
+                # 응답을 받기 시작한 뒤의 오류(스트림을 읽는 쪽의 오류 포함)는 재시도하지 않고 전달
+                if _provider_failure(e):
+                    _breaker.record_failure(probe)
+                else:
+                    _breaker.release(probe)
+                raise
+        except BaseException:
+            _breaker.release(probe)  # 자리를 기다리던 중이나 스트림을 읽던 중에 취소된 경우
+            raise
+        else:
+            _breaker.record_success(probe)
+            return
+        attempt += 1
+        await asyncio.sleep(delay)
+
+
+def llm_gateway_stats() -> dict:
+    """
+    게이트웨이 호출/재시도/빠른 실패/헤징 횟수, 회로 차단기 상태, 우선순위 부류별 대기열 깊이와 대기 시간,
+    모델별 진행 중인 호출 수와 응답 시간을 반환하는 함수 (프로세스 단위).
+    """
+    active = {}
+    for scheduler in list(_schedulers.values()):
+        for model, count in list(scheduler.active.items()):
+            active[model] = active.get(model, 0) + count
+    with _stats_lock:
+        stats = dict(_gateway_stats)
+        models = list(_latencies)
+        queues = {}
+        for priority, counters in _priority_stats.items():
+            waits = sorted(_priority_waits[priority])
+            queues[priority] = {
+                "waiting": counters["waiting"],
+                "granted": counters["granted"],
+                "avg_wait_seconds": round(counters["wait_seconds"] / counters["granted"], 3) if counters["granted"] else 0.0,
+                "p95_wait_seconds": round(waits[int(round(0.95 * (len(waits) - 1)))], 3) if waits else 0.0,
+                "max_wait_seconds": round(counters["max_wait_seconds"], 3),
+            }
+    latency = {}
+    for model in models:
+        p50, p95 = latency_percentile(model, 50), latency_percentile(model, 95)
+        latency[model] = {"p50": round(p50, 3) if p50 is not None else None,
+                          "p95": round(p95, 3) if p95 is not None else None,
+                          "samples": len(_latencies[model])}
+    return {
+        **stats,
+        "breaker": {"state": _breaker.state, "consecutive_failures": _breaker.failures},
+        "queues": queues,
+        "active_by_model": active,
+        "latency_by_model": latency,
+        "limits": {
+            "requests_per_minute": LLM_REQUESTS_PER_MINUTE,
+            "input_tokens_per_minute": LLM_INPUT_TOKENS_PER_MINUTE,
+            "model_concurrency": LLM_MODEL_CONCURRENCY,
+            "background_min_share": LLM_BACKGROUND_MIN_SHARE,
+            "max_retries": LLM_MAX_RETRIES,
+            "hedge_percentile": LLM_HEDGE_PERCENTILE,
+            "hedge_budget_percent": LLM_HEDGE_BUDGET_PERCENT,
+        },
+    }
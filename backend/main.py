@@ -1,19 +1,27 @@
 # C:\cert\ai_cert_platform\backend\main.py
 
 import os
-from fastapi import FastAPI, HTTPException, Depends, status, File, UploadFile, Request
+from fastapi import FastAPI, HTTPException, Depends, status, File, Form, UploadFile, Request
 from fastapi.staticfiles import StaticFiles # StaticFiles 임포트
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from uuid import uuid4 # 고유한 파일 이름 생성을 위한 uuid 임포트
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from pydantic import BaseModel
 from passlib.context import CryptContext
-from sqlalchemy import create_engine, Column, Integer, String, Text, ForeignKey, DateTime, Boolean
+from sqlalchemy import create_engine, Column, Integer, String, Text, ForeignKey, DateTime, Boolean, Float, UniqueConstraint
 from sqlalchemy.orm import declarative_base
-from sqlalchemy.orm import sessionmaker, Session, relationship, selectinload
+from sqlalchemy.orm import sessionmaker, Session, relationship, selectinload, deferred
+from sqlalchemy.exc import IntegrityError
 from datetime import datetime, timedelta
 from typing import Optional, List
 import secrets
 import json
+import asyncio
+import hashlib
+import math
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 
 # JWT 관련 라이브러리
 import jwt
@@ -29,22 +37,20 @@ from fastapi.middleware.cors import CORSMiddleware
 
 # Anthropic 라이브러리 임포트
 from dotenv import load_dotenv
-import anthropic
 
 # OCR 처리 스크립트 임포트
-from ocr_processor import process_pdf_for_text, parse_questions_from_text
+from ocr_processor import process_pdf_for_pages, format_pages, split_formatted_text, ocr_pdf_pages
+from ocr_jobs import claimable_job_ids, mark_job_failed, run_job
+from json_stream import JSONArrayStream, parse_json_array
+from llm_cache import create_message, stream_message, llm_cache_stats
+from llm_client import AI_ENABLED, LLMUnavailable, close_async_client, llm_gateway_stats
+from token_budget import estimate_tokens, max_expected_output, output_max_tokens, split_text_evenly, truncate_to_tokens
 
 # .env 파일 로드
 load_dotenv()
 
-# Anthropic 클라이언트 초기화 (개발 모드에서는 임시로 비활성화)
-api_key = os.getenv("ANTHROPIC_API_KEY")
-print(f"DEBUG: API Key loaded: {api_key[:20] if api_key else 'None'}...")
-if api_key and api_key != "sk-test-key":
-    client = anthropic.Anthropic(api_key=api_key)
-    print("DEBUG: Anthropic client initialized successfully!")
-else:
-    client = None  # 개발 모드에서는 AI 기능 비활성화
+# Anthropic 호출은 llm_client의 공유 비동기 클라이언트(커넥션 풀)를 사용 (개발 모드에서는 비활성화)
+if not AI_ENABLED:
     print("DEBUG: AI features disabled")
 
 # 비밀번호 해싱을 위한 컨텍스트 설정
@@ -105,10 +111,29 @@ class OCRDocument(Base):
     id = Column(Integer, primary_key=True, index=True)
     filename = Column(String(255), nullable=False)
     file_path = Column(String(255), nullable=False)
-    extracted_text = Column(Text, nullable=False)
+    # 페이지 테이블(ocr_pages) 도입 이전 문서의 전체 텍스트. 새 문서는 비워두며, 조회 시 함께 로드하지 않음
+    extracted_text = deferred(Column(Text, nullable=False, default=""))
     uploaded_at = Column(DateTime, default=datetime.utcnow)
 
     questions = relationship("Question", back_populates="ocr_document", cascade="all, delete-orphan")
+    pages = relationship("OCRPage", back_populates="ocr_document", cascade="all, delete-orphan",
+                         order_by="OCRPage.page_number")
+
+# OCR 페이지 테이블 모델 (문서 텍스트를 페이지 단위로 저장)
+class OCRPage(Base):
+    __tablename__ = "ocr_pages"
+    __table_args__ = (UniqueConstraint("ocr_document_id", "page_number", name="uq_ocr_pages_document_page"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    ocr_document_id = Column(Integer, ForeignKey("ocr_documents.id", ondelete="CASCADE"), nullable=False, index=True)
+    page_number = Column(Integer, nullable=False)
+    text = Column(Text, nullable=False, default="")
+    method = Column(String(20), nullable=False)  # text_layer, ocr, none
+    confidence = Column(Float, nullable=True)  # OCR 평균 신뢰도 (0-100)
+    content_hash = Column(String(64), nullable=False)  # 페이지 텍스트의 SHA-256
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    ocr_document = relationship("OCRDocument", back_populates="pages")
 
 # 문제 테이블 모델
 class Question(Base):
@@ -125,6 +150,7 @@ class Question(Base):
     certification = relationship("Certification", back_populates="questions")
     ocr_document = relationship("OCRDocument", back_populates="questions")
     options = relationship("Option", back_populates="question", cascade="all, delete-orphan")
+    explanations = relationship("QuestionExplanation", back_populates="question", cascade="all, delete-orphan")
 
 # 보기 테이블 (객관식 문제용)
 class Option(Base):
@@ -137,6 +163,22 @@ class Option(Base):
 
     question = relationship("Question", back_populates="options")
 
+# AI 해설 저장 테이블 (문제별로 공유)
+# 해설은 문제와 보기 내용에만 의존하므로 content_hash(문제/보기 내용의 SHA-256)가 같으면 저장된 해설을 재사용하고,
+# 문제가 수정되어 해시가 바뀌면 새로 생성합니다.
+class QuestionExplanation(Base):
+    __tablename__ = "question_explanations"
+    __table_args__ = (UniqueConstraint("question_id", "content_hash", name="uq_question_explanations_question_hash"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    question_id = Column(Integer, ForeignKey("questions.id", ondelete="CASCADE"), nullable=False, index=True)
+    content_hash = Column(String(64), nullable=False)
+    explanation = Column(Text, nullable=False)
+    model = Column(String(100), nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    question = relationship("Question", back_populates="explanations")
+
 # 사용자 답변 테이블 추가
 class UserAnswer(Base):
     __tablename__ = "user_answers"
@@ -186,6 +228,47 @@ class AIGeneratedProblem(Base):
     
     user = relationship("User")
 
+# 백그라운드 처리 작업 테이블 모델 (PDF OCR/파싱 작업 상태 추적)
+# 상태 흐름: queued -> ocr -> parsing -> persisting -> done (실패 시 failed)
+# 해설 일괄 생성 작업(explain_precompute)은 queued -> explaining -> (배치 모드면 storing) -> done
+# 워커는 lease_owner/lease_expires_at 리스를 잡고 하트비트로 연장하며, 리스가 만료된 작업은 다른 워커가 회수합니다.
+JOB_STATUSES = ("queued", "ocr", "parsing", "persisting", "explaining", "storing", "done", "failed")
+
+class ProcessingJob(Base):
+    __tablename__ = "processing_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    job_type = Column(String(50), nullable=False, default="pdf_ingest")
+    status = Column(String(20), nullable=False, default="queued", index=True)
+    progress = Column(Integer, default=0)  # 0-100
+    message = Column(Text, nullable=True)
+    error = Column(Text, nullable=True)
+    filename = Column(String(255), nullable=True)
+    file_path = Column(String(255), nullable=True)
+    result = Column(Text, nullable=True)  # JSON 문자열로 처리 결과 저장
+    options = Column(Text, nullable=True)  # JSON 문자열로 작업별 처리 옵션 저장 (예: {"preprocess": true})
+    created_by = Column(Integer, ForeignKey("users.id"), nullable=True)
+    ocr_document_id = Column(Integer, ForeignKey("ocr_documents.id", ondelete="SET NULL"), nullable=True)
+    lease_owner = Column(String(100), nullable=True)  # 작업을 잡고 있는 워커 ID (호스트명:PID)
+    lease_expires_at = Column(DateTime, nullable=True, index=True)
+    heartbeat_at = Column(DateTime, nullable=True)
+    attempts = Column(Integer, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    user = relationship("User")
+    ocr_document = relationship("OCRDocument")
+
+# 작업 진행 이벤트 테이블 모델 (OCR 파이프라인이 발생시킨 이벤트를 SSE로 전달하기 위한 로그)
+class ProcessingJobEvent(Base):
+    __tablename__ = "processing_job_events"
+
+    id = Column(Integer, primary_key=True, index=True)
+    job_id = Column(Integer, ForeignKey("processing_jobs.id", ondelete="CASCADE"), nullable=False, index=True)
+    event_type = Column(String(30), nullable=False)  # status, page, parse, saved, explain, store, done, failed
+    data = Column(Text, nullable=False)  # JSON 문자열
+    created_at = Column(DateTime, default=datetime.utcnow)
+
 # 데이터베이스 초기화 함수
 def init_db():
     Base.metadata.create_all(bind=engine)
@@ -338,6 +421,88 @@ os.makedirs(UPLOAD_DIR, exist_ok=True)
 # 업로드된 PDF 정적 파일 서빙
 app.mount("/uploaded_pdfs", StaticFiles(directory=UPLOAD_DIR), name="uploaded_pdfs")
 
+# 백그라운드 작업 워커 프로세스 풀 (OCR/Claude 파싱을 API 이벤트 루프 밖에서 실행)
+# JOB_WORKERS=0이면 API 서버는 작업을 등록만 하고, 별도 머신의 ocr_worker.py가 처리합니다.
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+# JOB_WORKERS > 0이면 이 주기(초)마다 재시도 대기(queued)로 돌아왔거나 리스가 만료된 작업을 다시 풀에 넘깁니다.
+JOB_RECLAIM_SECONDS = float(os.getenv("JOB_RECLAIM_SECONDS", "15"))
+_job_executor = None
+# 작업 ID -> 풀에 넘긴 작업의 Future (아직 실행 대기/실행 중인 작업을 중복해서 넘기지 않도록)
+_submitted_jobs = {}
+
+def get_job_executor() -> ProcessPoolExecutor:
+    global _job_executor
+    if _job_executor is None:
+        _job_executor = ProcessPoolExecutor(max_workers=JOB_WORKERS)
+    return _job_executor
+
+def _reset_job_executor() -> None:
+    """풀 프로세스가 죽어(OCR 메모리 부족, tesseract 비정상 종료 등) 망가진 풀을 버리는 함수 (다음 호출 때 새로 생성)."""
+    global _job_executor
+    if _job_executor is not None:
+        _job_executor.shutdown(wait=False)
+        _job_executor = None
+
+def submit_job(db: Session, job: ProcessingJob) -> None:
+    """
+    등록한 작업을 워커 프로세스 풀에 넘기는 함수.
+    풀이 망가져 있으면(BrokenProcessPool) 새 풀을 만들어 한 번 더 넘기고, 그래도 실패하면 작업을 failed로 표시합니다.
+    """
+    try:
+        _submitted_jobs[job.id] = get_job_executor().submit(run_job, job.id)
+        return
+    except BrokenProcessPool:
+        print(f"Job worker pool is broken, recreating it for job {job.id}")
+        _reset_job_executor()
+    try:
+        _submitted_jobs[job.id] = get_job_executor().submit(run_job, job.id)
+    except Exception as e:
+        print(f"Failed to submit job {job.id}: {e}")
+        _reset_job_executor()
+        mark_job_failed(db, job, f"작업을 워커에 넘길 수 없습니다: {e}")
+
+def _reclaim_jobs() -> None:
+    """
+    재시도 대기로 돌아온 작업과 리스가 만료된 작업(풀 프로세스가 죽은 경우 등)을 다시 풀에 넘기는 함수 (스레드풀에서 실행).
+    별도 ocr_worker.py 없이 API 서버의 풀만 쓰는 배포에서도 일시적인 오류로 실패한 작업이 재시도되도록 합니다.
+    """
+    for job_id, future in list(_submitted_jobs.items()):
+        if future.done():
+            del _submitted_jobs[job_id]
+    db = SessionLocal()
+    try:
+        for job_id in claimable_job_ids(db, ProcessingJob, limit=50):
+            if job_id in _submitted_jobs:
+                continue  # 아직 풀에서 실행을 기다리는 작업
+            job = db.query(ProcessingJob).filter(ProcessingJob.id == job_id).first()
+            if job is not None:
+                print(f"Resubmitting job {job_id} (status {job.status}, attempts {job.attempts})")
+                submit_job(db, job)
+    finally:
+        db.close()
+
+async def _reclaim_jobs_loop():
+    while True:
+        await asyncio.sleep(JOB_RECLAIM_SECONDS)
+        try:
+            await run_in_threadpool(_reclaim_jobs)
+        except Exception as e:
+            print(f"Job reclaim failed: {e}")
+
+@app.on_event("startup")
+async def start_job_reclaimer():
+    if JOB_WORKERS > 0 and JOB_RECLAIM_SECONDS > 0:
+        app.state.job_reclaimer = asyncio.create_task(_reclaim_jobs_loop())
+
+@app.on_event("shutdown")
+def shutdown_job_executor():
+    if _job_executor is not None:
+        _job_executor.shutdown(wait=False)
+
+@app.on_event("shutdown")
+async def shutdown_llm_client():
+    await close_async_client()
+
 # 유저 등록 요청 모델
 class UserRegister(BaseModel):
     username: str
@@ -421,6 +586,7 @@ class ExplainResponse(BaseModel):
     question_id: int
     question_text: str
     explanation: str
+    source: Optional[str] = None  # stored(저장된 해설), generated, dev(개발 모드 안내), error
 
 # 문제 제출 요청 모델
 class SubmitAnswerRequest(BaseModel):
@@ -433,6 +599,38 @@ class SubmitAnswerResponse(BaseModel):
     message: str
     correct_option_id: Optional[int] = None
 
+# 백그라운드 작업 응답 모델
+class JobResponse(BaseModel):
+    id: int
+    job_type: str
+    status: str
+    progress: int = 0
+    message: Optional[str] = None
+    error: Optional[str] = None
+    filename: Optional[str] = None
+    ocr_document_id: Optional[int] = None
+    result: Optional[dict] = None
+    worker: Optional[str] = None
+    attempts: int = 0
+    created_at: datetime
+    updated_at: datetime
+
+# OCR 페이지 응답 모델
+class OCRPageSummaryResponse(BaseModel):
+    page_number: int
+    method: str
+    confidence: Optional[float] = None
+    content_hash: str
+    text_length: int = 0
+
+class OCRPageResponse(BaseModel):
+    document_id: int
+    page_number: int
+    method: str
+    confidence: Optional[float] = None
+    content_hash: str
+    text: str
+
 # OCR 문서 응답 모델
 class OCRDocumentResponse(BaseModel):
     id: int
@@ -730,37 +928,18 @@ async def get_questions(
     questions = db.query(Question).options(selectinload(Question.options)).offset(skip).limit(limit).all()
     return questions
 
-# AI 문제 해설 생성
-@app.post("/explain/{question_id}", response_model=ExplainResponse)
-async def explain_question(
-    question_id: int,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
-):
-    # 문제 조회
-    question = db.query(Question).filter(Question.id == question_id).first()
-    if not question:
-        raise HTTPException(status_code=404, detail="문제를 찾을 수 없습니다.")
-    
-    # 개발 모드에서는 미리 정의된 해설 반환
-    if not client:
-        explanation = f"""이 문제는 {question.question_text[:50]}... 에 대한 문제입니다.
-        
-핵심 포인트:
-1. 문제를 꼼꼼히 읽고 핵심 키워드를 파악하세요.
-2. 각 선택지를 신중히 검토하여 정답을 찾으세요.
-3. 관련 개념을 복습하면 도움이 됩니다.
+# 해설 생성 호출 설정 (/explain과 /explain/{question_id}/stream이 같은 캐시 키를 쓰도록 공유)
+EXPLAIN_MODEL = "claude-3-haiku-20240307"
+EXPLAIN_PARAMS = {"max_tokens": 1000, "temperature": 0.3}  # 낮은 온도로 일관된 해설 생성
+# 사용자가 기다리는 /explain 호출에 헤징 사용 (응답이 최근 p95보다 늦으면 중복 요청, LLM_HEDGE_* 참고)
+EXPLAIN_HEDGE = os.getenv("EXPLAIN_HEDGE", "false").lower() == "true"
 
-(개발 모드: AI 해설 기능은 Anthropic API 키가 설정되면 사용 가능합니다.)"""
-    else:
-        # Claude API를 사용하여 해설 생성
-        try:
-            # 문제와 선택지 정보 수집
-            options = db.query(Option).filter(Option.question_id == question_id).all()
-            options_text = "\n".join([f"{i+1}. {opt.option_text}" for i, opt in enumerate(options)])
-            correct_option = next((opt for opt in options if opt.is_correct), None)
-            
-            prompt = f"""다음 문제에 대한 구조화된 해설을 마크다운 형식으로 작성해주세요:
+def build_explain_prompt(question: Question, options: List[Option]) -> str:
+    """문제와 선택지로 구조화된 마크다운 해설 요청 프롬프트를 만드는 함수."""
+    options_text = "\n".join([f"{i+1}. {opt.option_text}" for i, opt in enumerate(options)])
+    correct_option = next((opt for opt in options if opt.is_correct), None)
+    
+    return f"""다음 문제에 대한 구조화된 해설을 마크다운 형식으로 작성해주세요:
 
 문제: {question.question_text}
 
@@ -807,23 +986,193 @@ async def explain_question(
 
 마크다운 문법을 활용하여 가독성 높게 작성해주세요."""
 
-            response = client.messages.create(
-                model="claude-3-haiku-20240307",
-                max_tokens=1000,
-                temperature=0.3,  # 낮은 온도로 일관된 해설 생성
+def dev_mode_explanation(question: Question) -> str:
+    """개발 모드(API 키 없음)에서 캐시에 해설이 없을 때 보여줄 안내용 해설."""
+    return f"""이 문제는 {question.question_text[:50]}... 에 대한 문제입니다.
+        
+핵심 포인트:
+1. 문제를 꼼꼼히 읽고 핵심 키워드를 파악하세요.
+2. 각 선택지를 신중히 검토하여 정답을 찾으세요.
+3. 관련 개념을 복습하면 도움이 됩니다.
+
+(개발 모드: AI 해설 기능은 Anthropic API 키가 설정되면 사용 가능합니다.)"""
+
+def _load_explain_question(db: Session, question_id: int):
+    question = db.query(Question).filter(Question.id == question_id).first()
+    if not question:
+        raise HTTPException(status_code=404, detail="문제를 찾을 수 없습니다.")
+    options = db.query(Option).filter(Option.question_id == question_id).order_by(Option.id).all()
+    return question, options
+
+def question_content_hash(question: Question, options: List[Option]) -> str:
+    """해설이 의존하는 내용(문제, 보기, 정답 표시)의 SHA-256. 문제가 수정되면 값이 바뀌어 저장된 해설이 무효화됩니다."""
+    payload = json.dumps({
+        "question": question.question_text,
+        "options": [[opt.option_text, bool(opt.is_correct)] for opt in options],
+    }, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def get_stored_explanation(db: Session, question_id: int, content_hash: str) -> Optional[QuestionExplanation]:
+    return db.query(QuestionExplanation).filter(
+        QuestionExplanation.question_id == question_id,
+        QuestionExplanation.content_hash == content_hash
+    ).first()
+
+def store_explanation(db: Session, question_id: int, content_hash: str, explanation: str) -> None:
+    """생성된 해설을 저장하는 함수. 수정 전 내용(다른 해시)으로 만든 해설은 함께 삭제합니다."""
+    try:
+        db.query(QuestionExplanation).filter(
+            QuestionExplanation.question_id == question_id,
+            QuestionExplanation.content_hash != content_hash
+        ).delete(synchronize_session=False)
+        row = get_stored_explanation(db, question_id, content_hash)
+        if row is None:
+            row = QuestionExplanation(question_id=question_id, content_hash=content_hash)
+            db.add(row)
+        row.explanation = explanation
+        row.model = EXPLAIN_MODEL
+        row.created_at = datetime.utcnow()
+        db.commit()
+    except IntegrityError:
+        # 같은 문제의 해설을 다른 요청이 먼저 저장한 경우
+        db.rollback()
+
+def _store_explanation_in_new_session(question_id: int, content_hash: str, explanation: str) -> None:
+    db = SessionLocal()
+    try:
+        store_explanation(db, question_id, content_hash, explanation)
+    finally:
+        db.close()
+
+async def generate_explanation(db: Session, question: Question, options: List[Option],
+                               refresh: bool = False) -> ExplainResponse:
+    """
+    저장된 해설을 반환하거나, 없으면 Claude로 생성해 저장하는 함수.
+    refresh=True(관리자 강제 갱신)이면 저장된 해설과 LLM 응답 캐시를 모두 건너뛰고 새로 생성합니다.
+    """
+    content_hash = question_content_hash(question, options)
+    if not refresh:
+        stored = get_stored_explanation(db, question.id, content_hash)
+        if stored is not None:
+            return ExplainResponse(question_id=question.id, question_text=question.question_text,
+                                   explanation=stored.explanation, source="stored")
+
+    prompt = build_explain_prompt(question, options)
+    question_id, question_text = question.id, question.question_text
+    # LLM 응답을 기다리는 동안 DB 커넥션을 붙잡지 않도록 세션을 반환
+    # (같은 문제에 동시에 몰린 요청들이 커넥션 풀을 소진해 이벤트 루프가 멈추지 않게, 저장할 때 다시 연결)
+    db.close()
+
+    # Claude API를 사용하여 해설 생성 (같은 프롬프트의 해설은 LLM 응답 캐시에서 재사용,
+    # 같은 프롬프트로 진행 중인 호출이 있으면 그 결과를 함께 받음)
+    try:
+        response = await create_message(
+            "explain",
+            model=EXPLAIN_MODEL,
+            messages=[
+                {"role": "user", "content": prompt}
+            ],
+            use_cache=not refresh,
+            hedge=EXPLAIN_HEDGE,
+            **EXPLAIN_PARAMS
+        )
+    except LLMUnavailable as e:
+        # 제공자 장애/한도 초과가 재시도 후에도 계속되거나 회로 차단기가 열린 경우
+        return ExplainResponse(question_id=question_id, question_text=question_text,
+                               explanation=str(e), source="error")
+    except Exception as e:
+        return ExplainResponse(question_id=question_id, question_text=question_text,
+                               explanation=f"AI 해설 생성 중 오류가 발생했습니다: {str(e)}", source="error")
+
+    if response is None:
+        # 개발 모드에서 캐시에 없으면 미리 정의된 해설 반환 (저장하지 않음)
+        return ExplainResponse(question_id=question_id, question_text=question_text,
+                               explanation=dev_mode_explanation(question), source="dev")
+
+    store_explanation(db, question_id, content_hash, response["text"])
+    return ExplainResponse(question_id=question_id, question_text=question_text,
+                           explanation=response["text"], source="generated")
+
+# AI 문제 해설 생성 (문제별로 저장된 해설이 있으면 바로 반환)
+@app.post("/explain/{question_id}", response_model=ExplainResponse)
+async def explain_question(
+    question_id: int,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    # 문제와 선택지 조회
+    question, options = _load_explain_question(db, question_id)
+    return await generate_explanation(db, question, options)
+
+# AI 문제 해설 스트리밍 (Server-Sent Events)
+# 생성되는 해설 텍스트를 delta 이벤트로 즉시 전달하고, 완료되면 전체 해설을 done 이벤트로 보냅니다.
+# 저장된 해설이 있으면 한 번에 보내고, 새로 생성한 해설은 스트림이 끝까지 완료된 경우에만 저장합니다.
+@app.post("/explain/{question_id}/stream")
+async def stream_explain_question(
+    question_id: int,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    question, options = _load_explain_question(db, question_id)
+    content_hash = question_content_hash(question, options)
+    stored = get_stored_explanation(db, question_id, content_hash)
+    stored_text = stored.explanation if stored is not None else None
+    prompt = build_explain_prompt(question, options)
+    question_text = question.question_text
+    dev_text = dev_mode_explanation(question)
+    # 스트리밍하는 동안 DB 커넥션을 붙잡지 않도록 세션 반환 (완료 후 저장은 새 세션에서)
+    db.close()
+
+    def sse(event_type: str, payload: dict) -> str:
+        return f"event: {event_type}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+    def done(explanation: str, source: str) -> str:
+        return sse("done", {
+            "question_id": question_id,
+            "question_text": question_text,
+            "explanation": explanation,
+            "source": source
+        })
+
+    async def event_stream():
+        if stored_text is not None:
+            yield sse("delta", {"text": stored_text})
+            yield done(stored_text, "stored")
+            return
+
+        chunks = []
+        try:
+            async for text in stream_message(
+                "explain",
+                model=EXPLAIN_MODEL,
                 messages=[
                     {"role": "user", "content": prompt}
-                ]
-            )
-            
-            explanation = response.content[0].text
+                ],
+                **EXPLAIN_PARAMS
+            ):
+                chunks.append(text)
+                yield sse("delta", {"text": text})
+        except LLMUnavailable as e:
+            yield sse("error", {"detail": str(e)})
+            return
         except Exception as e:
-            explanation = f"AI 해설 생성 중 오류가 발생했습니다: {str(e)}"
-    
-    return ExplainResponse(
-        question_id=question_id,
-        question_text=question.question_text,
-        explanation=explanation
+            yield sse("error", {"detail": f"AI 해설 생성 중 오류가 발생했습니다: {str(e)}"})
+            return
+
+        if not chunks:
+            # 개발 모드에서 캐시에 없으면 미리 정의된 해설을 한 번에 전송 (저장하지 않음)
+            yield sse("delta", {"text": dev_text})
+            yield done(dev_text, "dev")
+            return
+
+        explanation = "".join(chunks)
+        await run_in_threadpool(_store_explanation_in_new_session, question_id, content_hash, explanation)
+        yield done(explanation, "generated")
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
     )
 
 # 사용자 답변 제출
@@ -890,10 +1239,113 @@ async def submit_answer(
         correct_option_id=correct_option.id if correct_option else None
     )
 
+# 추출된 페이지들을 ocr_pages 테이블에 저장 (기존 페이지는 교체, 커밋은 호출자가 수행)
+def save_ocr_pages(db: Session, ocr_document_id: int, pages: list) -> None:
+    existing = {
+        page.page_number: page
+        for page in db.query(OCRPage).filter(OCRPage.ocr_document_id == ocr_document_id).all()
+    }
+    for page in pages:
+        text = page.get("text") or ""
+        row = existing.get(page["page"])
+        if row is None:
+            row = OCRPage(ocr_document_id=ocr_document_id, page_number=page["page"])
+            db.add(row)
+        row.text = text
+        row.method = page["method"] if text.strip() else "none"
+        row.confidence = page.get("confidence")
+        row.content_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+# 문서의 페이지 목록을 {"page", "text", "method", "confidence"} 형태로 조회
+# 페이지 테이블 이전에 저장된 문서는 extracted_text로 대신함
+def get_document_pages(db: Session, document: OCRDocument) -> list:
+    rows = db.query(OCRPage).filter(
+        OCRPage.ocr_document_id == document.id
+    ).order_by(OCRPage.page_number).all()
+    if rows:
+        return [
+            {"page": row.page_number, "text": row.text, "method": row.method, "confidence": row.confidence}
+            for row in rows
+        ]
+    return split_formatted_text(document.extracted_text or "")
+
+# 파싱된 문제들을 데이터베이스에 저장 (커밋은 호출자가 수행)
+def _add_parsed_options(db: Session, question: Question, options_list: list) -> None:
+    print(f"DEBUG: Options for question {question.id}: {options_list}")
+    for j, option_data in enumerate(options_list):
+        print(f"DEBUG: Processing option {j+1}: {option_data}")
+        
+        # 옵션 데이터 구조 확인 및 안전한 접근
+        if isinstance(option_data, dict):
+            option_text = option_data.get('option_text', '')
+            is_correct = option_data.get('is_correct', False)
+        else:
+            # 만약 option_data가 문자열이라면
+            option_text = str(option_data) if option_data else ''
+            is_correct = False
+        
+        print(f"DEBUG: Creating option with text='{option_text}', correct={is_correct}")
+        
+        option = Option(
+            question_id=question.id,
+            option_text=option_text,
+            is_correct=is_correct
+        )
+        db.add(option)
+
+def save_parsed_question(db: Session, ocr_document_id: int, q_data: dict) -> Question:
+    """파싱된 문제 하나와 보기를 세션에 추가하는 함수 (커밋은 호출자가 수행)."""
+    print(f"DEBUG: Question has {len(q_data.get('options', []))} options")
+    # 문제 생성
+    question = Question(
+        ocr_document_id=ocr_document_id,
+        question_text=q_data['question_text'],
+        question_type='multiple_choice'
+    )
+    db.add(question)
+    db.flush()  # ID를 얻기 위해 flush
+    
+    # 선택지 생성
+    _add_parsed_options(db, question, q_data.get('options', []))
+    return question
+
+def update_parsed_question(db: Session, question: Question, q_data: dict) -> None:
+    """이미 저장한 문제를 같은 문제의 더 완전한 파싱 결과(보기가 더 많은 쪽)로 바꾸는 함수 (커밋은 호출자가 수행)."""
+    question.question_text = q_data['question_text']
+    for option in list(question.options):
+        db.delete(option)
+    db.flush()
+    _add_parsed_options(db, question, q_data.get('options', []))
+
+def job_to_response(job: ProcessingJob) -> JobResponse:
+    result = None
+    if job.result:
+        try:
+            result = json.loads(job.result)
+        except ValueError:
+            result = None
+    return JobResponse(
+        id=job.id,
+        job_type=job.job_type,
+        status=job.status,
+        progress=job.progress or 0,
+        message=job.message,
+        error=job.error,
+        filename=job.filename,
+        ocr_document_id=job.ocr_document_id,
+        result=result,
+        worker=job.lease_owner,
+        attempts=job.attempts or 0,
+        created_at=job.created_at,
+        updated_at=job.updated_at
+    )
+
 # PDF 업로드 및 OCR 처리 (관리자 전용)
-@app.post("/admin/upload-pdf-for-ocr")
+# OCR과 문제 파싱은 워커 프로세스에서 실행되며, 응답으로 받은 job_id로 진행 상황을 조회합니다.
+@app.post("/admin/upload-pdf-for-ocr", status_code=status.HTTP_202_ACCEPTED)
 async def upload_pdf_for_ocr(
     file: UploadFile = File(...),
+    preprocess: Optional[bool] = Form(None),  # 스캔본 이미지 전처리 여부 (미지정 시 OCR_PREPROCESS 설정)
     current_user: User = Depends(get_current_admin_user),
     db: Session = Depends(get_db)
 ):
@@ -910,98 +1362,111 @@ async def upload_pdf_for_ocr(
     with open(file_path, "wb") as f:
         f.write(contents)
     
+    # 작업 등록 후 워커 프로세스에 위임
+    job = ProcessingJob(
+        job_type="pdf_ingest",
+        status="queued",
+        filename=file.filename,
+        file_path=file_path,
+        created_by=current_user.id,
+        options=json.dumps({"preprocess": preprocess}) if preprocess is not None else None,
+        message="처리 대기 중입니다."
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    
+    if JOB_WORKERS > 0:
+        submit_job(db, job)
+    
+    return {
+        "message": "PDF 업로드가 완료되었습니다. OCR 처리가 백그라운드에서 진행됩니다.",
+        "job_id": job.id,
+        "filename": file.filename,
+        "status": job.status
+    }
+
+# 작업 진행 이벤트 스트림 설정
+JOB_EVENT_POLL_SECONDS = float(os.getenv("JOB_EVENT_POLL_SECONDS", "0.5"))
+JOB_EVENT_KEEPALIVE_SECONDS = 15
+
+def _fetch_job_events(job_id: int, after_id: int):
+    """after_id 이후의 작업 이벤트와 현재 작업 상태를 조회 (스레드풀에서 실행)"""
+    db = SessionLocal()
     try:
-        # OCR 처리
-        print(f"Starting OCR for file: {file_path}")
-        extracted_text = process_pdf_for_text(file_path)
-        
-        if not extracted_text.strip():
-            raise HTTPException(status_code=400, detail="PDF에서 텍스트를 추출할 수 없습니다.")
-        
-        # OCR 문서 저장
-        ocr_doc = OCRDocument(
-            filename=file.filename,
-            file_path=file_path,
-            extracted_text=extracted_text
-        )
-        db.add(ocr_doc)
-        db.commit()
-        db.refresh(ocr_doc)
-        
-        # AI를 사용한 문제 파싱
-        print(f"Parsing questions from extracted text...")
-        questions_data = parse_questions_from_text(extracted_text)
-        
-        if not questions_data:
-            return {
-                "message": "OCR은 성공했지만 문제를 파싱할 수 없습니다.",
-                "document_id": ocr_doc.id,
-                "extracted_text_preview": extracted_text[:500] + "...",
-                "questions_count": 0
-            }
-        
-        # 파싱된 문제들을 데이터베이스에 저장
-        saved_questions = 0
-        print(f"DEBUG: Parsed {len(questions_data)} questions from Claude")
-        for i, q_data in enumerate(questions_data):
-            try:
-                print(f"DEBUG: Processing question {i+1}: {q_data}")
-                print(f"DEBUG: Question has {len(q_data.get('options', []))} options")
-                # 문제 생성
-                question = Question(
-                    ocr_document_id=ocr_doc.id,
-                    question_text=q_data['question_text'],
-                    question_type='multiple_choice'
-                )
-                db.add(question)
-                db.flush()  # ID를 얻기 위해 flush
-                
-                # 선택지 생성
-                options_list = q_data.get('options', [])
-                print(f"DEBUG: Options for question {i+1}: {options_list}")
-                
-                for j, option_data in enumerate(options_list):
-                    print(f"DEBUG: Processing option {j+1}: {option_data}")
-                    
-                    # 옵션 데이터 구조 확인 및 안전한 접근
-                    if isinstance(option_data, dict):
-                        option_text = option_data.get('option_text', '')
-                        is_correct = option_data.get('is_correct', False)
-                    else:
-                        # 만약 option_data가 문자열이라면
-                        option_text = str(option_data) if option_data else ''
-                        is_correct = False
-                    
-                    print(f"DEBUG: Creating option with text='{option_text}', correct={is_correct}")
-                    
-                    option = Option(
-                        question_id=question.id,
-                        option_text=option_text,
-                        is_correct=is_correct
-                    )
-                    db.add(option)
-                
-                saved_questions += 1
-            except Exception as e:
-                print(f"Error saving question: {e}")
-                continue
-        
-        db.commit()
-        
-        return {
-            "message": "PDF 업로드 및 OCR 처리가 완료되었습니다.",
-            "document_id": ocr_doc.id,
-            "filename": file.filename,
-            "questions_parsed": len(questions_data),
-            "questions_saved": saved_questions,
-            "extracted_text_preview": extracted_text[:500] + "..."
-        }
-        
-    except Exception as e:
-        # 에러 발생 시 업로드된 파일 삭제
-        if os.path.exists(file_path):
-            os.remove(file_path)
-        raise HTTPException(status_code=500, detail=f"OCR 처리 중 오류가 발생했습니다: {str(e)}")
+        # 상태 변경과 이벤트는 같은 트랜잭션으로 커밋되므로, 작업을 먼저 읽으면 그 상태의 이벤트는 반드시 보임
+        job = db.query(ProcessingJob).filter(ProcessingJob.id == job_id).first()
+        events = db.query(ProcessingJobEvent).filter(
+            ProcessingJobEvent.job_id == job_id,
+            ProcessingJobEvent.id > after_id
+        ).order_by(ProcessingJobEvent.id).limit(200).all()
+        return [(e.id, e.event_type, e.data) for e in events], job_to_response(job) if job else None
+    finally:
+        db.close()
+
+# 백그라운드 작업 진행 상황 스트림 (Server-Sent Events)
+# 페이지별 OCR 완료, 파싱 진행, 저장된 문제 수가 발생하는 즉시 전달되며 done/failed 이벤트로 종료됩니다.
+@app.get("/jobs/{job_id}/events")
+async def stream_job_events(
+    job_id: int,
+    request: Request,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    job = db.query(ProcessingJob).filter(ProcessingJob.id == job_id).first()
+    if not job or (not current_user.is_admin and job.created_by != current_user.id):
+        raise HTTPException(status_code=404, detail="작업을 찾을 수 없습니다.")
+    
+    # 재연결 시 브라우저가 보내는 Last-Event-ID 이후부터 이어서 전송
+    try:
+        last_event_id = int(request.headers.get("last-event-id", "0"))
+    except ValueError:
+        last_event_id = 0
+    
+    async def event_stream():
+        after_id = last_event_id
+        idle_seconds = 0.0
+        while not await request.is_disconnected():
+            events, job_state = await run_in_threadpool(_fetch_job_events, job_id, after_id)
+            for event_id, event_type, data in events:
+                after_id = event_id
+                yield f"id: {event_id}\nevent: {event_type}\ndata: {data}\n\n"
+                if event_type in ("done", "failed"):
+                    return
+            
+            if not events:
+                if job_state is None:
+                    return
+                if job_state.status in ("done", "failed"):
+                    # 이벤트 로그 없이 끝난 작업은 현재 상태로 종료 이벤트 전송
+                    yield f"event: {job_state.status}\ndata: {job_state.model_dump_json()}\n\n"
+                    return
+                idle_seconds += JOB_EVENT_POLL_SECONDS
+                if idle_seconds >= JOB_EVENT_KEEPALIVE_SECONDS:
+                    idle_seconds = 0.0
+                    yield ": keep-alive\n\n"
+            else:
+                idle_seconds = 0.0
+            await asyncio.sleep(JOB_EVENT_POLL_SECONDS)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# 백그라운드 작업 상태 조회
+@app.get("/jobs/{job_id}", response_model=JobResponse)
+async def get_job(
+    job_id: int,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    job = db.query(ProcessingJob).filter(ProcessingJob.id == job_id).first()
+    if not job or (not current_user.is_admin and job.created_by != current_user.id):
+        raise HTTPException(status_code=404, detail="작업을 찾을 수 없습니다.")
+    
+    return job_to_response(job)
 
 # OCR 문서 목록 조회
 @app.get("/ocr-documents", response_model=List[OCRDocumentResponse])
@@ -1063,6 +1528,84 @@ async def get_ocr_document(
         "question_count": question_count
     }
 
+# OCR 문서의 페이지 목록 조회 (텍스트 제외)
+@app.get("/ocr-documents/{document_id}/pages", response_model=List[OCRPageSummaryResponse])
+async def get_ocr_document_pages(
+    document_id: int,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    document = db.query(OCRDocument).filter(OCRDocument.id == document_id).first()
+    if not document:
+        raise HTTPException(status_code=404, detail="문서를 찾을 수 없습니다.")
+    
+    from sqlalchemy import func
+    rows = db.query(
+        OCRPage.page_number, OCRPage.method, OCRPage.confidence, OCRPage.content_hash,
+        func.length(OCRPage.text)
+    ).filter(OCRPage.ocr_document_id == document_id).order_by(OCRPage.page_number).all()
+    
+    return [
+        OCRPageSummaryResponse(
+            page_number=page_number,
+            method=method,
+            confidence=confidence,
+            content_hash=content_hash,
+            text_length=text_length or 0
+        )
+        for page_number, method, confidence, content_hash, text_length in rows
+    ]
+
+# OCR 문서의 특정 페이지 텍스트 조회
+@app.get("/ocr-documents/{document_id}/pages/{page_number}", response_model=OCRPageResponse)
+async def get_ocr_document_page(
+    document_id: int,
+    page_number: int,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    page = db.query(OCRPage).filter(
+        OCRPage.ocr_document_id == document_id,
+        OCRPage.page_number == page_number
+    ).first()
+    if not page:
+        raise HTTPException(status_code=404, detail="페이지를 찾을 수 없습니다.")
+    
+    return OCRPageResponse(
+        document_id=document_id,
+        page_number=page.page_number,
+        method=page.method,
+        confidence=page.confidence,
+        content_hash=page.content_hash,
+        text=page.text
+    )
+
+# OCR 문서의 특정 페이지만 다시 OCR (관리자 전용)
+@app.post("/admin/ocr-documents/{document_id}/pages/{page_number}/reprocess", response_model=OCRPageResponse)
+async def reprocess_ocr_document_page(
+    document_id: int,
+    page_number: int,
+    preprocess: Optional[bool] = None,  # 스캔본 이미지 전처리 여부 (미지정 시 OCR_PREPROCESS 설정)
+    current_user: User = Depends(get_current_admin_user),
+    db: Session = Depends(get_db)
+):
+    document = db.query(OCRDocument).filter(OCRDocument.id == document_id).first()
+    if not document:
+        raise HTTPException(status_code=404, detail="문서를 찾을 수 없습니다.")
+    
+    try:
+        pages = await run_in_threadpool(ocr_pdf_pages, document.file_path, max_workers=1,
+                                        page_numbers=[page_number], preprocess=preprocess)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"페이지 OCR 실패: {str(e)}")
+    if not pages:
+        raise HTTPException(status_code=404, detail="페이지를 찾을 수 없습니다.")
+    
+    save_ocr_pages(db, document_id, pages)
+    db.commit()
+    
+    return await get_ocr_document_page(document_id, page_number, current_user, db)
+
 # OCR 문서 삭제 (관리자 전용)
 @app.delete("/ocr-documents/{document_id}")
 async def delete_ocr_document(
@@ -1085,6 +1628,72 @@ async def delete_ocr_document(
     
     return {"message": "문서가 성공적으로 삭제되었습니다."}
 
+# 관리자 전용: 문서의 모든 문제 해설 일괄 생성 (배치 API 사용, 진행 상황은 /jobs/{job_id}/events로 확인)
+@app.post("/admin/ocr-documents/{document_id}/explanations/precompute")
+async def admin_precompute_explanations(
+    document_id: int,
+    refresh: bool = False,
+    current_user: User = Depends(get_current_admin_user),
+    db: Session = Depends(get_db)
+):
+    document = db.query(OCRDocument).filter(OCRDocument.id == document_id).first()
+    if not document:
+        raise HTTPException(status_code=404, detail="문서를 찾을 수 없습니다.")
+    if not AI_ENABLED:
+        raise HTTPException(status_code=503, detail="AI 서비스를 사용할 수 없습니다.")
+    
+    job = ProcessingJob(
+        job_type="explain_precompute",
+        status="queued",
+        filename=document.filename,
+        created_by=current_user.id,
+        ocr_document_id=document.id,
+        options=json.dumps({"refresh": refresh}),
+        message="해설 생성 대기 중입니다."
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    
+    if JOB_WORKERS > 0:
+        submit_job(db, job)
+    
+    return {
+        "message": "해설 일괄 생성 작업이 등록되었습니다.",
+        "job_id": job.id,
+        "document_id": document.id,
+        "status": job.status
+    }
+
+# 관리자 전용: 문제 해설 강제 재생성 (저장된 해설과 LLM 응답 캐시를 무시하고 새로 생성해 교체)
+@app.post("/admin/questions/{question_id}/explanation/refresh", response_model=ExplainResponse)
+async def admin_refresh_explanation(
+    question_id: int,
+    current_user: User = Depends(get_current_admin_user),
+    db: Session = Depends(get_db)
+):
+    question, options = _load_explain_question(db, question_id)
+    result = await generate_explanation(db, question, options, refresh=True)
+    if result.source == "dev":
+        raise HTTPException(status_code=503, detail="AI 서비스를 사용할 수 없습니다.")
+    if result.source == "error":
+        raise HTTPException(status_code=502, detail=result.explanation)
+    return result
+
+# 관리자 전용: LLM 응답 캐시 적중률 조회 (적중/실패 횟수는 이 API 서버 프로세스 기준)
+@app.get("/admin/llm-cache/stats")
+async def get_llm_cache_stats(
+    current_user: User = Depends(get_current_admin_user)
+):
+    return llm_cache_stats()
+
+# 관리자 전용: LLM 게이트웨이 상태 조회 (회로 차단기, 재시도/빠른 실패 횟수, 속도 제한 대기, 이 API 서버 프로세스 기준)
+@app.get("/admin/llm-gateway/stats")
+async def get_llm_gateway_stats(
+    current_user: User = Depends(get_current_admin_user)
+):
+    return llm_gateway_stats()
+
 # 관리자 전용: 전체 사용자 목록 조회
 @app.get("/admin/users", response_model=List[UserListResponse])
 async def get_all_users(
@@ -1316,13 +1925,15 @@ async def extract_text(
     
     try:
         # OCR 처리를 통해 텍스트 추출
-        extracted_text = process_pdf_for_text(ocr_doc.file_path)
+        ocr_stats = {}
+        pages = await run_in_threadpool(process_pdf_for_pages, ocr_doc.file_path, stats=ocr_stats)
         
-        # 데이터베이스 업데이트
-        ocr_doc.extracted_text = extracted_text
+        # 데이터베이스 업데이트 (페이지 단위 저장)
+        save_ocr_pages(db, ocr_doc.id, pages)
         db.commit()
+        extracted_text = format_pages(pages)
         
-        return {"content": extracted_text, "length": len(extracted_text)}
+        return {"content": extracted_text, "length": len(extracted_text), "ocr_stats": ocr_stats}
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"텍스트 추출 실패: {str(e)}")
@@ -1334,66 +1945,140 @@ async def generate_problems(
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """AI를 사용하여 문제 생성"""
-    if not client:
-        raise HTTPException(status_code=503, detail="AI 서비스를 사용할 수 없습니다.")
-    
+    """
+    AI를 사용하여 문제 생성.
+    응답은 스트리밍으로 받아 문제 객체가 닫히는 즉시 저장하고 커밋하므로(JSONArrayStream), 응답이 max_tokens에서
+    잘리거나 일부 요청이 실패해도 그때까지 도착한 문제는 저장되어 반환됩니다.
+    """
+    saved_problems = []
+
+    def save_problem(problem_data: dict) -> None:
+        try:
+            ai_problem = AIGeneratedProblem(
+                user_id=current_user.id,
+                source_pdf_path="",  # PDF 경로는 별도로 관리
+                question_text=problem_data.get('question', f'문제 {len(saved_problems)+1}'),
+                question_type=problem_data.get('type', 'multiple_choice'),
+                difficulty=problem_data.get('difficulty', 'intermediate'),
+                choices=json.dumps(problem_data.get('choices', [])) if problem_data.get('choices') else None,
+                correct_answer=str(problem_data.get('answer', '')),
+                explanation=problem_data.get('explanation', ''),
+                topic=problem_data.get('topic', ''),
+                points=problem_data.get('points', 1),
+                estimated_time=problem_data.get('estimatedTime', problem_data.get('estimated_time', 2))
+            )
+            db.add(ai_problem)
+            db.commit()
+            saved_problems.append(problem_data)
+        except Exception as e:
+            print(f"Error saving problem {len(saved_problems)+1}: {str(e)}")
+            # 개별 문제 저장 실패 시 해당 문제만 스킵하고 계속 진행
+            db.rollback()
+
     try:
-        # AI 프롬프트 구성
-        prompt = create_problem_generation_prompt(request.text, request.settings)
-        
-        # Claude API 호출
-        message = client.messages.create(
-            model="claude-3-haiku-20240307",
-            max_tokens=4000,
-            temperature=0.3,  # 일관된 결과를 위한 낮은 온도 설정
-            messages=[
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ]
-        )
-        
-        # 응답 파싱
-        problems = parse_ai_response(message.content[0].text)
-        
-        # 데이터베이스에 저장
-        saved_problems = []
-        for i, problem_data in enumerate(problems):
+        # 원문과 문제 수를 토큰 예산에 맞는 요청들로 나눠 동시에 생성
+        # (같은 텍스트와 설정의 요청은 LLM 응답 캐시에서 재사용)
+        async def generate_part(part_text: str, part_count: int) -> int:
+            prompt = create_problem_generation_prompt(part_text, {**request.settings, "questionCount": part_count})
+            parser = JSONArrayStream()
+            message = {}
+            received = 0
             try:
-                ai_problem = AIGeneratedProblem(
-                    user_id=current_user.id,
-                    source_pdf_path="",  # PDF 경로는 별도로 관리
-                    question_text=problem_data.get('question', f'문제 {i+1}'),
-                    question_type=problem_data.get('type', 'multiple_choice'),
-                    difficulty=problem_data.get('difficulty', 'intermediate'),
-                    choices=json.dumps(problem_data.get('choices', [])) if problem_data.get('choices') else None,
-                    correct_answer=str(problem_data.get('answer', '')),
-                    explanation=problem_data.get('explanation', ''),
-                    topic=problem_data.get('topic', ''),
-                    points=problem_data.get('points', 1),
-                    estimated_time=problem_data.get('estimatedTime', problem_data.get('estimated_time', 2))
-                )
-                db.add(ai_problem)
-                saved_problems.append(problem_data)
+                async for text in stream_message(
+                    "generate",
+                    model=GENERATE_MODEL,
+                    max_tokens=output_max_tokens(GENERATE_MODEL, part_count * tokens_per_question),
+                    temperature=0.3,  # 일관된 결과를 위한 낮은 온도 설정
+                    priority="background",  # 문제 20개 등 대량 생성은 해설 요청에 자리를 양보
+                    messages=[
+                        {
+                            "role": "user",
+                            "content": prompt
+                        }
+                    ],
+                    result=message
+                ):
+                    for problem in parser.feed(text):
+                        save_problem(validate_ai_problem(problem))
+                        received += 1
             except Exception as e:
-                print(f"Error saving problem {i+1}: {str(e)}")
-                # 개별 문제 저장 실패 시 해당 문제만 스킵하고 계속 진행
-                continue
-        
-        db.commit()
+                if not received:
+                    raise
+                print(f"DEBUG: 문제 생성 응답이 {received}문제 이후 끊김, 받은 문제는 유지: {str(e)}")
+                return received
+            if not message:
+                raise HTTPException(status_code=503, detail="AI 서비스를 사용할 수 없습니다.")
+            if message["stop_reason"] == "max_tokens":
+                print(f"DEBUG: 문제 생성 응답이 max_tokens에서 잘림 ({part_count}문제 요청, {received}문제 수신)")
+            if not received:
+                # 문제 배열을 찾지 못한 응답은 전체 텍스트로 다시 파싱 (실패 시 파싱 오류 더미 문제)
+                for problem in parse_ai_response(message["text"]):
+                    save_problem(problem)
+                    received += 1
+            return received
+
+        tokens_per_question = generation_tokens_per_question(request.settings)
+        plan = plan_problem_generation(request.text, request.settings.get('questionCount', 20), tokens_per_question)
+        print(f"DEBUG: 문제 생성 요청 {len(plan)}개로 분할: {[count for _, count in plan]}문제")
+        results = await asyncio.gather(*(generate_part(part_text, part_count) for part_text, part_count in plan),
+                                       return_exceptions=True)
+        errors = [result for result in results if isinstance(result, BaseException)]
+        if errors:
+            if not saved_problems:
+                raise errors[0]
+            # 일부 요청만 실패하면 나머지 요청에서 저장한 문제를 반환
+            print(f"DEBUG: 문제 생성 요청 {len(errors)}/{len(plan)}개 실패, 저장된 {len(saved_problems)}문제 반환: {errors[0]}")
         
         return saved_problems
         
+    except HTTPException:
+        raise
+    except LLMUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         print(f"AI 문제 생성 중 오류 발생: {str(e)}")
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"문제 생성 실패: {str(e)}")
 
+# 문제 생성 요청 크기: 문제 하나의 예상 출력 토큰(해설 포함)과 요청 하나에 넣을 원문 최대 토큰
+GENERATE_MODEL = "claude-3-haiku-20240307"
+LLM_GENERATE_TOKENS_PER_QUESTION = int(os.getenv("LLM_GENERATE_TOKENS_PER_QUESTION", "250"))
+LLM_GENERATE_MAX_SOURCE_TOKENS = int(os.getenv("LLM_GENERATE_MAX_SOURCE_TOKENS", "6000"))
+# 원문이 길 때 나눠 보낼 최대 요청 수 (출력 한도 때문에 더 필요하면 그만큼 늘어남)
+LLM_GENERATE_MAX_REQUESTS = int(os.getenv("LLM_GENERATE_MAX_REQUESTS", "4"))
+
+def generation_tokens_per_question(settings: dict) -> int:
+    """문제 하나의 예상 출력 토큰 수. 해설을 넣지 않으면 절반으로 봅니다."""
+    if settings.get('includeExplanations', True):
+        return LLM_GENERATE_TOKENS_PER_QUESTION
+    return max(1, LLM_GENERATE_TOKENS_PER_QUESTION // 2)
+
+def plan_problem_generation(text: str, question_count: int, tokens_per_question: int) -> List[tuple]:
+    """
+    문제 생성을 (원문 조각, 문제 수) 요청들로 나누는 함수.
+    긴 원문은 토큰 수가 비슷한 연속된 조각(최대 LLM_GENERATE_MAX_REQUESTS개)으로 나눠 문서 전체에서 고르게
+    문제가 나오게 하고, 조각이 LLM_GENERATE_MAX_SOURCE_TOKENS를 넘으면 조각 앞부분만 사용합니다.
+    조각마다 예상 출력(문제 수 x 문제당 토큰)이 모델의 최대 출력을 넘으면 같은 조각으로 요청을 더 나눕니다.
+    """
+    question_count = max(1, int(question_count))
+    per_request = max(1, max_expected_output(GENERATE_MODEL) // tokens_per_question)
+    chunk_count = max(1, min(math.ceil(estimate_tokens(text) / LLM_GENERATE_MAX_SOURCE_TOKENS),
+                             LLM_GENERATE_MAX_REQUESTS, question_count))
+    chunks = split_text_evenly(text, chunk_count)
+
+    base, extra = divmod(question_count, len(chunks))
+    plan = []
+    for i, chunk in enumerate(chunks):
+        count = base + (1 if i < extra else 0)
+        source = truncate_to_tokens(chunk, LLM_GENERATE_MAX_SOURCE_TOKENS)
+        requests = math.ceil(count / per_request)
+        for j in range(requests):
+            plan.append((source, count // requests + (1 if j < count % requests else 0)))
+    return plan
+
 def create_problem_generation_prompt(text: str, settings: dict) -> str:
-    """AI 문제 생성을 위한 프롬프트 생성"""
+    """AI 문제 생성을 위한 프롬프트 생성 (text는 plan_problem_generation으로 크기를 맞춘 원문 조각)"""
     question_types = settings.get('questionTypes', ['multiple_choice'])
     difficulty = settings.get('difficulty', 'intermediate')
     question_count = settings.get('questionCount', 20)
@@ -1421,7 +2106,7 @@ def create_problem_generation_prompt(text: str, settings: dict) -> str:
 다음 텍스트를 바탕으로 {question_count}개의 학습 문제를 생성해주세요.
 
 **텍스트 내용:**
-{text[:3000]}
+{text}
 
 **문제 생성 요구사항:**
 - 문제 유형: {', '.join(selected_types)}
@@ -1462,55 +2147,39 @@ JSON 배열 형태로만 응답해주세요.
     
     return prompt
 
+def validate_ai_problem(problem: dict) -> dict:
+    """AI가 생성한 문제 하나의 필드를 검증하고 기본값을 채우는 함수"""
+    validated_problem = {
+        'question': problem.get('question', ''),
+        'type': problem.get('type', 'multiple_choice'),
+        'difficulty': problem.get('difficulty', 'intermediate'),
+        'answer': problem.get('answer', ''),
+        'explanation': problem.get('explanation', ''),
+        'topic': problem.get('topic', ''),
+        'points': problem.get('points', 1),
+        'estimatedTime': problem.get('estimatedTime', 2)
+    }
+    if problem.get('choices'):
+        validated_problem['choices'] = problem['choices']
+    return validated_problem
+
 def parse_ai_response(response_text: str) -> List[dict]:
-    """AI 응답을 파싱하여 문제 리스트 반환"""
-    import json
-    import re
-    
+    """
+    AI 응답을 파싱하여 문제 리스트 반환.
+    코드 블록이나 앞뒤 문장이 있어도 JSON 배열을 찾아 읽고, 응답이 잘렸으면 완성된 문제까지만 반환합니다.
+    """
     print(f"DEBUG: AI 응답 파싱 시작, 응답 길이: {len(response_text)}")
     print(f"DEBUG: AI 응답 미리보기: {response_text[:500]}")
     
     try:
-        # JSON 코드 블록에서 내용 추출
-        json_match = re.search(r'```json\s*(.*?)\s*```', response_text, re.DOTALL)
-        if json_match:
-            json_text = json_match.group(1)
-            print("DEBUG: JSON 코드 블록에서 내용 추출 성공")
-        else:
-            # JSON 코드 블록이 없으면 전체 텍스트에서 JSON 배열 찾기
-            json_match = re.search(r'\[.*\]', response_text, re.DOTALL)
-            if json_match:
-                json_text = json_match.group(0)
-                print("DEBUG: 전체 텍스트에서 JSON 배열 추출 성공")
-            else:
-                print("DEBUG: JSON 형식을 찾을 수 없음")
-                raise ValueError("JSON 형식을 찾을 수 없습니다.")
-        
-        print(f"DEBUG: 추출된 JSON 텍스트: {json_text[:200]}...")
-        problems = json.loads(json_text)
+        problems = parse_json_array(response_text)
+        if not problems:
+            print("DEBUG: JSON 형식을 찾을 수 없음")
+            raise ValueError("JSON 형식을 찾을 수 없습니다.")
         print(f"DEBUG: JSON 파싱 성공, 문제 개수: {len(problems)}")
         
         # 데이터 검증 및 정리
-        validated_problems = []
-        for i, problem in enumerate(problems):
-            print(f"DEBUG: 문제 {i+1} 검증 중: {problem.get('question', 'NO QUESTION')[:50]}...")
-            validated_problem = {
-                'question': problem.get('question', ''),
-                'type': problem.get('type', 'multiple_choice'),
-                'difficulty': problem.get('difficulty', 'intermediate'),
-                'answer': problem.get('answer', ''),
-                'explanation': problem.get('explanation', ''),
-                'topic': problem.get('topic', ''),
-                'points': problem.get('points', 1),
-                'estimatedTime': problem.get('estimatedTime', 2)
-            }
-            
-            if problem.get('choices'):
-                validated_problem['choices'] = problem['choices']
-                print(f"DEBUG: 문제 {i+1} 선택지 개수: {len(problem['choices'])}")
-                
-            validated_problems.append(validated_problem)
-        
+        validated_problems = [validate_ai_problem(problem) for problem in problems]
         print(f"DEBUG: 검증 완료, 최종 문제 개수: {len(validated_problems)}")
         return validated_problems
         
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+데이터베이스 마이그레이션 스크립트
+OCR 문서의 extracted_text를 페이지 단위 테이블(ocr_pages)로 분리
+"""
+
+import sys
+
+from main import Base, engine, SessionLocal, OCRDocument, OCRPage, save_ocr_pages
+from ocr_processor import split_formatted_text
+
+def migrate_ocr_pages(clear_text: bool = False):
+    try:
+        # ocr_pages 테이블 생성 (이미 있으면 건너뜀)
+        Base.metadata.create_all(bind=engine)
+        print("✓ ocr_pages table ready")
+
+        db = SessionLocal()
+        try:
+            migrated_documents = 0
+            migrated_pages = 0
+            documents = db.query(OCRDocument).order_by(OCRDocument.id).all()
+            for document in documents:
+                has_pages = db.query(OCRPage).filter(OCRPage.ocr_document_id == document.id).first() is not None
+                if has_pages or not (document.extracted_text or "").strip():
+                    continue
+
+                pages = split_formatted_text(document.extracted_text)
+                save_ocr_pages(db, document.id, pages)
+                if clear_text:
+                    document.extracted_text = ""
+                db.commit()
+
+                migrated_documents += 1
+                migrated_pages += len(pages)
+                print(f"✓ Document {document.id} ({document.filename}): {len(pages)} pages")
+
+            print(f"\nMigrated {migrated_pages} pages from {migrated_documents} documents.")
+            if migrated_documents and not clear_text:
+                print("extracted_text was kept. Run with --clear-text to free the old text blobs.")
+        finally:
+            db.close()
+        return True
+
+    except Exception as e:
+        print(f"Unexpected error: {e}")
+        return False
+
+if __name__ == "__main__":
+    print("AI Cert Platform OCR Page Migration")
+    print("===================================")
+
+    if migrate_ocr_pages(clear_text="--clear-text" in sys.argv):
+        print("\n✅ OCR page migration successful!")
+    else:
+        print("\n❌ OCR page migration failed!")
+        print("Please check the error messages above.")
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+데이터베이스 마이그레이션 스크립트
+processing_jobs 테이블에 새로 추가된 컬럼 반영 (작업 리스/재시도 횟수, 작업별 처리 옵션)
+"""
+
+from sqlalchemy import inspect, text
+
+from main import Base, engine
+
+# (컬럼 이름, ALTER TABLE 구문)
+MIGRATIONS = [
+    ("lease_owner", "ALTER TABLE processing_jobs ADD COLUMN lease_owner VARCHAR(100)"),
+    ("lease_expires_at", "ALTER TABLE processing_jobs ADD COLUMN lease_expires_at DATETIME"),
+    ("heartbeat_at", "ALTER TABLE processing_jobs ADD COLUMN heartbeat_at DATETIME"),
+    ("attempts", "ALTER TABLE processing_jobs ADD COLUMN attempts INTEGER DEFAULT 0"),
+    ("options", "ALTER TABLE processing_jobs ADD COLUMN options TEXT"),
+]
+
+def migrate_processing_jobs():
+    try:
+        # processing_jobs 테이블이 없으면 새로 생성 (이 경우 모든 컬럼이 포함됨)
+        Base.metadata.create_all(bind=engine)
+
+        columns = [column["name"] for column in inspect(engine).get_columns("processing_jobs")]
+        print("Current columns in processing_jobs table:", columns)
+
+        pending = [(name, query) for name, query in MIGRATIONS if name not in columns]
+        if not pending:
+            print("\nNo migrations needed - all columns already exist.")
+            return True
+
+        print("\nExecuting migrations...")
+        with engine.begin() as conn:
+            for column_name, query in pending:
+                conn.execute(text(query))
+                print(f"✓ Added column: {column_name}")
+            if any(name == "lease_expires_at" for name, _ in pending):
+                # 회수할 작업(리스 만료)을 찾는 조회용 인덱스 (모델의 index=True와 같은 이름)
+                conn.execute(text("CREATE INDEX IF NOT EXISTS ix_processing_jobs_lease_expires_at "
+                                  "ON processing_jobs (lease_expires_at)"))
+                print("✓ Added index: ix_processing_jobs_lease_expires_at")
+        return True
+
+    except Exception as e:
+        print(f"Unexpected error: {e}")
+        return False
+
+if __name__ == "__main__":
+    print("AI Cert Platform Processing Job Migration")
+    print("=========================================")
+
+    if migrate_processing_jobs():
+        print("\n✅ Processing job migration successful!")
+    else:
+        print("\n❌ Processing job migration failed!")
+        print("Please check the error messages above.")
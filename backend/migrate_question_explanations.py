@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+"""
+데이터베이스 마이그레이션 스크립트
+문제별 AI 해설 저장 테이블(question_explanations) 생성
+"""
+
+from sqlalchemy import inspect
+
+from main import Base, engine
+
+def migrate_question_explanations():
+    try:
+        existed = inspect(engine).has_table("question_explanations")
+
+        # question_explanations 테이블 생성 (이미 있으면 건너뜀)
+        Base.metadata.create_all(bind=engine)
+
+        if existed:
+            print("\nNo migrations needed - question_explanations table already exists.")
+        else:
+            print("✓ Created table: question_explanations")
+        return True
+
+    except Exception as e:
+        print(f"Unexpected error: {e}")
+        return False
+
+if __name__ == "__main__":
+    print("AI Cert Platform Question Explanation Migration")
+    print("===============================================")
+
+    if migrate_question_explanations():
+        print("\n✅ Question explanation migration successful!")
+    else:
+        print("\n❌ Question explanation migration failed!")
+        print("Please check the error messages above.")
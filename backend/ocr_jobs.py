@@ -0,0 +1,492 @@
+import os
+import json
+import socket
+import threading
+import traceback
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from sqlalchemy import or_
+from sqlalchemy.orm import selectinload
+
+from ocr_processor import process_pdf_for_pages, format_pages, low_confidence_pages
+from question_parser import parse_document_questions
+from explanation_batch import EXPLAIN_BATCH_MODE, BatchUnavailable, run_batch, run_direct
+from llm_client import run_sync
+
+
+# 단계별 진행률 (0-100, AdminPanel.vue의 단계 표시 기준과 맞춤)
+STAGE_PROGRESS = {
+    "queued": 0,
+    "ocr": 30,
+    "parsing": 70,
+    "persisting": 90,
+    "storing": 90,
+    "done": 100,
+}
+FINISHED_STATUSES = ("done", "failed")
+# 작업 유형별 실패 메시지 (작업 목록/진행 화면에 표시)
+FAILURE_MESSAGES = {
+    "pdf_ingest": "OCR 처리 중 오류가 발생했습니다.",
+    "explain_precompute": "해설 생성 중 오류가 발생했습니다.",
+}
+
+# 작업 리스 설정: 워커는 JOB_LEASE_SECONDS 동안 작업을 독점하고 그 1/3 주기로 하트비트를 보내 연장합니다.
+# 워커가 죽으면 리스가 만료되고, 다른 워커가 작업을 회수해 다시 처리합니다.
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "60"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+
+
+class LeaseLost(Exception):
+    """다른 워커가 작업을 회수해 더 이상 이 워커가 리스를 갖고 있지 않을 때 발생하는 예외."""
+
+
+class JobFailed(Exception):
+    """다시 시도해도 성공할 수 없는 작업 오류 (예: 텍스트가 없는 PDF)."""
+
+
+def make_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class JobLease:
+    """
+    작업 리스를 하트비트 스레드로 주기적으로 연장하는 컨텍스트 매니저.
+    연장에 실패하면(리스를 빼앗기면) lost 플래그가 설정되고, check()에서 LeaseLost가 발생합니다.
+    """
+
+    def __init__(self, session_factory, job_model, job_id: int, worker_id: str):
+        self.session_factory = session_factory
+        self.job_model = job_model
+        self.job_id = job_id
+        self.worker_id = worker_id
+        self.lost = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._heartbeat_loop, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._stop.set()
+        self._thread.join()
+        return False
+
+    def check(self) -> None:
+        if self.lost:
+            raise LeaseLost(f"Job {self.job_id} lease lost by {self.worker_id}")
+
+    def _heartbeat_loop(self) -> None:
+        while not self._stop.wait(JOB_LEASE_SECONDS / 3):
+            db = self.session_factory()
+            try:
+                now = datetime.utcnow()
+                updated = db.query(self.job_model).filter(
+                    self.job_model.id == self.job_id,
+                    self.job_model.lease_owner == self.worker_id
+                ).update({
+                    self.job_model.lease_expires_at: now + timedelta(seconds=JOB_LEASE_SECONDS),
+                    self.job_model.heartbeat_at: now,
+                }, synchronize_session=False)
+                db.commit()
+                if updated != 1:
+                    self.lost = True
+                    return
+            except Exception as e:
+                print(f"Heartbeat failed for job {self.job_id}: {e}")
+                db.rollback()
+            finally:
+                db.close()
+
+
+def _claimable(job_model, now: datetime):
+    """아직 끝나지 않았고 리스가 없거나 만료된 작업 조건."""
+    return (
+        job_model.status.notin_(FINISHED_STATUSES),
+        or_(job_model.lease_expires_at.is_(None), job_model.lease_expires_at < now),
+    )
+
+
+def claim_job(db, job_model, job_id: int, worker_id: str) -> bool:
+    """
+    조건부 UPDATE(compare-and-set)로 작업 리스를 획득하는 함수.
+    여러 워커가 동시에 시도해도 데이터베이스가 한 워커의 UPDATE만 반영하므로 별도 브로커가 필요 없습니다.
+    """
+    now = datetime.utcnow()
+    updated = db.query(job_model).filter(job_model.id == job_id, *_claimable(job_model, now)).update({
+        job_model.lease_owner: worker_id,
+        job_model.lease_expires_at: now + timedelta(seconds=JOB_LEASE_SECONDS),
+        job_model.heartbeat_at: now,
+        job_model.attempts: job_model.attempts + 1,
+    }, synchronize_session=False)
+    db.commit()
+    return updated == 1
+
+
+def _fail_exhausted_jobs(db, job_model, now: datetime) -> None:
+    """시도 횟수를 모두 쓴 채 리스가 만료된 작업(워커가 반복해서 죽는 작업)을 failed로 표시하는 함수."""
+    updated = db.query(job_model).filter(
+        *_claimable(job_model, now),
+        job_model.attempts >= JOB_MAX_ATTEMPTS
+    ).update({
+        job_model.status: "failed",
+        job_model.error: "작업을 처리하던 워커가 응답하지 않아 최대 재시도 횟수를 초과했습니다.",
+        job_model.lease_expires_at: None,
+    }, synchronize_session=False)
+    db.commit()
+    if updated:
+        print(f"Marked {updated} exhausted job(s) as failed")
+
+
+def claimable_job_ids(db, job_model, job_types=None, limit: int = 10) -> List[int]:
+    """
+    대기 중이거나 리스가 만료된 작업 ID를 오래된 순으로 반환하는 함수.
+    시도 횟수를 모두 쓴 채 리스가 만료된 작업은 먼저 failed로 표시합니다.
+    """
+    now = datetime.utcnow()
+    _fail_exhausted_jobs(db, job_model, now)
+    query = db.query(job_model.id).filter(*_claimable(job_model, now))
+    if job_types:
+        query = query.filter(job_model.job_type.in_(job_types))
+    return [job_id for (job_id,) in query.order_by(job_model.id).limit(limit).all()]
+
+
+def claim_next_job(db, job_model, worker_id: str, job_types=None) -> Optional[int]:
+    """대기 중이거나 리스가 만료된 작업 중 가장 오래된 것을 하나 획득해 ID를 반환하는 함수."""
+    for job_id in claimable_job_ids(db, job_model, job_types):
+        if claim_job(db, job_model, job_id, worker_id):
+            return job_id
+    return None
+
+
+def _add_event(db, job, event_type: str, **data) -> None:
+    """작업 진행 이벤트를 세션에 추가하는 함수 (SSE 스트림으로 전달됨, 커밋은 호출자가 수행)."""
+    from main import ProcessingJobEvent
+
+    db.add(ProcessingJobEvent(job_id=job.id, event_type=event_type,
+                              data=json.dumps(data, ensure_ascii=False)))
+
+
+def _emit(db, job, event_type: str, **data) -> None:
+    """작업 진행 이벤트를 기록하고 바로 커밋하는 함수."""
+    _add_event(db, job, event_type, **data)
+    db.commit()
+
+
+def _update_job(db, job, status: Optional[str] = None, message: Optional[str] = None, **fields) -> None:
+    """
+    작업 상태/진행률/메시지를 갱신하고 바로 커밋하는 함수 (다른 프로세스에서 조회 가능하도록).
+    상태가 바뀌면 같은 트랜잭션에 status(또는 done/failed) 이벤트도 함께 기록합니다.
+    """
+    if status is not None:
+        job.status = status
+        if status in STAGE_PROGRESS:
+            job.progress = STAGE_PROGRESS[status]
+    if message is not None:
+        job.message = message
+    for key, value in fields.items():
+        setattr(job, key, value)
+    if status is not None:
+        event_type = status if status in FINISHED_STATUSES else "status"
+        _add_event(db, job, event_type, status=job.status, progress=job.progress, message=job.message,
+                   ocr_document_id=job.ocr_document_id, error=job.error,
+                   result=json.loads(job.result) if job.result else None)
+    db.commit()
+
+
+def mark_job_failed(db, job, error: str) -> None:
+    """작업을 작업 유형에 맞는 메시지와 함께 failed로 표시하는 함수."""
+    _update_job(db, job, status="failed",
+                message=FAILURE_MESSAGES.get(job.job_type, "작업 처리 중 오류가 발생했습니다."),
+                error=error, lease_expires_at=None)
+
+
+def _page_progress_callback(db, job):
+    """OCR 파이프라인의 페이지 완료 알림을 page 이벤트와 작업 진행률(ocr~parsing 구간)로 기록하는 콜백."""
+    start, end = STAGE_PROGRESS["ocr"], STAGE_PROGRESS["parsing"]
+
+    def on_page(event: dict) -> None:
+        if event["total"]:
+            job.progress = start + int((end - start) * event["done"] / event["total"])
+        _emit(db, job, "page", **event)
+
+    return on_page
+
+
+def _process_pdf_ingest(db, job, lease: JobLease) -> None:
+    """
+    PDF 업로드 작업 처리: OCR -> 문제 파싱(규칙 기반 파서 + Claude) -> 문제 저장.
+    OCR 결과는 ocr_pages 테이블에 페이지 단위로 저장되며, 이전 시도에서 문서가 이미 만들어졌다면
+    (회수된 작업) OCR을 건너뛰고 저장된 페이지를 재사용합니다.
+    문제는 파싱되는 즉시(LLM 응답 스트림에서 문제 객체가 닫힐 때마다) 저장하고 커밋하므로, 응답이 잘리거나
+    작업이 중간에 실패해도 그때까지 도착한 문제는 남습니다. 회수된 작업은 이전 시도가 저장하던 문제를 지우고 다시 저장합니다.
+    """
+    from main import OCRDocument, save_ocr_pages, get_document_pages, save_parsed_question, update_parsed_question
+
+    ocr_stats = {}
+    ocr_doc = None
+    if job.ocr_document_id is not None:
+        ocr_doc = db.query(OCRDocument).filter(OCRDocument.id == job.ocr_document_id).first()
+
+    if ocr_doc is None:
+        # OCR 처리
+        _update_job(db, job, status="ocr", message="PDF에서 텍스트를 추출하는 중입니다.")
+        print(f"Starting OCR for file: {job.file_path}")
+        options = json.loads(job.options) if job.options else {}
+        pages = process_pdf_for_pages(job.file_path, stats=ocr_stats,
+                                      progress_callback=_page_progress_callback(db, job),
+                                      preprocess=options.get("preprocess"))
+
+        if not any(page["text"].strip() for page in pages):
+            raise JobFailed("PDF에서 텍스트를 추출할 수 없습니다.")
+
+        lease.check()
+        # OCR 문서와 페이지 저장
+        ocr_doc = OCRDocument(
+            filename=job.filename,
+            file_path=job.file_path
+        )
+        db.add(ocr_doc)
+        db.flush()
+        save_ocr_pages(db, ocr_doc.id, pages)
+        db.commit()
+        db.refresh(ocr_doc)
+
+    document_pages = get_document_pages(db, ocr_doc)
+    extracted_text = format_pages(document_pages)
+    # OCR 신뢰도가 낮은 페이지는 파싱 단계에서 오인식 보정 대상으로 알려줌
+    uncertain_pages = low_confidence_pages(document_pages)
+
+    # AI를 사용한 문제 파싱
+    _update_job(db, job, status="parsing", message="AI가 문제를 분석하는 중입니다.",
+                ocr_document_id=ocr_doc.id)
+    print(f"Parsing questions from extracted text...")
+    if ocr_doc.questions:
+        print(f"Removing {len(ocr_doc.questions)} questions saved by a previous attempt of job {job.id}")
+        for question in list(ocr_doc.questions):
+            db.delete(question)
+        db.commit()
+
+    # 파싱 결과 목록의 위치 -> 저장한 문제 (같은 위치가 다시 오면 더 완전한 내용으로 교체)
+    saved = {}
+
+    def on_question(index: int, q_data: dict) -> None:
+        if lease.lost:
+            return
+        try:
+            if index in saved:
+                update_parsed_question(db, saved[index], q_data)
+            else:
+                saved[index] = save_parsed_question(db, ocr_doc.id, q_data)
+            _add_event(db, job, "question", index=index, questions_saved=len(saved))
+            db.commit()
+        except Exception as e:
+            print(f"Error saving question: {e}")
+            db.rollback()
+
+    parse_stats = {}
+    questions_data = parse_document_questions(extracted_text, low_confidence_pages=uncertain_pages,
+                                              stats=parse_stats, on_question=on_question)
+    _emit(db, job, "parse", questions_parsed=len(questions_data), low_confidence_pages=uncertain_pages,
+          local_questions=parse_stats.get("local_questions"), llm_questions=parse_stats.get("llm_questions"))
+
+    # 문제는 파싱 중에 이미 저장됨
+    lease.check()
+    _update_job(db, job, status="persisting", message="추출된 문제를 저장하는 중입니다.")
+    saved_questions = len(saved)
+    _add_event(db, job, "saved", questions_saved=saved_questions)
+
+    result = {
+        "questions_parsed": len(questions_data),
+        "questions_saved": saved_questions,
+        "extracted_text_preview": extracted_text[:500] + "...",
+        "ocr_stats": ocr_stats,
+        "parse_stats": parse_stats
+    }
+    if questions_data:
+        message = "PDF 업로드 및 OCR 처리가 완료되었습니다."
+    else:
+        message = "OCR은 성공했지만 문제를 파싱할 수 없습니다."
+    lease.check()
+    _update_job(db, job, status="done", message=message, result=json.dumps(result, ensure_ascii=False),
+                lease_expires_at=None)
+
+
+def _process_explain_precompute(db, job, lease: JobLease) -> None:
+    """
+    문서 해설 일괄 생성 작업 처리: 문서의 모든 문제 중 저장된 해설이 없는(또는 내용이 바뀐) 문제의 해설을
+    배치 API로 한 번에 생성해 해설 저장소(question_explanations)에 저장합니다.
+    배치 API를 쓸 수 없으면 속도 제한을 둔 동시 호출로 대체합니다. 제출한 배치 ID는 작업 결과에 먼저 기록해,
+    워커가 죽어 작업이 회수되면 새로 제출하지 않고 같은 배치를 이어서 기다립니다.
+    배치 모드의 진행률은 배치 처리(explain 이벤트)가 90%까지, 끝난 배치 결과의 저장(storing 상태, store 이벤트)이
+    나머지를 채우므로 뒤로 돌아가지 않습니다.
+    """
+    from main import (Question, build_explain_prompt, question_content_hash, get_stored_explanation,
+                      store_explanation, EXPLAIN_MODEL, EXPLAIN_PARAMS)
+
+    if job.ocr_document_id is None:
+        raise JobFailed("해설을 생성할 문서가 없습니다.")
+    options = json.loads(job.options or "{}")
+    refresh = bool(options.get("refresh"))
+    previous = json.loads(job.result or "{}")
+
+    questions = db.query(Question).options(selectinload(Question.options)).filter(
+        Question.ocr_document_id == job.ocr_document_id
+    ).order_by(Question.id).all()
+
+    requests = []
+    for question in questions:
+        question_options = sorted(question.options, key=lambda option: option.id)
+        content_hash = question_content_hash(question, question_options)
+        if not refresh and get_stored_explanation(db, question.id, content_hash) is not None:
+            continue
+        requests.append({
+            "custom_id": f"question-{question.id}",
+            "question_id": question.id,
+            "content_hash": content_hash,
+            "model": EXPLAIN_MODEL,
+            "messages": [{"role": "user", "content": build_explain_prompt(question, question_options)}],
+            "params": EXPLAIN_PARAMS,
+        })
+    by_id = {request["custom_id"]: request for request in requests}
+
+    _update_job(db, job, status="explaining", progress=0,
+                message=f"{len(requests)}개 문제의 해설을 생성하는 중입니다. (전체 {len(questions)}문제)")
+
+    def on_progress(done: int, total: int) -> None:
+        lease.check()
+        job.progress = int(100 * done / total) if total else 0
+        _emit(db, job, "explain", done=done, total=total)
+
+    def on_batch_progress(done: int, total: int) -> None:
+        lease.check()
+        job.progress = int(STAGE_PROGRESS["storing"] * done / total) if total else 0
+        _emit(db, job, "explain", done=done, total=total)
+
+    def on_stored(done: int, total: int) -> None:
+        lease.check()
+        start = STAGE_PROGRESS["storing"]
+        job.progress = start + int((100 - start) * done / total) if total else start
+        _emit(db, job, "store", done=done, total=total)
+
+    batch_id = previous.get("batch_id")
+
+    def on_submitted(submitted_id: str) -> None:
+        nonlocal batch_id
+        batch_id = submitted_id
+        _update_job(db, job, result=json.dumps({"batch_id": batch_id}))
+
+    stored = 0
+    mode = EXPLAIN_BATCH_MODE
+
+    def on_result(custom_id: str, response: dict) -> None:
+        nonlocal stored
+        request = by_id[custom_id]
+        store_explanation(db, request["question_id"], request["content_hash"], response["text"])
+        stored += 1
+        # 직접 호출은 생성과 저장이 함께 진행되고, 배치는 생성이 끝난 뒤 결과를 저장
+        (on_stored if mode == "batch" else on_progress)(stored, len(requests))
+
+    results = {}
+    if requests and mode in ("auto", "batch"):
+        try:
+            results = run_sync(run_batch(requests, batch_id=batch_id,
+                                         on_submitted=on_submitted, on_progress=on_batch_progress))
+            mode = "batch"
+            _update_job(db, job, status="storing", message=f"생성된 해설 {len(results)}개를 저장하는 중입니다.")
+            for custom_id, response in results.items():
+                on_result(custom_id, response)
+        except BatchUnavailable as e:
+            if mode == "batch":
+                raise JobFailed(str(e))
+            print(f"{e} - falling back to direct requests")
+            mode = "direct"
+    if requests and mode == "direct":
+        # 배치에서 실패한 요청이 있어도 남은 문제만 직접 호출
+        remaining = [request for request in requests if request["custom_id"] not in results]
+        results.update(run_sync(run_direct(remaining, on_result=on_result, use_cache=not refresh)))
+
+    lease.check()
+    result = {
+        "questions": len(questions),
+        "already_stored": len(questions) - len(requests),
+        "requested": len(requests),
+        "generated": len(results),
+        "failed": len(requests) - len(results),
+        "mode": mode if requests else None,
+        "batch_id": batch_id,
+    }
+    message = f"해설 생성이 완료되었습니다. (새로 생성 {len(results)}개, 기존 {result['already_stored']}개)"
+    _update_job(db, job, status="done", message=message,
+                result=json.dumps(result, ensure_ascii=False),
+                lease_expires_at=None)
+
+
+# 작업 유형별 처리 함수
+JOB_HANDLERS = {
+    "pdf_ingest": _process_pdf_ingest,
+    "explain_precompute": _process_explain_precompute,
+}
+
+
+def execute_claimed_job(job_id: int, worker_id: str) -> None:
+    """
+    리스를 획득한 작업을 실행하는 함수. 하트비트로 리스를 유지하며,
+    실패 시 남은 시도 횟수가 있으면 다시 대기열로 돌려보내고 없으면 failed로 표시합니다.
+    """
+    from main import SessionLocal, ProcessingJob
+
+    db = SessionLocal()
+    job = None
+    try:
+        job = db.query(ProcessingJob).filter(ProcessingJob.id == job_id).first()
+        if not job:
+            print(f"Job {job_id} not found")
+            return
+
+        handler = JOB_HANDLERS.get(job.job_type)
+        if handler is None:
+            raise JobFailed(f"알 수 없는 작업 유형입니다: {job.job_type}")
+
+        print(f"Worker {worker_id} running job {job_id} (attempt {job.attempts})")
+        with JobLease(SessionLocal, ProcessingJob, job_id, worker_id) as lease:
+            handler(db, job, lease)
+
+    except LeaseLost as e:
+        # 다른 워커가 작업을 이어받았으므로 상태를 건드리지 않음
+        print(f"{e}")
+        db.rollback()
+    except Exception as e:
+        print(f"Job {job_id} failed: {e}")
+        traceback.print_exc()
+        db.rollback()
+        if job is not None:
+            if (job.attempts or 0) < JOB_MAX_ATTEMPTS and not isinstance(e, JobFailed):
+                # 일시적인 오류는 리스를 풀어 다른 워커가 다시 시도하도록 함
+                _update_job(db, job, status="queued", message=f"오류로 재시도 대기 중입니다: {e}",
+                            lease_owner=None, lease_expires_at=None)
+                return
+            # 문서가 만들어지기 전에 실패하면 업로드된 파일 삭제
+            if job.ocr_document_id is None and job.file_path and os.path.exists(job.file_path):
+                os.remove(job.file_path)
+            mark_job_failed(db, job, str(e))
+    finally:
+        db.close()
+
+
+def run_job(job_id: int) -> None:
+    """
+    API 서버의 워커 프로세스 풀에서 방금 등록된 작업을 처리하는 함수.
+    다른 워커(ocr_worker.py)가 먼저 리스를 잡았다면 아무것도 하지 않습니다.
+    """
+    from main import SessionLocal, ProcessingJob
+
+    worker_id = make_worker_id()
+    db = SessionLocal()
+    try:
+        claimed = claim_job(db, ProcessingJob, job_id, worker_id)
+    finally:
+        db.close()
+    if claimed:
+        execute_claimed_job(job_id, worker_id)
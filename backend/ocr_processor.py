@@ -1,131 +1,995 @@
 import os
-import json
 import sys
-import anthropic
+import time
+import tempfile
+import hashlib
+import threading
+import asyncio
 from dotenv import load_dotenv
 
 from PyPDF2 import PdfReader
-from pdf2image import convert_from_path
+from pdf2image import convert_from_path, pdfinfo_from_path
 import pytesseract
+import numpy as np
 from PIL import Image
 import re # Moved import re to the top
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Callable, List, Optional
+
+from disk_cache import DiskCache
+from json_stream import JSONArrayStream
+from llm_cache import LLM_CACHE, stream_message
+from llm_client import AI_ENABLED, run_sync
+from token_budget import estimate_tokens, max_expected_output, output_max_tokens, split_text
+
+# tesserocr(tesseract C API 바인딩)는 선택 의존성: 설치되어 있으면 워커마다 엔진을 한 번만 로드해 재사용
+try:
+    import tesserocr
+except ImportError:
+    tesserocr = None
 
 # .env 파일 로드
 load_dotenv()
 
 
 
-# Anthropic 클라이언트 초기화
-api_key = os.getenv("ANTHROPIC_API_KEY")
-print(f"OCR DEBUG: API Key loaded: {api_key[:20] if api_key else 'None'}...")
-if not api_key or api_key == "sk-test-key":
+# Anthropic 호출은 공유 비동기 클라이언트(llm_client)를 사용합니다.
+if not AI_ENABLED:
     print("Info: Running in development mode - AI features disabled.")
-    client = None
-else:
-    client = anthropic.Anthropic(api_key=api_key)
-    print("OCR DEBUG: Anthropic client initialized successfully!")
 
 
 pytesseract.pytesseract.tesseract_cmd = os.getenv("TESSERACT_CMD", '')
 
-def process_pdf_for_text(pdf_path: str) -> str:
+# OCR 설정 (페이지 단위 병렬 처리)
+OCR_LANG = os.getenv("OCR_LANG", "kor+eng")  # 한국어 및 영어 OCR
+OCR_CONFIG = os.getenv("OCR_CONFIG", "")  # tesseract 추가 옵션 (예: "--psm 6")
+# OCR 엔진: auto(tesserocr가 있으면 사용), tesserocr, pytesseract(페이지마다 tesseract 프로세스 실행)
+OCR_ENGINE = os.getenv("OCR_ENGINE", "auto")
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", str(os.cpu_count() or 1)))
+# 한 번에 래스터화하는 페이지 수. 메모리/디스크 사용량은 문서 길이와 무관하게 이 값으로 제한됩니다.
+OCR_PAGE_WINDOW = int(os.getenv("OCR_PAGE_WINDOW", "8"))
+# 2단계 적응형 DPI: 모든 페이지를 OCR_LOW_DPI로 빠르게 OCR한 뒤, 평균 단어 신뢰도(0-100)가
+# OCR_MIN_CONFIDENCE 미만인 페이지만 OCR_HIGH_DPI로 다시 렌더링해 OCR합니다.
+# OCR_HIGH_DPI를 0(또는 OCR_LOW_DPI 이하)으로 설정하면 OCR_LOW_DPI 한 번만 수행합니다.
+OCR_LOW_DPI = int(os.getenv("OCR_LOW_DPI", "150"))
+OCR_HIGH_DPI = int(os.getenv("OCR_HIGH_DPI", "300"))
+OCR_MIN_CONFIDENCE = float(os.getenv("OCR_MIN_CONFIDENCE", "70"))
+# OCR 전 이미지 전처리(그레이스케일, 적응형 이진화, 기울기 보정, 테두리 제거) 기본값.
+# 문서별로 켜고 끌 수 있으며(업로드 시 preprocess 파라미터), 스캔본 PDF에 효과가 큽니다.
+OCR_PREPROCESS = os.getenv("OCR_PREPROCESS", "false").lower() == "true"
+OCR_DESKEW_MAX_ANGLE = float(os.getenv("OCR_DESKEW_MAX_ANGLE", "5"))
+# 텍스트 레이어 우선 추출: 이 기준을 통과한 페이지는 OCR을 건너뜁니다.
+TEXT_LAYER_MIN_CHARS = int(os.getenv("TEXT_LAYER_MIN_CHARS", "30"))
+TEXT_LAYER_MIN_QUALITY = float(os.getenv("TEXT_LAYER_MIN_QUALITY", "0.6"))
+
+# OCR 결과 캐시: PDF 파일 해시(문서 단위)와 렌더링된 페이지 이미지 해시(페이지 단위)로 결과를 재사용
+# OCR_CACHE_DIR를 빈 값으로 설정하면 캐시를 사용하지 않습니다.
+OCR_CACHE_DIR = os.getenv("OCR_CACHE_DIR", "ocr_cache")
+OCR_CACHE_MAX_MB = int(os.getenv("OCR_CACHE_MAX_MB", "512"))
+OCR_CACHE = DiskCache(OCR_CACHE_DIR, OCR_CACHE_MAX_MB * 1024 * 1024) if OCR_CACHE_DIR else None
+
+# 문제 파싱: 문서를 겹치는 페이지 윈도우로 나눠 동시에 Claude로 파싱
+PARSE_MODEL = "claude-3-5-sonnet-20240620"
+LLM_PARSE_WINDOW_PAGES = int(os.getenv("LLM_PARSE_WINDOW_PAGES", "4"))
+LLM_PARSE_OVERLAP_PAGES = int(os.getenv("LLM_PARSE_OVERLAP_PAGES", "1"))
+LLM_PARSE_CONCURRENCY = int(os.getenv("LLM_PARSE_CONCURRENCY", "4"))
+# 파싱 결과 JSON의 예상 출력 토큰 / 입력 페이지 텍스트 토큰 비율 (문제와 보기를 옮겨 적고 JSON 키가 붙음)
+# 윈도우는 LLM_PARSE_WINDOW_PAGES 페이지 이내에서 예상 출력이 모델의 최대 출력에 들어가도록 잡습니다.
+LLM_PARSE_OUTPUT_RATIO = float(os.getenv("LLM_PARSE_OUTPUT_RATIO", "1.2"))
+
+
+def _file_sha256(path: str) -> str:
+    """파일 내용의 SHA-256 해시를 계산하는 함수."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _to_gray(image: Image.Image) -> np.ndarray:
+    """PIL 이미지를 float32 그레이스케일 배열로 변환 (ITU-R 601 가중치)."""
+    if image.mode == "L":
+        return np.asarray(image, dtype=np.float32)
+    rgb = np.asarray(image.convert("RGB"), dtype=np.float32)
+    return rgb @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+
+def _stretch_contrast(gray: np.ndarray) -> np.ndarray:
+    """하위/상위 1% 밝기를 0/255로 늘려 저대비 스캔본의 명암 차이를 키우는 함수."""
+    low, high = np.percentile(gray[::4, ::4], (1, 99))  # 1/16 표본으로 충분
+    if high - low < 1:
+        return gray
+    return np.clip((gray - low) * (255.0 / (high - low)), 0, 255)
+
+
+def _box_mean(values: np.ndarray, window: int) -> np.ndarray:
+    """적분 영상(integral image)으로 각 픽셀 주변 window x window 영역의 평균을 한 번에 계산하는 함수."""
+    pad = window // 2
+    padded = np.pad(values.astype(np.float64), pad, mode="edge")
+    integral = np.zeros((padded.shape[0] + 1, padded.shape[1] + 1))
+    integral[1:, 1:] = padded.cumsum(axis=0).cumsum(axis=1)
+    sums = (integral[window:, window:] - integral[:-window, window:]
+            - integral[window:, :-window] + integral[:-window, :-window])
+    return sums / (window * window)
+
+
+def _binarize(gray: np.ndarray, k: float = 0.3, r: float = 128.0) -> np.ndarray:
     """
-    PDF 파일에서 OCR을 수행하여 텍스트를 추출하는 함수.
+    Sauvola 적응형 이진화. 조명이 고르지 않거나 배경이 얼룩진 스캔본에서도
+    주변 영역의 평균/표준편차로 픽셀마다 임계값을 정합니다. 글자는 True(잉크)로 반환됩니다.
     """
-    if not os.path.exists(pdf_path):
-        print(f"Error: PDF file not found at {pdf_path}")
-        return ""
+    window = max(15, (min(gray.shape) // 40) | 1)
+    mean = _box_mean(gray, window)
+    std = np.sqrt(np.maximum(_box_mean(gray * gray, window) - mean * mean, 0))
+    threshold = mean * (1 + k * (std / r - 1))
+    return gray < threshold
 
-    print(f"Processing PDF for OCR: {pdf_path}")
-    extracted_text_pages = []
 
+def _edge_band(dark: np.ndarray) -> tuple:
+    """가장자리부터 이어지는 True 구간(스캔 테두리)을 제외한 (시작, 끝) 인덱스."""
+    if dark.all():
+        return 0, len(dark)
+    start = int(np.argmin(dark)) if dark[0] else 0
+    end = len(dark) - int(np.argmin(dark[::-1])) if dark[-1] else len(dark)
+    return start, end
+
+
+def _strip_dark_borders(gray: np.ndarray) -> np.ndarray:
+    """
+    스캔 시 생긴 검은 테두리 띠(절반 이상이 어두운 가장자리 행/열)를 잘라내는 함수.
+    적응형 이진화는 넓고 균일한 검은 영역의 안쪽을 배경으로 판단하므로 이진화 전에 제거합니다.
+    """
+    dark = gray < 128
+    top, bottom = _edge_band(dark.mean(axis=1) > 0.5)
+    left, right = _edge_band(dark.mean(axis=0) > 0.5)
+    return gray[top:bottom, left:right]
+
+
+def _crop_to_content(ink: np.ndarray, margin: int) -> np.ndarray:
+    """이진화된 페이지를 글자가 있는 범위(+margin)로 자르는 함수. 드문 점 잡음은 무시합니다."""
+    rows = np.flatnonzero(ink.mean(axis=1) > 0.002)
+    cols = np.flatnonzero(ink.mean(axis=0) > 0.002)
+    if len(rows) == 0 or len(cols) == 0:
+        return ink
+    return ink[max(rows[0] - margin, 0):rows[-1] + margin + 1, max(cols[0] - margin, 0):cols[-1] + margin + 1]
+
+
+def _estimate_skew(ink: np.ndarray, max_angle: float, step: float = 0.25) -> float:
+    """
+    투영 프로파일 방식으로 기울기(도)를 추정하는 함수. 후보 각도마다 잉크 픽셀 좌표를
+    기울인 뒤 행별 히스토그램을 구해, 글자 줄이 가장 선명하게 모이는(제곱합이 최대인) 각도를 고릅니다.
+    모든 후보 각도를 하나의 배열 연산으로 계산합니다.
+    """
+    ys, xs = np.nonzero(ink)
+    if len(ys) < 100 or max_angle <= 0:
+        return 0.0
+    sample = max(1, len(ys) // 50000)
+    ys, xs = ys[::sample], xs[::sample]
+
+    angles = np.arange(-max_angle, max_angle + step / 2, step)
+    rows = np.rint(ys[None, :] - xs[None, :] * np.tan(np.deg2rad(angles))[:, None]).astype(np.int64)
+    rows -= rows.min()
+    span = int(rows.max()) + 1
+    counts = np.bincount((rows + np.arange(len(angles))[:, None] * span).ravel(),
+                         minlength=len(angles) * span).reshape(len(angles), span)
+    scores = (counts.astype(np.float64) ** 2).sum(axis=1)
+    return float(angles[int(np.argmax(scores))])
+
+
+def preprocess_image(image: Image.Image) -> Image.Image:
+    """
+    OCR 전처리: 그레이스케일 변환 -> 대비 보정 -> 적응형 이진화 -> 테두리 제거 -> 기울기 보정.
+    결과는 흰 배경에 검은 글자인 흑백("L") 이미지이며, 원본의 DPI 정보를 유지합니다.
+    """
+    ink = _binarize(_strip_dark_borders(_stretch_contrast(_to_gray(image))))
+    ink = _crop_to_content(ink, margin=max(4, min(ink.shape) // 100))
+
+    result = Image.fromarray(np.where(ink, 0, 255).astype(np.uint8), mode="L")
+    angle = _estimate_skew(ink, OCR_DESKEW_MAX_ANGLE)
+    if angle:
+        result = result.rotate(angle, resample=Image.NEAREST, expand=True, fillcolor=255)
+    if "dpi" in image.info:
+        result.info["dpi"] = image.info["dpi"]
+    return result
+
+
+def _mean_confidence(confidences) -> Optional[float]:
+    """단어별 신뢰도 목록의 평균. 인식된 단어가 없으면(-1만 있으면) None을 반환합니다."""
+    values = [float(c) for c in confidences if float(c) >= 0]
+    return round(sum(values) / len(values), 1) if values else None
+
+
+def _text_from_data(data: dict) -> str:
+    """image_to_data 결과의 단어들을 줄/문단 구조에 맞게 이어 붙여 image_to_string과 같은 형태로 만드는 함수."""
+    lines = []
+    current = None
+    for i, word in enumerate(data["text"]):
+        if not word or not word.strip():
+            continue
+        key = (data["block_num"][i], data["par_num"][i], data["line_num"][i])
+        if key == current:
+            lines[-1] += " " + word
+            continue
+        if current is not None and key[:2] != current[:2]:
+            lines.append("")  # 문단 구분
+        lines.append(word)
+        current = key
+    return "\n".join(lines)
+
+
+class PytesseractEngine:
+    """pytesseract 엔진: 호출마다 tesseract 프로세스를 새로 실행하고 traineddata를 다시 로드합니다."""
+
+    name = "pytesseract"
+
+    def recognize(self, image) -> tuple:
+        """(텍스트, 평균 단어 신뢰도)를 반환합니다. image_to_data 한 번으로 둘 다 얻습니다."""
+        data = pytesseract.image_to_data(image, lang=OCR_LANG, config=OCR_CONFIG,
+                                         output_type=pytesseract.Output.DICT)
+        words = [(conf, word) for conf, word in zip(data["conf"], data["text"]) if word and word.strip()]
+        return _text_from_data(data), _mean_confidence(conf for conf, _ in words)
+
+
+class TesserocrEngine:
+    """
+    tesserocr 엔진: tesseract C API를 프로세스 안에 한 번 초기화해 두고 페이지마다 재사용합니다.
+    C API 핸들은 스레드 안전하지 않으므로 잠금으로 보호합니다.
+    """
+
+    name = "tesserocr"
+
+    def __init__(self):
+        kwargs = {"lang": OCR_LANG}
+        psm = re.search(r"--psm\s+(\d+)", OCR_CONFIG)
+        if psm:
+            kwargs["psm"] = int(psm.group(1))
+        if os.getenv("TESSDATA_PREFIX"):
+            kwargs["path"] = os.getenv("TESSDATA_PREFIX")
+        self._api = tesserocr.PyTessBaseAPI(**kwargs)
+        self._lock = threading.Lock()
+
+    def recognize(self, image) -> tuple:
+        """(텍스트, 평균 단어 신뢰도)를 반환합니다."""
+        with self._lock:
+            self._api.SetImage(image)
+            text = self._api.GetUTF8Text()
+            confidences = self._api.AllWordConfidences()
+        return text, _mean_confidence(confidences)
+
+
+def _engine_name(name: Optional[str] = None) -> str:
+    """설정(OCR_ENGINE)과 설치 여부로 결정되는 엔진 이름."""
+    name = name or OCR_ENGINE
+    if name in ("auto", "tesserocr") and tesserocr is not None:
+        return "tesserocr"
+    return "pytesseract"
+
+
+def create_ocr_engine(name: Optional[str] = None):
+    """
+    OCR 엔진을 생성하는 함수. tesserocr를 쓸 수 없거나 초기화에 실패하면 pytesseract로 대체합니다.
+    """
+    if (name or OCR_ENGINE) == "tesserocr" and tesserocr is None:
+        print("Warning: tesserocr is not installed, falling back to pytesseract.")
+    if _engine_name(name) == "tesserocr":
+        try:
+            return TesserocrEngine()
+        except Exception as e:
+            print(f"Warning: tesserocr initialization failed ({e}), falling back to pytesseract.")
+    return PytesseractEngine()
+
+
+_ocr_engine = None
+
+
+def get_ocr_engine():
+    """현재 프로세스의 OCR 엔진을 반환하는 함수 (프로세스당 한 번만 생성)."""
+    global _ocr_engine
+    if _ocr_engine is None:
+        _ocr_engine = create_ocr_engine()
+    return _ocr_engine
+
+
+def _init_ocr_worker() -> None:
+    """프로세스 풀 워커 초기화: 첫 페이지를 받기 전에 엔진(traineddata)을 미리 로드합니다."""
+    global _ocr_engine
+    _ocr_engine = None  # fork로 물려받은 부모의 엔진 핸들은 공유하지 않고 새로 생성
+    get_ocr_engine()
+
+
+def _ocr_settings() -> dict:
+    """OCR 결과에 영향을 주는 설정값. 캐시 키에 포함되어 설정이 바뀌면 캐시가 무효화됩니다."""
+    return {"lang": OCR_LANG, "config": OCR_CONFIG, "engine": _engine_name()}
+
+
+def _adaptive_dpi() -> bool:
+    return OCR_HIGH_DPI > OCR_LOW_DPI
+
+
+def _needs_high_dpi(page: dict) -> bool:
+    """저해상도 OCR 결과의 신뢰도가 기준 미만(또는 인식된 단어 없음)이라 고해상도로 다시 OCR해야 하는지."""
+    return page["confidence"] is None or page["confidence"] < OCR_MIN_CONFIDENCE
+
+
+def low_confidence_pages(pages: List[dict]) -> List[int]:
+    """OCR 신뢰도가 기준(OCR_MIN_CONFIDENCE) 미만인 페이지 번호 목록. 텍스트 레이어 페이지는 제외됩니다."""
+    return [
+        page["page"] for page in pages
+        if page.get("method") == "ocr" and page.get("confidence") is not None
+        and page["confidence"] < OCR_MIN_CONFIDENCE
+    ]
+
+
+def _recognize(image: Image.Image, preprocess: bool) -> tuple:
+    """(텍스트, 평균 신뢰도, 전처리 소요 시간(초))를 반환하는 함수."""
+    preprocess_seconds = 0.0
+    if preprocess:
+        started = time.perf_counter()
+        image = preprocess_image(image)
+        preprocess_seconds = time.perf_counter() - started
+    text, confidence = get_ocr_engine().recognize(image)
+    return text, confidence, preprocess_seconds
+
+
+def _ocr_page(page_number: int, image, preprocess: bool = False) -> dict:
+    """
+    워커 프로세스에서 한 페이지 이미지를 OCR하는 함수.
+    image는 PIL 이미지 또는 디스크에 저장된 페이지 이미지 경로입니다.
+    경로가 주어지면 이미지 파일 해시로 페이지 캐시를 먼저 조회합니다.
+    preprocess가 True이면 OCR 전에 preprocess_image를 적용합니다.
+    {"page", "text", "method", "confidence", "seconds", "preprocess_seconds", "cached"}를 반환합니다.
+    """
+    started = time.perf_counter()
+    page = {"page": page_number, "method": "ocr", "cached": False}
+    if not isinstance(image, str):
+        page["text"], page["confidence"], page["preprocess_seconds"] = _recognize(image, preprocess)
+        page["seconds"] = time.perf_counter() - started
+        return page
+
+    cache_key = None
+    if OCR_CACHE is not None:
+        cache_key = DiskCache.make_key("page", _file_sha256(image), _ocr_settings(), {"preprocess": preprocess})
+        cached = OCR_CACHE.get(cache_key)
+        if cached is not None and "confidence" in cached:
+            page.update(text=cached["text"], confidence=cached["confidence"], preprocess_seconds=0.0,
+                        seconds=time.perf_counter() - started, cached=True)
+            return page
+
+    with Image.open(image) as page_image:
+        page["text"], page["confidence"], page["preprocess_seconds"] = _recognize(page_image, preprocess)
+    if cache_key is not None:
+        OCR_CACHE.set(cache_key, {"text": page["text"], "confidence": page["confidence"]})
+    page["seconds"] = time.perf_counter() - started
+    return page
+
+
+def _ocr_window(executor: Optional[ProcessPoolExecutor], page_images: List[tuple], dpi: int,
+                on_page: Optional[Callable[[dict], None]] = None, preprocess: bool = False) -> List[dict]:
+    """
+    한 윈도우의 (페이지 번호, 이미지 경로)들을 OCR하고, 텍스트를 얻는 즉시 이미지 파일을 삭제하는 함수.
+    on_page가 주어지면 페이지 OCR이 끝날 때마다 완료 순서대로 호출됩니다.
+    """
+    pages = []
+    if executor is None:
+        results = ((_ocr_page(page_number, image_path, preprocess), image_path)
+                   for page_number, image_path in page_images)
+    else:
+        futures = {
+            executor.submit(_ocr_page, page_number, image_path, preprocess): image_path
+            for page_number, image_path in page_images
+        }
+        results = ((future.result(), futures[future]) for future in as_completed(futures))
+
+    for page, image_path in results:
+        os.remove(image_path)
+        page["dpi"] = dpi
+        pages.append(page)
+        if on_page is not None:
+            on_page(page)
+
+    pages.sort(key=lambda p: p["page"])
+    return pages
+
+
+def _contiguous_runs(page_numbers: List[int]) -> List[tuple]:
+    """정렬된 페이지 번호 리스트를 (시작, 끝) 연속 구간들로 묶는 함수."""
+    runs = []
+    for page_number in page_numbers:
+        if runs and runs[-1][1] == page_number - 1:
+            runs[-1] = (runs[-1][0], page_number)
+        else:
+            runs.append((page_number, page_number))
+    return runs
+
+
+def _render_pages(pdf_path: str, page_numbers: List[int], output_folder: str, dpi: int) -> List[tuple]:
+    """페이지들을 dpi 해상도의 PNG 파일로 렌더링해 [(페이지 번호, 이미지 경로)]를 반환하는 함수."""
+    page_images = []
+    for first_page, last_page in _contiguous_runs(page_numbers):
+        image_paths = convert_from_path(
+            pdf_path,
+            dpi=dpi,
+            first_page=first_page,
+            last_page=last_page,
+            output_folder=output_folder,
+            paths_only=True,
+            fmt="png"
+        )
+        page_images.extend(zip(range(first_page, last_page + 1), image_paths))
+    return page_images
+
+
+def ocr_pdf_pages(pdf_path: str, max_workers: Optional[int] = None,
+                  window_size: Optional[int] = None, stats: Optional[dict] = None,
+                  page_numbers: Optional[List[int]] = None,
+                  on_page: Optional[Callable[[dict], None]] = None,
+                  preprocess: Optional[bool] = None) -> List[dict]:
+    """
+    PDF를 window_size 페이지씩 임시 디렉토리에 래스터화하고, 프로세스 풀에서 병렬로 OCR하는 함수.
+    전체 페이지를 한꺼번에 메모리에 올리지 않으므로 수백 페이지짜리 PDF도 일정한 메모리로 처리됩니다.
+    각 윈도우는 OCR_LOW_DPI로 먼저 OCR하고, 신뢰도가 낮은 페이지만 OCR_HIGH_DPI로 다시 OCR해
+    신뢰도가 더 높은 쪽 결과를 사용합니다.
+    page_numbers를 지정하면 해당 페이지(1부터 시작)만 OCR합니다.
+    on_page는 각 페이지의 최종 OCR 결과가 정해질 때마다 호출됩니다.
+    preprocess는 OCR 전 이미지 전처리 여부이며, None이면 OCR_PREPROCESS 설정을 따릅니다.
+    결과는 페이지 순서대로 정렬된 {"page", "text", "method", "confidence", "dpi", "seconds"} 딕셔너리 리스트입니다.
+    """
+    if preprocess is None:
+        preprocess = OCR_PREPROCESS
+    if page_numbers is None:
+        page_numbers = list(range(1, pdfinfo_from_path(pdf_path)["Pages"] + 1))
+    page_numbers = sorted(page_numbers)
+    if not page_numbers:
+        return []
+
+    workers = max(1, min(max_workers or OCR_WORKERS, len(page_numbers)))
+    # 윈도우가 워커 수보다 작으면 일부 워커가 놀게 되므로 최소 워커 수만큼은 래스터화
+    window = max(workers, window_size or OCR_PAGE_WINDOW)
+    adaptive = _adaptive_dpi()
+    rerendered = []
+
+    def on_first_pass(page: dict) -> None:
+        # 고해상도로 다시 OCR할 페이지는 두 번째 결과가 나온 뒤에 알림
+        if on_page is not None and not (adaptive and _needs_high_dpi(page)):
+            on_page(page)
+
+    pages = []
+    executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_ocr_worker) if workers > 1 else None
     try:
-        # PDF를 이미지로 변환
-        images = convert_from_path(pdf_path)
+        for offset in range(0, len(page_numbers), window):
+            with tempfile.TemporaryDirectory(prefix="ocr_pages_") as tmp_dir:
+                page_images = _render_pages(pdf_path, page_numbers[offset:offset + window], tmp_dir, OCR_LOW_DPI)
+                window_pages = {
+                    page["page"]: page
+                    for page in _ocr_window(executor, page_images, OCR_LOW_DPI, on_first_pass, preprocess)
+                }
 
-        for i, image in enumerate(images):
-            # 각 이미지에 대해 OCR 수행
-            text = pytesseract.image_to_string(image, lang='kor+eng') # 한국어 및 영어 OCR
-            extracted_text_pages.append(f"--- Page {i+1} ---\n{text}")
+                retry_pages = [n for n, page in window_pages.items() if adaptive and _needs_high_dpi(page)]
+                if retry_pages:
+                    rerendered.extend(retry_pages)
 
+                    def on_second_pass(page: dict) -> None:
+                        first = window_pages[page["page"]]
+                        page["seconds"] += first["seconds"]
+                        page["preprocess_seconds"] += first["preprocess_seconds"]
+                        # 고해상도 결과가 오히려 신뢰도가 낮으면 저해상도 결과를 유지
+                        if (page["confidence"] or 0) < (first["confidence"] or 0):
+                            first["seconds"] = page["seconds"]
+                            first["preprocess_seconds"] = page["preprocess_seconds"]
+                            page = first
+                        window_pages[page["page"]] = page
+                        if on_page is not None:
+                            on_page(page)
+
+                    page_images = _render_pages(pdf_path, retry_pages, tmp_dir, OCR_HIGH_DPI)
+                    _ocr_window(executor, page_images, OCR_HIGH_DPI, on_second_pass, preprocess)
+
+                pages.extend(window_pages[n] for n in sorted(window_pages))
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    if stats is not None:
+        stats["dpi"] = {"low": OCR_LOW_DPI, "high": OCR_HIGH_DPI if adaptive else None,
+                        "min_confidence": OCR_MIN_CONFIDENCE}
+        stats["rerendered_pages"] = rerendered
+        stats["preprocess"] = preprocess
+        stats["preprocess_seconds"] = sum(page["preprocess_seconds"] for page in pages)
+    if adaptive:
+        print(f"OCR DEBUG: {len(rerendered)}/{len(pages)} pages re-rendered at {OCR_HIGH_DPI} DPI")
+    return pages
+
+
+def _is_usable_text_layer(text: Optional[str]) -> bool:
+    """
+    PDF 텍스트 레이어가 OCR 없이 사용할 만한 품질인지 판단하는 함수.
+    글자 수가 너무 적거나, 한글/영문/숫자 비율이 낮은(깨진 인코딩, (cid:..) 등) 경우 OCR 대상입니다.
+    """
+    if not text:
+        return False
+    visible = re.sub(r"\s+", "", text)
+    if len(visible) < TEXT_LAYER_MIN_CHARS or "(cid:" in visible or "\ufffd" in visible:
+        return False
+    meaningful = len(re.findall(r"[0-9A-Za-z\uac00-\ud7a3]", visible))
+    return meaningful / len(visible) >= TEXT_LAYER_MIN_QUALITY
+
+
+def extract_text_layer(pdf_path: str) -> List[dict]:
+    """
+    PyPDF2로 각 페이지의 내장 텍스트 레이어를 추출하는 함수.
+    결과는 {"page", "text", "method": "text_layer", "seconds"} 딕셔너리 리스트입니다.
+    """
+    pages = []
+    reader = PdfReader(pdf_path)
+    for i, page in enumerate(reader.pages):
+        started = time.perf_counter()
+        try:
+            text = page.extract_text() or ""
+        except Exception as e:
+            print(f"Text layer extraction failed on page {i+1}: {e}")
+            text = ""
+        pages.append({"page": i + 1, "text": text, "method": "text_layer", "confidence": None,
+                      "seconds": time.perf_counter() - started})
+    return pages
+
+
+def extract_pdf_pages(pdf_path: str, max_workers: Optional[int] = None,
+                      window_size: Optional[int] = None, stats: Optional[dict] = None,
+                      progress_callback: Optional[Callable[[dict], None]] = None,
+                      preprocess: Optional[bool] = None) -> List[dict]:
+    """
+    텍스트 레이어를 먼저 확인하고, 텍스트가 없거나 품질이 낮은 페이지만 OCR하는 하이브리드 추출 함수.
+    각 페이지의 method는 "text_layer", "ocr", "none"(추출 실패) 중 하나입니다.
+    같은 PDF(파일 해시)와 같은 OCR 설정으로 이미 추출한 적이 있으면 캐시된 결과를 그대로 반환합니다.
+    progress_callback은 페이지 하나가 끝날 때마다 {"page", "method", "done", "total"}로 호출됩니다.
+    """
+    if preprocess is None:
+        preprocess = OCR_PREPROCESS
+    progress = {"done": 0, "total": 0}
+
+    def report(page: dict) -> None:
+        progress["done"] += 1
+        if progress_callback is None:
+            return
+        try:
+            progress_callback({"page": page["page"], "method": page["method"],
+                               "done": progress["done"], "total": progress["total"]})
+        except Exception as e:
+            # 진행 상황 전달 실패가 OCR 자체를 중단시키지 않도록 함
+            print(f"Progress callback failed: {e}")
+
+    cache_key = None
+    if OCR_CACHE is not None:
+        cache_key = DiskCache.make_key(
+            "document", _file_sha256(pdf_path), _ocr_settings(),
+            {"min_chars": TEXT_LAYER_MIN_CHARS, "min_quality": TEXT_LAYER_MIN_QUALITY},
+            {"low_dpi": OCR_LOW_DPI, "high_dpi": OCR_HIGH_DPI, "min_confidence": OCR_MIN_CONFIDENCE},
+            {"preprocess": preprocess}
+        )
+        cached_pages = OCR_CACHE.get(cache_key)
+        if cached_pages is not None:
+            print(f"OCR DEBUG: document cache hit for {pdf_path}")
+            progress["total"] = len(cached_pages)
+            for page in cached_pages:
+                page["cached"] = True
+                report(page)
+            return cached_pages
+
+    ocr_failed = False
+    try:
+        layer_pages = extract_text_layer(pdf_path)
     except Exception as e:
-        print(f"Error during OCR processing (image conversion/tesseract): {e}")
-        # OCR 실패 시, PyPDF2를 사용하여 텍스트 기반 PDF에서 텍스트 추출 시도
+        print(f"Text layer extraction failed: {e}")
+        layer_pages = []
+
+    ocr_targets = [p["page"] for p in layer_pages if not _is_usable_text_layer(p["text"])]
+    progress["total"] = len(layer_pages)
+    for page in layer_pages:
+        if page["page"] not in ocr_targets:
+            report(page)
+
+    pages = {p["page"]: p for p in layer_pages}
+    if ocr_targets or not layer_pages:
         try:
-            reader = PdfReader(pdf_path)
-            for i, page in enumerate(reader.pages):
-                text = page.extract_text()
-                if text:
-                    extracted_text_pages.append(f"--- Page {i+1} (Text Extraction) ---\n{text}")
-                else:
-                    extracted_text_pages.append(f"--- Page {i+1} (No Text Extracted) ---\n")
-        except Exception as e_fallback:
-            print(f"Fallback text extraction failed: {e_fallback}")
-            return "" # 모든 시도 실패 시 빈 문자열 반환
+            if not layer_pages:
+                # 텍스트 레이어를 읽지 못하면 전체 페이지 OCR
+                progress["total"] = pdfinfo_from_path(pdf_path)["Pages"]
+                ocr_targets = list(range(1, progress["total"] + 1))
+            for page in ocr_pdf_pages(pdf_path, max_workers=max_workers, window_size=window_size,
+                                      stats=stats, page_numbers=ocr_targets, on_page=report,
+                                      preprocess=preprocess):
+                pages[page["page"]] = page
+        except Exception as e:
+            print(f"Error during OCR processing (image conversion/tesseract): {e}")
+            if not layer_pages:
+                raise
+            ocr_failed = True
 
-    return "\n".join(extracted_text_pages)
+    result = []
+    for page_number in sorted(pages):
+        page = pages[page_number]
+        if not page["text"].strip():
+            page["method"] = "none"
+        result.append(page)
 
+    # OCR이 실패해 일부만 추출된 결과는 캐시하지 않음 (다음 요청에서 다시 시도)
+    if cache_key is not None and not ocr_failed:
+        OCR_CACHE.set(cache_key, [{k: v for k, v in page.items() if k != "cached"} for page in result])
+    return result
 
-def parse_questions_from_text(text: str) -> list:
+
+def format_page(page: dict) -> str:
+    """페이지 결과를 기존 '--- Page N ---' 텍스트 형식으로 변환하는 함수."""
+    if page["method"] == "text_layer":
+        return f"--- Page {page['page']} (Text Extraction) ---\n{page['text']}"
+    if page["method"] == "none":
+        return f"--- Page {page['page']} (No Text Extracted) ---\n"
+    return f"--- Page {page['page']} ---\n{page['text']}"
+
+
+def format_pages(pages: List[dict]) -> str:
+    """페이지 결과 리스트를 하나의 문서 텍스트로 합치는 함수."""
+    return "\n".join(format_page(page) for page in pages)
+
+
+# '--- Page N ---' 형식으로 저장된 기존 문서 텍스트를 페이지로 나누기 위한 패턴
+PAGE_HEADER_PATTERN = re.compile(r"^--- Page (\d+)(?: \((Text Extraction|No Text Extracted)\))? ---$", re.MULTILINE)
+
+
+def split_formatted_text(text: str) -> List[dict]:
     """
-    Anthropic Claude를 사용하여 텍스트에서 문제와 보기를 파싱하는 함수.
+    format_pages로 만든 문서 텍스트를 다시 {"page", "text", "method"} 리스트로 나누는 함수.
+    페이지 머리말이 없는 텍스트는 1페이지짜리 문서로 취급합니다.
     """
-    if not client:
-        print("Error: Anthropic client is not configured.")
+    headers = list(PAGE_HEADER_PATTERN.finditer(text or ""))
+    if not headers:
+        return [{"page": 1, "text": text, "method": "ocr"}] if text and text.strip() else []
+
+    method_by_label = {"Text Extraction": "text_layer", "No Text Extracted": "none", None: "ocr"}
+    pages = []
+    for i, header in enumerate(headers):
+        body_end = headers[i + 1].start() if i + 1 < len(headers) else len(text)
+        body = text[header.end():body_end]
+        if body.startswith("\n"):
+            body = body[1:]
+        if i + 1 < len(headers) and body.endswith("\n"):
+            body = body[:-1]  # format_pages가 페이지 사이에 넣은 줄바꿈 제거
+        pages.append({"page": int(header.group(1)), "text": body, "method": method_by_label[header.group(2)]})
+    return pages
+
+
+def process_pdf_for_pages(pdf_path: str, max_workers: Optional[int] = None,
+                          window_size: Optional[int] = None, stats: Optional[dict] = None,
+                          progress_callback: Optional[Callable[[dict], None]] = None,
+                          preprocess: Optional[bool] = None) -> List[dict]:
+    """
+    PDF 파일에서 페이지별 텍스트를 추출하는 함수.
+
+    텍스트 레이어가 충분한 페이지는 PyPDF2로 바로 읽고, 나머지 페이지만 OCR합니다.
+    OCR 대상 페이지는 window_size(기본값: OCR_PAGE_WINDOW)페이지씩 래스터화되어
+    max_workers(기본값: OCR_WORKERS 환경 변수)개의 프로세스에서 병렬로 OCR됩니다.
+    stats 딕셔너리를 넘기면 워커 수, 윈도우 크기, 전체 소요 시간, 페이지별 추출 방식과 소요 시간,
+    캐시 적중 페이지 수(cache_hits), 페이지별 OCR 신뢰도와 신뢰도가 낮은 페이지(low_confidence_pages)가 기록됩니다.
+    progress_callback을 넘기면 페이지가 끝날 때마다 진행 상황이 전달됩니다.
+    preprocess로 문서별 OCR 전 이미지 전처리 여부를 지정합니다(None이면 OCR_PREPROCESS 설정).
+    결과는 페이지 순서대로 정렬된 {"page", "text", "method", "confidence", "seconds"} 딕셔너리 리스트입니다.
+    텍스트 레이어에서 읽은 페이지의 confidence는 None입니다.
+    """
+    if not os.path.exists(pdf_path):
+        print(f"Error: PDF file not found at {pdf_path}")
         return []
 
+    print(f"Processing PDF for OCR: {pdf_path}")
+    started = time.perf_counter()
+
     try:
-        prompt = (
-            f"Human: 당신은 주어진 텍스트에서 객관식 문제와 그에 따른 보기, 정답을 정확하게 추출하여 JSON 형식으로 만드는 전문가입니다.\n\n"
-            f"다음 규칙에 따라 텍스트에서 문제 정보를 추출해 주세요:\n"
-            f"1.  문제는 일반적으로 숫자로 시작합니다 (예: `1.`, `2.`).\n"
-            f"2.  보기는 일반적으로 원 문자 또는 괄호 숫자로 시작합니다 (예: `①`, `②`, `③`, `④` 또는 `1)`, `2)`, `3)`, `4)`).\n"
-            f"3.  정답은 텍스트 내에 `정답: ①` 또는 `답: 1` 과 같은 명시적인 표시가 있을 수 있습니다. 이 표시를 찾아 `is_correct` 필드를 `true`로 설정해야 합니다.\n"
-            f"4.  만약 명시적인 정답 표시를 찾을 수 없다면, 그 문제는 추출하지 마세요.\n"
-            f"5.  객관식 보기가 4개 미만인 문제, 또는 문제로 보기 어려운 텍스트는 결과에 포함하지 마세요.\n"
-            f"6.  추출된 각 문제는 `question_text` 필드를 가져야 합니다.\n"
-            f"7.  추출된 각 보기는 `option_text` (보기 내용)와 `is_correct` (정답 여부, boolean) 필드를 가져야 합니다.\n"
-            f"8.  최종 결과는 반드시 아래 예시와 동일한 `questions` 키를 가진 JSON 객체 안에 리스트 형태로 반환해야 합니다. 다른 어떤 텍스트도 추가하지 마세요.\n\n"
-            f"**JSON 출력 형식 예시:**\n"
-            f"```json\n{{\n  \"questions\": [\n    {{\n      \"question_text\": \"여기에 첫 번째 문제의 내용이 들어갑니다.\",\n      \"options\": [\n        {{\"option_text\": \"첫 번째 보기 내용\", \"is_correct\": false}},\n        {{\"option_text\": \"두 번째 보기 내용(이것이 정답)\", \"is_correct\": true}},\n        {{\"option_text\": \"세 번째 보기 내용\", \"is_correct\": false}},\n        {{\"option_text\": \"네 번째 보기 내용\", \"is_correct\": false}}\n      ]\n    }},\n    {{\n      \"question_text\": \"여기에 두 번째 문제의 내용이 들어갑니다.\",\n      \"options\": [\n        {{\"option_text\": \"보기 A\", \"is_correct\": false}},\n        {{\"option_text\": \"보기 B\", \"is_correct\": false}},\n        {{\"option_text\": \"보기 C(이것이 정답)\", \"is_correct\": true}},\n        {{\"option_text\": \"보기 D\", \"is_correct\": false}}\n      ]\n    }}\n  ]\n}}\n```\n\n"
-            f"**추출할 원본 텍스트:**\n"
-            f"---\n{text}\n---\n\n"
-            f"Assistant:\n"
-            f"```json\n"
+        pages = extract_pdf_pages(pdf_path, max_workers=max_workers, window_size=window_size, stats=stats,
+                                  progress_callback=progress_callback, preprocess=preprocess)
+    except Exception as e:
+        print(f"Text extraction failed: {e}")
+        return [] # 모든 시도 실패 시 빈 리스트 반환
+
+    total_seconds = time.perf_counter() - started
+    method_counts = {}
+    for page in pages:
+        method_counts[page["method"]] = method_counts.get(page["method"], 0) + 1
+    cache_hits = sum(1 for page in pages if page.get("cached"))
+    print(f"OCR DEBUG: {len(pages)} pages in {total_seconds:.2f}s {method_counts}, cache hits: {cache_hits}")
+    if stats is not None:
+        stats["total_seconds"] = total_seconds
+        stats["method_counts"] = method_counts
+        stats["cache_hits"] = cache_hits
+        stats["low_confidence_pages"] = low_confidence_pages(pages)
+        stats["pages"] = [
+            {"page": p["page"], "method": p["method"], "confidence": p.get("confidence"), "dpi": p.get("dpi"),
+             "seconds": p["seconds"], "cached": p.get("cached", False)}
+            for p in pages
+        ]
+
+    return pages
+
+
+def process_pdf_for_text(pdf_path: str, max_workers: Optional[int] = None,
+                         window_size: Optional[int] = None, stats: Optional[dict] = None,
+                         progress_callback: Optional[Callable[[dict], None]] = None,
+                         preprocess: Optional[bool] = None) -> str:
+    """
+    PDF 파일에서 텍스트를 추출해 '--- Page N ---' 형식의 하나의 문자열로 반환하는 함수.
+    인자는 process_pdf_for_pages와 같습니다.
+    """
+    pages = process_pdf_for_pages(pdf_path, max_workers=max_workers, window_size=window_size,
+                                  stats=stats, progress_callback=progress_callback, preprocess=preprocess)
+    return format_pages(pages)
+
+
+def _build_parse_prompt(text: str, low_confidence_pages: Optional[List[int]] = None,
+                        continued: bool = False) -> str:
+    """
+    문제 파싱 프롬프트를 만드는 함수.
+    low_confidence_pages로 OCR 신뢰도가 낮은 페이지 번호를 넘기면, 해당 페이지의 오인식을
+    문맥에 맞게 보정하도록 안내합니다. continued는 텍스트가 문서 중간에서 시작하는 윈도우인지 여부입니다.
+    """
+    notes = []
+    if low_confidence_pages:
+        pages = ", ".join(str(n) for n in low_confidence_pages)
+        notes.append(
+            f"다음 페이지는 OCR 인식 신뢰도가 낮아 글자가 잘못 인식되었을 수 있습니다: {pages}페이지. "
+            f"이 페이지의 문제는 문맥에 맞게 명백한 오탈자를 바로잡아 추출하세요."
         )
+    if continued:
+        notes.append("텍스트 맨 앞이 이전 페이지에서 이어지는 문제의 뒷부분이라면(문제 번호 없이 시작) 그 부분은 건너뛰세요.")
+    extra_rules = "".join(f"{i}.  {note}\n" for i, note in enumerate(notes, start=9))
+
+    prompt = (
+        f"Human: 당신은 주어진 텍스트에서 객관식 문제와 그에 따른 보기, 정답을 정확하게 추출하여 JSON 형식으로 만드는 전문가입니다.\n\n"
+        f"다음 규칙에 따라 텍스트에서 문제 정보를 추출해 주세요:\n"
+        f"1.  문제는 일반적으로 숫자로 시작합니다 (예: `1.`, `2.`).\n"
+        f"2.  보기는 일반적으로 원 문자 또는 괄호 숫자로 시작합니다 (예: `①`, `②`, `③`, `④` 또는 `1)`, `2)`, `3)`, `4)`).\n"
+        f"3.  정답은 텍스트 내에 `정답: ①` 또는 `답: 1` 과 같은 명시적인 표시가 있을 수 있습니다. 이 표시를 찾아 `is_correct` 필드를 `true`로 설정해야 합니다.\n"
+        f"4.  만약 명시적인 정답 표시를 찾을 수 없다면, 그 문제는 추출하지 마세요.\n"
+        f"5.  객관식 보기가 4개 미만인 문제, 또는 문제로 보기 어려운 텍스트는 결과에 포함하지 마세요.\n"
+        f"6.  추출된 각 문제는 `question_text` 필드를 가져야 합니다.\n"
+        f"7.  추출된 각 보기는 `option_text` (보기 내용)와 `is_correct` (정답 여부, boolean) 필드를 가져야 합니다.\n"
+        f"8.  최종 결과는 반드시 아래 예시와 동일한 `questions` 키를 가진 JSON 객체 안에 리스트 형태로 반환해야 합니다. 다른 어떤 텍스트도 추가하지 마세요.\n"
+        f"{extra_rules}\n"
+        f"**JSON 출력 형식 예시:**\n"
+        f"```json\n{{\n  \"questions\": [\n    {{\n      \"question_text\": \"여기에 첫 번째 문제의 내용이 들어갑니다.\",\n      \"options\": [\n        {{\"option_text\": \"첫 번째 보기 내용\", \"is_correct\": false}},\n        {{\"option_text\": \"두 번째 보기 내용(이것이 정답)\", \"is_correct\": true}},\n        {{\"option_text\": \"세 번째 보기 내용\", \"is_correct\": false}},\n        {{\"option_text\": \"네 번째 보기 내용\", \"is_correct\": false}}\n      ]\n    }},\n    {{\n      \"question_text\": \"여기에 두 번째 문제의 내용이 들어갑니다.\",\n      \"options\": [\n        {{\"option_text\": \"보기 A\", \"is_correct\": false}},\n        {{\"option_text\": \"보기 B\", \"is_correct\": false}},\n        {{\"option_text\": \"보기 C(이것이 정답)\", \"is_correct\": true}},\n        {{\"option_text\": \"보기 D\", \"is_correct\": false}}\n      ]\n    }}\n  ]\n}}\n```\n\n"
+        f"**추출할 원본 텍스트:**\n"
+        f"---\n{text}\n---\n\n"
+        f"Assistant:\n"
+        f"```json\n"
+    )
+    return prompt
+
+
+def expected_parse_output(pages: List[dict]) -> int:
+    """페이지들을 파싱한 JSON 응답의 예상 출력 토큰 수."""
+    return int(estimate_tokens(format_pages(pages)) * LLM_PARSE_OUTPUT_RATIO)
+
+
+def _split_oversized_pages(pages: List[dict], output_budget: int) -> List[dict]:
+    """예상 출력이 한 요청에 들어가지 않는 페이지를 줄 경계에서 여러 조각(같은 페이지 번호)으로 나누는 함수."""
+    result = []
+    for page in pages:
+        if expected_parse_output([page]) <= output_budget:
+            result.append(page)
+            continue
+        # 조각마다 붙는 페이지 머리말까지 예산에 넣어 조각 하나의 예상 출력이 output_budget을 넘지 않게 함
+        header = estimate_tokens(format_page({**page, "text": ""})) + 1
+        parts = split_text(page.get("text") or "", max(1, int(output_budget / LLM_PARSE_OUTPUT_RATIO) - header))
+        print(f"OCR DEBUG: page {page['page']} is too long for one parse request, splitting into {len(parts)} parts")
+        result.extend({**page, "text": part} for part in parts)
+    return result
+
 
-        message = client.messages.create(
-            model="claude-3-5-sonnet-20240620",  # 최신 Claude 모델
-            max_tokens=4096,
+def parse_windows(pages: List[dict]) -> List[List[dict]]:
+    """
+    페이지 목록을 파싱 요청 단위의 윈도우로 나누는 함수.
+    윈도우는 최대 LLM_PARSE_WINDOW_PAGES 페이지이면서 예상 출력(expected_parse_output)이 모델의 최대 출력에
+    들어가는 만큼의 페이지를 담고, 다음 윈도우와 LLM_PARSE_OVERLAP_PAGES 페이지가 겹칩니다.
+    페이지는 예산의 1/(겹침 + 1)을 넘으면 미리 조각으로 나누므로, 밀도가 높은 페이지만 있어도 겹치는 조각과 새 조각이
+    한 윈도우에 함께 들어가 페이지 경계에 걸친 문제가 어느 윈도우에서든 온전히 보이고, 응답이 max_tokens에서 잘리는
+    요청도 보내지 않습니다. 겹침과 윈도우 크기는 이 조각 단위로 셉니다.
+    """
+    budget = max_expected_output(PARSE_MODEL)
+    overlap = max(0, LLM_PARSE_OVERLAP_PAGES)
+    pages = _split_oversized_pages(pages, budget // (overlap + 1))
+    size = max(1, LLM_PARSE_WINDOW_PAGES)
+    windows = []
+    start = 0
+    while start < len(pages):
+        end = start + 1
+        while end < len(pages) and end - start < size and expected_parse_output(pages[start:end + 1]) <= budget:
+            end += 1
+        windows.append(pages[start:end])
+        if end >= len(pages):
+            break
+        start = max(end - overlap, start + 1)
+    return windows
+
+
+async def _parse_window(pages: List[dict], low_confidence_pages: Optional[List[int]], continued: bool,
+                        on_question: Optional[Callable[[dict], None]] = None) -> list:
+    """
+    한 윈도우의 페이지들을 Claude로 파싱하는 함수. max_tokens는 윈도우의 예상 출력에 맞춰 정합니다.
+    응답은 스트리밍으로 받아 문제 객체가 닫히는 즉시 on_question(문제)을 호출하므로(JSONArrayStream),
+    응답이 잘리거나 중간에 끊겨도 그때까지 도착한 문제는 남습니다. 응답이 max_tokens에서 잘리면 윈도우를 반으로 나눠
+    다시 파싱하므로 토큰 한도 때문에 뒤쪽 문제가 누락되지 않습니다 (앞서 받은 문제와의 중복은 QuestionMerger가 제거).
+    """
+    window_pages = {page["page"] for page in pages}
+    prompt = _build_parse_prompt(
+        format_pages(pages),
+        [n for n in (low_confidence_pages or []) if n in window_pages],
+        continued
+    )
+    parser = JSONArrayStream()
+    questions = []
+    message = {}
+    try:
+        async for text in stream_message(
+            "parse",
+            model=PARSE_MODEL,
+            max_tokens=output_max_tokens(PARSE_MODEL, expected_parse_output(pages)),
             temperature=0.3,  # 낮은 온도로 더 일관된 결과 생성
+            priority="background",  # 업로드된 PDF 파싱은 사용자가 기다리는 해설 요청에 자리를 양보
             messages=[
                 {
                     "role": "user",
                     "content": prompt
                 }
-            ]
+            ],
+            result=message
+        ):
+            for question in parser.feed(text):
+                questions.append(question)
+                if on_question:
+                    on_question(question)
+    except Exception as e:
+        if not questions:
+            raise
+        print(f"OCR DEBUG: parse stream for pages {pages[0]['page']}-{pages[-1]['page']} failed "
+              f"after {len(questions)} questions, keeping them: {e}")
+        return questions
+    if not message:
+        return []  # 개발 모드에서 캐시에 없는 윈도우
+
+    if message["stop_reason"] == "max_tokens" and len(pages) > 1:
+        # 앞쪽 절반과, 경계 페이지를 한 장 겹친 뒤쪽 절반으로 나눠 다시 파싱
+        half = len(pages) // 2
+        print(f"OCR DEBUG: parse output truncated for pages {pages[0]['page']}-{pages[-1]['page']} "
+              f"after {len(questions)} questions, splitting window")
+        first, second = await asyncio.gather(
+            _parse_window(pages[:half], low_confidence_pages, continued, on_question),
+            _parse_window(pages[max(half - 1, 1):], low_confidence_pages, True, on_question)
         )
+        return questions + first + second
 
-        response_text = message.content[0].text
-        try:
-            # 응답 텍스트에서 가장 먼저 나오는 '{'와 가장 마지막의 '}'를 찾아 JSON을 파싱
-            start_index = response_text.find(chr(123))
-            end_index = response_text.rfind(chr(125)) + 1
-            if start_index != -1 and end_index != 0:
-                json_string = response_text[start_index:end_index]
-                parsed_result = json.loads(json_string)
-                return parsed_result.get("questions", [])
-            else:
-                raise ValueError("No JSON object found in Claude's response.")
-        except (ValueError, json.JSONDecodeError) as e:
-            print(f"Error parsing JSON from Anthropic response: {e}")
-            print(f"Received content: {response_text}")
-            return []
+    if message["stop_reason"] == "max_tokens":
+        print(f"OCR DEBUG: parse output truncated for page {pages[0]['page']}, keeping {len(questions)} questions")
+    elif not questions and (parser.skipped or not parser.done):
+        print(f"Error parsing JSON from Anthropic response ({parser.skipped} unreadable questions)")
+        print(f"Received content: {message['text']}")
+    return questions
 
 
-    except Exception as e:
-        print(f"An error occurred during Anthropic API call: {e}")
+def _question_key(question: dict) -> str:
+    """
+    중복 판단용 문제 키: 앞의 문제 번호를 뗀 문제 내용과 보기 내용을 이어 붙이고 공백, 문장 부호를 제거한 문자열.
+    ("다음 중 옳은 것은?"처럼 발문이 같은 서로 다른 문제를 구분하기 위해 보기까지 포함합니다.)
+    """
+    text = re.sub(r"^\s*\d+\s*[.)]", "", question.get("question_text") or "")
+    text += "".join(option.get("option_text") or "" for option in question.get("options") or [])
+    return re.sub(r"[\W_]+", "", text)
+
+
+class QuestionMerger:
+    """
+    파싱된 문제를 도착하는 순서대로 받아 중복을 제거하는 클래스.
+    겹치는 페이지나 윈도우 경계에 걸친 문제는 여러 윈도우에서 중복(또는 잘린 채로) 추출되므로,
+    같은 문제(한쪽 내용이 다른 쪽에 포함되는 경우 포함)는 보기가 더 많고 내용이 더 긴 쪽 하나만 남깁니다.
+    """
+
+    def __init__(self):
+        self.questions = []
+        self.keys = []
+
+    def add(self, question: dict) -> Optional[int]:
+        """
+        문제를 추가하고 결과 목록에서의 위치를 반환하는 함수. 위치가 기존 길이와 같으면 새 문제,
+        작으면 그 자리의 문제를 더 나은 쪽으로 바꾼 것이며, 버려진 중복(또는 빈 문제)이면 None을 반환합니다.
+        """
+        key = _question_key(question)
+        if not key:
+            return None
+        for i, existing_key in enumerate(self.keys):
+            shorter, longer = sorted((key, existing_key), key=len)
+            if key == existing_key or (len(shorter) >= 10 and shorter in longer):
+                current = self.questions[i]
+                rank = (len(question.get("options") or []), len(key))
+                if rank > (len(current.get("options") or []), len(existing_key)):
+                    self.questions[i], self.keys[i] = question, key
+                    return i
+                return None
+        self.questions.append(question)
+        self.keys.append(key)
+        return len(self.questions) - 1
+
+
+def merge_parsed_questions(window_results: List[list]) -> List[dict]:
+    """윈도우별 파싱 결과를 문서 순서대로 합치며 중복을 제거하는 함수 (QuestionMerger 참고)."""
+    merger = QuestionMerger()
+    for questions in window_results:
+        for question in questions:
+            merger.add(question)
+    return merger.questions
+
+
+async def parse_questions_from_text_async(text: str, low_confidence_pages: Optional[List[int]] = None,
+                                         stats: Optional[dict] = None,
+                                         on_question: Optional[Callable[[int, dict], None]] = None) -> list:
+    """
+    Anthropic Claude를 사용하여 텍스트에서 문제와 보기를 파싱하는 함수.
+
+    '--- Page N ---' 형식의 문서 텍스트를 예상 출력 토큰에 맞춘 윈도우(최대 LLM_PARSE_WINDOW_PAGES 페이지,
+    LLM_PARSE_OVERLAP_PAGES 페이지 겹침, parse_windows 참고)로 나누어 최대 LLM_PARSE_CONCURRENCY개씩 동시에 파싱하고,
+    결과를 합쳐 중복을 제거합니다.
+    문서가 길어져도 응답 토큰 한도에 걸려 문제가 누락되지 않고, 소요 시간은 윈도우 하나 수준으로 유지됩니다.
+    low_confidence_pages로 OCR 신뢰도가 낮은 페이지 번호를 넘기면, 해당 페이지의 오인식을
+    문맥에 맞게 보정하도록 프롬프트에 안내합니다.
+    윈도우별 응답은 LLM 응답 캐시(llm_cache)를 거치므로 같은 문서를 다시 파싱하면 API를 호출하지 않고,
+    개발 모드(클라이언트 없음)에서도 캐시에 있는 윈도우는 파싱됩니다.
+    stats 딕셔너리를 넘기면 윈도우 수, 중복 제거 전후 문제 수, 소요 시간이 기록됩니다.
+    on_question(위치, 문제)을 넘기면 응답 스트림에서 문제가 닫히는 즉시 중복을 제거해 호출합니다. 위치는 도착 순서로
+    중복을 제거한 목록에서의 위치이며, 이미 알린 위치가 다시 오면 그 문제를 더 완전한 내용으로 바꾸라는 뜻입니다.
+    이 경우 반환값도 같은 도착 순서의 목록이므로 호출자가 저장한 문제와 일치합니다.
+    """
+    if not AI_ENABLED and LLM_CACHE is None:
+        print("Error: Anthropic client is not configured.")
+        return []
+
+    started = time.perf_counter()
+    pages = split_formatted_text(text)
+    if not pages:
         return []
+    windows = parse_windows(pages)
+    semaphore = asyncio.Semaphore(max(1, LLM_PARSE_CONCURRENCY))
+    merger = QuestionMerger()
 
+    def received(question: dict) -> None:
+        index = merger.add(question)
+        if index is not None:
+            on_question(index, merger.questions[index])
 
-    
+    async def parse(i: int, window: List[dict]) -> list:
+        async with semaphore:
+            try:
+                return await _parse_window(window, low_confidence_pages, i > 0,
+                                           received if on_question else None)
+            except Exception as e:
+                print(f"An error occurred during Anthropic API call (pages {window[0]['page']}-{window[-1]['page']}): {e}")
+                return []
+
+    window_results = await asyncio.gather(*(parse(i, window) for i, window in enumerate(windows)))
+
+    questions = merger.questions if on_question else merge_parsed_questions(window_results)
+    elapsed = time.perf_counter() - started
+    parsed_count = sum(len(result) for result in window_results)
+    print(f"OCR DEBUG: parsed {len(questions)} questions ({parsed_count} before merge) "
+          f"from {len(windows)} windows in {elapsed:.2f}s")
+    if stats is not None:
+        stats["windows"] = len(windows)
+        stats["questions_before_merge"] = parsed_count
+        stats["questions"] = len(questions)
+        stats["seconds"] = elapsed
+    return questions
+
+
+def parse_questions_from_text(text: str, low_confidence_pages: Optional[List[int]] = None,
+                              stats: Optional[dict] = None,
+                              on_question: Optional[Callable[[int, dict], None]] = None) -> list:
+    """
+    parse_questions_from_text_async의 동기 버전 (작업 워커 등 이벤트 루프 밖에서 사용).
+    on_question은 이 함수를 호출한 스레드에서 실행되므로 호출자의 DB 세션을 그대로 써도 됩니다.
+    """
+    return run_sync(parse_questions_from_text_async(text, low_confidence_pages, stats, on_question))
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+OCR/문제 파싱 작업 워커
+공유 데이터베이스의 processing_jobs 테이블에서 리스를 잡아 작업을 처리합니다.
+
+여러 머신에서 실행하면 처리량이 워커 수에 비례해 늘어납니다. 모든 워커는 API 서버와
+같은 DATABASE_URL과 같은 업로드 디렉토리(공유 스토리지)를 바라봐야 합니다.
+API 서버에서 JOB_WORKERS=0으로 설정하면 작업 처리는 전부 이 워커들이 맡습니다.
+
+사용법:
+    python ocr_worker.py --processes 4
+"""
+
+import argparse
+import multiprocessing
+import signal
+import time
+
+from ocr_jobs import claim_next_job, execute_claimed_job, make_worker_id, JOB_HANDLERS
+
+
+def worker_loop(poll_interval: float, job_types=None) -> None:
+    """작업을 하나씩 획득해 처리하고, 대기 중인 작업이 없으면 poll_interval초 쉬는 루프."""
+    from main import SessionLocal, ProcessingJob
+
+    worker_id = make_worker_id()
+    stopping = False
+
+    def request_stop(signum, frame):
+        # 진행 중인 작업은 끝까지 처리한 뒤 종료
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+
+    print(f"Worker {worker_id} started (job types: {job_types or 'all'})")
+    while not stopping:
+        db = SessionLocal()
+        try:
+            job_id = claim_next_job(db, ProcessingJob, worker_id, job_types=job_types)
+        except Exception as e:
+            print(f"Worker {worker_id} failed to claim a job: {e}")
+            job_id = None
+        finally:
+            db.close()
+
+        if job_id is None:
+            time.sleep(poll_interval)
+            continue
+        execute_claimed_job(job_id, worker_id)
+
+    print(f"Worker {worker_id} stopped")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AI Cert Platform OCR/parse job worker")
+    parser.add_argument("--processes", type=int, default=1, help="이 머신에서 실행할 워커 프로세스 수")
+    parser.add_argument("--poll-interval", type=float, default=2.0, help="대기 작업이 없을 때 조회 간격(초)")
+    parser.add_argument("--job-type", action="append", choices=sorted(JOB_HANDLERS),
+                        help="처리할 작업 유형 (여러 번 지정 가능, 기본값: 전체)")
+    args = parser.parse_args()
+
+    if args.processes <= 1:
+        worker_loop(args.poll_interval, args.job_type)
+        return
+
+    processes = [
+        multiprocessing.Process(target=worker_loop, args=(args.poll_interval, args.job_type))
+        for _ in range(args.processes)
+    ]
+    for process in processes:
+        process.start()
+
+    def forward_stop(signum, frame):
+        # 자식 워커에게 종료를 전달 (각 워커는 진행 중인 작업을 마친 뒤 종료)
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+
+    signal.signal(signal.SIGTERM, forward_stop)
+    signal.signal(signal.SIGINT, forward_stop)
+    for process in processes:
+        process.join()
+
+
+if __name__ == "__main__":
+    main()
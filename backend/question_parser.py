@@ -0,0 +1,356 @@
+import os
+import re
+import time
+from typing import Callable, List, Optional
+
+from ocr_processor import split_formatted_text, format_pages, parse_questions_from_text, parse_windows
+
+# 로컬 파서가 처리한 문제만큼 절약된 Claude 응답 시간을 추정할 때 쓰는 문제당 평균 생성 시간(초).
+# 같은 문서에서 LLM으로 넘긴 블록이 있으면 그 실측값을 대신 사용합니다.
+LLM_PARSE_SECONDS_PER_QUESTION = float(os.getenv("LLM_PARSE_SECONDS_PER_QUESTION", "2"))
+
+CIRCLED_NUMBERS = "①②③④⑤⑥⑦⑧⑨⑩"
+
+# 문제 시작: 줄 맨 앞의 "1." / "문 1." / "문제 1." (소수 "1.5"는 제외)
+QUESTION_START_PATTERN = re.compile(r"^[ \t]*(?:문제?[ \t]*)?(\d{1,3})[ \t]*[.．](?!\d)[ \t]*", re.MULTILINE)
+# 과목/교시 구분 줄: "제1과목 소프트웨어 설계", "2교시" (마지막 보기에 섞이지 않도록 제거)
+SECTION_HEADER_PATTERN = re.compile(r"^[ \t]*(?:제[ \t]*\d+[ \t]*(?:과목|교시|장|편)|\d+[ \t]*교시)\b.*$", re.MULTILINE)
+# 원 문자 보기: ① ~ ⑩ (한 줄에 여러 개가 있어도 됨)
+CIRCLED_OPTION_PATTERN = re.compile(f"[{CIRCLED_NUMBERS}]")
+# 줄 맨 앞의 괄호 숫자 보기: "1)" 또는 "(1)"
+NUMBERED_OPTION_PATTERN = re.compile(r"^[ \t]*\(?([1-9])\)[ \t]*", re.MULTILINE)
+# 정답 표시: "정답: ③", "[정답] 3", "답 : 3번"
+ANSWER_PATTERN = re.compile(
+    rf"(?:\[[ \t]*정[ \t]*답[ \t]*\]|정[ \t]*답|(?<![가-힣])답)[ \t]*[:：)]?[ \t]*([{CIRCLED_NUMBERS}]|\d{{1,2}})[ \t]*번?"
+)
+
+
+# 정답표(답안 페이지) 인식용 패턴
+# 번호-정답 쌍: "1-③", "1.③", "1) 3", "1③", "1 ③", "1|3" (숫자 정답은 구분 기호가 있어야 함)
+KEY_PAIR_PATTERN = re.compile(
+    rf"(\d{{1,3}})[ \t]*(?:[-–~.):|][ \t]*([{CIRCLED_NUMBERS}]|[1-9])(?!\d)|([{CIRCLED_NUMBERS}]))"
+)
+# 표 형식: 번호 행("번호 1 2 3 4 ...") 다음 줄에 정답 행("정답 ③ ① ④ ② ...")
+KEY_NUMBER_ROW_PATTERN = re.compile(r"^[ \t|]*(?:번호|문항|문제|No\.?)?[ \t]*[:：|]?[ \t]*((?:\d{1,3}[ \t|]+){3,}\d{1,3})[ \t|]*$")
+KEY_ANSWER_ROW_PATTERN = re.compile(rf"^[ \t|]*(?:정[ \t]*답|답)?[ \t]*[:：|]?[ \t]*([{CIRCLED_NUMBERS}1-9 \t|]+)$")
+# 정답표 제목 줄: "정답", "빠른 정답표", "[정답 및 해설]", "답안"
+KEY_TITLE_PATTERN = re.compile(r"^[ \t]*[\[(<]?[ \t]*(?:빠른[ \t]*)?(?:정[ \t]*답|답[ \t]*안)(?:[ \t]*표|[ \t]*및[ \t]*해[ \t]*설)?[ \t]*[\])>]?[ \t]*$")
+# 정답표 줄 앞에 붙는 이름표: "정답:", "[정답]"
+KEY_LABEL_PATTERN = re.compile(r"^[ \t]*[\[(]?[ \t]*(?:빠른[ \t]*)?(?:정[ \t]*답|답[ \t]*안)(?:[ \t]*표)?[ \t]*[\])]?[ \t]*[:：]?")
+# 한 페이지에서 정답표로 인정할 최소 항목 수 (문제 본문 속 우연한 "1-③" 같은 표기를 걸러냄)
+ANSWER_KEY_MIN_ENTRIES = int(os.getenv("ANSWER_KEY_MIN_ENTRIES", "5"))
+
+
+def _clean(text: str) -> str:
+    """줄바꿈과 연속 공백을 공백 하나로 합치는 함수."""
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def _answer_index(token: str) -> int:
+    """정답 표시("③" 또는 "3")를 0부터 시작하는 보기 인덱스로 변환하는 함수."""
+    if token in CIRCLED_NUMBERS:
+        return CIRCLED_NUMBERS.index(token)
+    return int(token) - 1
+
+
+def _split_options(body: str) -> Optional[tuple]:
+    """
+    문제 본문을 (발문, [보기 내용...])으로 나누는 함수.
+    원 문자 보기(①②③④)를 우선 사용하고, 없으면 줄 맨 앞의 "1)" / "(1)" 보기를 사용합니다.
+    보기 번호가 1부터 차례대로 이어지지 않으면 None을 반환합니다.
+    """
+    markers = [(m.start(), m.end(), CIRCLED_NUMBERS.index(m.group())) for m in CIRCLED_OPTION_PATTERN.finditer(body)]
+    if not markers:
+        markers = [(m.start(), m.end(), int(m.group(1)) - 1) for m in NUMBERED_OPTION_PATTERN.finditer(body)]
+    if not markers or [index for _, _, index in markers] != list(range(len(markers))):
+        return None
+
+    stem = body[:markers[0][0]]
+    options = []
+    for i, (_, end, _) in enumerate(markers):
+        next_start = markers[i + 1][0] if i + 1 < len(markers) else len(body)
+        options.append(_clean(body[end:next_start]))
+    return _clean(stem), options
+
+
+def parse_question_block(block: str, key_answer: Optional[int] = None) -> dict:
+    """
+    문제 하나에 해당하는 텍스트 블록을 분석하는 함수.
+    key_answer는 정답표에서 찾은 이 문제의 정답(0부터 시작하는 보기 인덱스)으로, 본문에 정답 표시가 없을 때 사용합니다.
+    결과의 status는 다음 중 하나입니다:
+      - "parsed": 발문, 4개 이상의 보기, 보기 범위 안의 정답이 모두 확인됨 (question에 결과 포함)
+      - "no_answer": 발문과 보기는 확인됐지만 정답이 없음 (question에 is_correct가 모두 False인 결과 포함)
+      - "unparsed": 구조를 확신할 수 없음 (LLM으로 넘김)
+    answer_source는 정답의 출처("inline" 또는 "key")입니다.
+    """
+    answers = list(ANSWER_PATTERN.finditer(block))
+    if len(answers) > 1:
+        return {"status": "unparsed"}
+    body = block[:answers[0].start()] if answers else block
+
+    split = _split_options(body)
+    if split is None:
+        return {"status": "unparsed"}
+    stem, options = split
+    if not stem or len(options) < 4 or not all(options):
+        return {"status": "unparsed"}
+
+    question = {
+        "question_text": stem,
+        "options": [{"option_text": option, "is_correct": False} for option in options],
+    }
+    if answers:
+        answer, source = _answer_index(answers[0].group(1)), "inline"
+    elif key_answer is not None:
+        answer, source = key_answer, "key"
+    else:
+        return {"status": "no_answer", "question": question}
+
+    if not 0 <= answer < len(options):
+        return {"status": "unparsed"}
+    question["options"][answer]["is_correct"] = True
+    return {"status": "parsed", "question": question, "answer_source": source}
+
+
+def _key_pairs(line: str) -> Optional[list]:
+    """
+    줄 전체가 번호-정답 쌍으로만 이루어져 있으면 [(문제 번호, 보기 인덱스)]를 반환하는 함수.
+    쌍 사이의 공백, 쉼표, 세로줄, 슬래시 외에 다른 글자가 섞여 있으면 None입니다.
+    """
+    body = KEY_LABEL_PATTERN.sub("", line, count=1)
+    pairs = list(KEY_PAIR_PATTERN.finditer(body))
+    if not pairs or re.sub(r"[\s,|/]+", "", KEY_PAIR_PATTERN.sub("", body)):
+        return None
+    return [(int(m.group(1)), _answer_index(m.group(2) or m.group(3))) for m in pairs]
+
+
+def _key_table_rows(number_line: str, answer_line: str) -> Optional[list]:
+    """번호 행과 정답 행으로 이루어진 표 한 칸을 [(문제 번호, 보기 인덱스)]로 변환하는 함수."""
+    numbers_match = KEY_NUMBER_ROW_PATTERN.match(number_line)
+    answers_match = KEY_ANSWER_ROW_PATTERN.match(answer_line)
+    if not numbers_match or not answers_match:
+        return None
+    numbers = [int(n) for n in re.findall(r"\d+", numbers_match.group(1))]
+    if numbers != list(range(numbers[0], numbers[0] + len(numbers))):
+        return None
+    tokens = re.findall(rf"[{CIRCLED_NUMBERS}1-9]", answers_match.group(1))
+    if len(tokens) != len(numbers):
+        return None
+    return [(number, _answer_index(token)) for number, token in zip(numbers, tokens)]
+
+
+def find_answer_key(pages: List[dict]) -> dict:
+    """
+    정답표를 찾아 파싱하는 함수. 다음 형식을 인식합니다:
+      - 번호-정답 쌍이 나열된 줄: "1-③ 2-① 3-④", "1.③, 2.①", "1) 3  2) 1", 한 줄에 한 쌍씩 세로로 나열된 표
+      - 번호 행과 정답 행이 번갈아 나오는 가로 표: "번호 1 2 3 4 5" / "정답 ③ ① ④ ② ⑤"
+    한 페이지에서 ANSWER_KEY_MIN_ENTRIES개 이상 찾은 경우에만 정답표로 인정합니다.
+    {"entries": [(문제 번호, 보기 인덱스)] (문서 순서), "pages": {페이지 번호: 정답표 줄을 제거한 본문}}을 반환합니다.
+    """
+    entries = []
+    stripped_pages = {}
+    for page in pages:
+        lines = (page.get("text") or "").split("\n")
+        key_lines = set()
+        page_entries = []
+        i = 0
+        while i < len(lines):
+            pairs = _key_pairs(lines[i])
+            if pairs:
+                page_entries.extend(pairs)
+                key_lines.add(i)
+                i += 1
+                continue
+            # 번호 행 다음의 빈 줄은 건너뛰고 정답 행을 찾음
+            j = i + 1
+            while j < len(lines) and not lines[j].strip():
+                j += 1
+            rows = _key_table_rows(lines[i], lines[j]) if j < len(lines) else None
+            if rows:
+                page_entries.extend(rows)
+                key_lines.update((i, j))
+                i = j + 1
+                continue
+            i += 1
+
+        if len(page_entries) < ANSWER_KEY_MIN_ENTRIES:
+            continue
+        entries.extend(page_entries)
+        kept = [line for n, line in enumerate(lines) if n not in key_lines and not KEY_TITLE_PATTERN.match(line)]
+        stripped_pages[page["page"]] = "\n".join(kept)
+
+    return {"entries": entries, "pages": stripped_pages}
+
+
+def _key_answers(entries: list) -> dict:
+    """정답표 항목을 {(문제 번호, 같은 번호의 몇 번째 등장인지): 보기 인덱스}로 바꾸는 함수 (과목별로 번호가 다시 시작하는 경우 대응)."""
+    answers = {}
+    seen = {}
+    for number, answer in entries:
+        occurrence = seen.get(number, 0)
+        seen[number] = occurrence + 1
+        answers[(number, occurrence)] = answer
+    return answers
+
+
+def split_question_blocks(pages: List[dict]) -> tuple:
+    """
+    페이지 목록을 문제 번호 기준으로 블록들로 나누는 함수. 문제가 페이지 경계에 걸쳐 있어도 하나의 블록이 됩니다.
+    번호가 직전 문제의 다음 번호(또는 새 과목의 1번)가 아니면 문제 시작으로 보지 않고 본문의 일부로 취급합니다.
+    (머리말 텍스트, [{"number", "page", "text"}])를 반환합니다.
+    """
+    preamble = []
+    blocks = []
+    for page in pages:
+        text = SECTION_HEADER_PATTERN.sub("", page.get("text") or "")
+        position = 0
+        for match in QUESTION_START_PATTERN.finditer(text):
+            number = int(match.group(1))
+            expected = blocks[-1]["number"] + 1 if blocks else None
+            if expected is not None and number not in (expected, 1):
+                continue
+            chunk = text[position:match.start()]
+            if blocks:
+                blocks[-1]["text"] += chunk
+            else:
+                preamble.append(chunk)
+            blocks.append({"number": number, "page": page["page"], "text": ""})
+            position = match.end()
+        if blocks:
+            blocks[-1]["text"] += text[position:] + "\n"
+        else:
+            preamble.append(text[position:] + "\n")
+    return "".join(preamble), blocks
+
+
+def parse_questions_locally(pages: List[dict], low_confidence_pages: Optional[List[int]] = None) -> dict:
+    """
+    규칙 기반으로 문제를 추출하는 함수 (LLM 호출 없음).
+    문서에 정답표가 있으면 문제 번호로 연결해, 본문에 정답 표시가 없는 문제의 정답으로 사용합니다.
+    OCR 신뢰도가 낮은 페이지에서 시작하는 문제는 오탈자 보정을 위해 LLM으로 넘깁니다.
+    {"questions", "blocks", "leftovers", "unanswered", "preamble"}를 반환하며, leftovers는 LLM으로 넘길 블록 목록입니다.
+    unanswered는 발문과 보기는 확인됐지만 본문에도 정답표에도 정답이 없는 블록으로, LLM도 정답 없는 문제는
+    추출하지 않으므로(파싱 프롬프트 규칙 4) 넘기지 않고 따로 보고합니다.
+    """
+    uncertain = set(low_confidence_pages or [])
+    answer_key = find_answer_key(pages)
+    # 정답표 줄은 마지막 문제의 보기에 섞이지 않도록 제거한 뒤 문제 블록을 나눔
+    pages = [
+        dict(page, text=answer_key["pages"][page["page"]]) if page["page"] in answer_key["pages"] else page
+        for page in pages
+    ]
+    key_answers = _key_answers(answer_key["entries"])
+    preamble, blocks = split_question_blocks(pages)
+
+    questions = []
+    leftovers = []
+    unanswered = []
+    seen = {}
+    for block in blocks:
+        occurrence = seen.get(block["number"], 0)
+        seen[block["number"]] = occurrence + 1
+        block["key_answer"] = key_answers.get((block["number"], occurrence))
+
+        result = parse_question_block(block["text"], block["key_answer"])
+        block["status"] = result["status"]
+        block["answer_source"] = result.get("answer_source")
+        if result["status"] == "parsed" and block["page"] not in uncertain:
+            question = result["question"]
+            question.update(number=block["number"], page=block["page"])
+            questions.append(question)
+        elif result["status"] == "no_answer":
+            block["question"] = result["question"]
+            unanswered.append(block)
+        else:
+            if "question" in result:
+                block["question"] = result["question"]
+            leftovers.append(block)
+
+    return {"questions": questions, "blocks": blocks, "leftovers": leftovers, "unanswered": unanswered,
+            "preamble": preamble,
+            "answer_key_entries": len(answer_key["entries"])}
+
+
+def _leftover_text(blocks: List[dict]) -> str:
+    """
+    LLM으로 넘길 블록들을 시작 페이지별로 묶어 '--- Page N ---' 형식의 텍스트로 만드는 함수.
+    정답표에서 찾은 정답은 "정답:" 표시로 덧붙여, 정답 표시가 없는 문제도 LLM이 버리지 않게 합니다.
+    """
+    pages = {}
+    for block in blocks:
+        text = f"{block['number']}. {block['text'].strip()}"
+        if block.get("key_answer") is not None and not ANSWER_PATTERN.search(block["text"]) \
+                and block["key_answer"] < len(CIRCLED_NUMBERS):
+            text += f"\n정답: {CIRCLED_NUMBERS[block['key_answer']]}"
+        pages.setdefault(block["page"], []).append(text)
+    return format_pages([
+        {"page": page, "text": "\n\n".join(texts), "method": "ocr"}
+        for page, texts in sorted(pages.items())
+    ])
+
+
+def parse_document_questions(text: str, low_confidence_pages: Optional[List[int]] = None,
+                             stats: Optional[dict] = None,
+                             on_question: Optional[Callable[[int, dict], None]] = None) -> list:
+    """
+    문서 텍스트에서 문제를 추출하는 함수.
+    표준 형식(번호가 붙은 문제, ①②③④ 보기, "정답:" 표시 또는 정답표)의 문제는 로컬 규칙 파서로 바로 처리하고,
+    확신할 수 없는 블록(및 문제 번호가 없는 문서)만 parse_questions_from_text로 Claude에게 넘깁니다.
+    결과는 로컬에서 추출한 문제(문서 순서) 뒤에 LLM이 추출한 문제가 이어지는 리스트입니다.
+    stats 딕셔너리를 넘기면 로컬 처리 비율과 절약된 LLM 시간 추정치가 기록됩니다.
+    on_question(위치, 문제)을 넘기면 로컬 문제는 바로, LLM 문제는 응답 스트림에서 도착하는 즉시 결과 목록의 위치와 함께
+    호출합니다 (같은 위치가 다시 오면 교체, parse_questions_from_text_async 참고).
+    """
+    started = time.perf_counter()
+    pages = split_formatted_text(text)
+    local = parse_questions_locally(pages, low_confidence_pages)
+    local_seconds = time.perf_counter() - started
+    if on_question:
+        for i, question in enumerate(local["questions"]):
+            on_question(i, question)
+
+    if local["blocks"]:
+        llm_text = _leftover_text(local["leftovers"]) if local["leftovers"] else ""
+    else:
+        # 문제 번호를 하나도 찾지 못한 문서는 전체를 LLM으로 파싱
+        llm_text = text
+
+    llm_stats = {}
+    offset = len(local["questions"])
+    on_llm_question = (lambda index, question: on_question(offset + index, question)) if on_question else None
+    llm_questions = parse_questions_from_text(llm_text, low_confidence_pages=low_confidence_pages,
+                                              stats=llm_stats, on_question=on_llm_question) if llm_text.strip() else []
+    questions = local["questions"] + llm_questions
+
+    # 전체를 LLM으로 파싱했다면 필요했을 윈도우 수, 그리고 로컬에서 처리한 문제 수만큼의 생성 시간으로 절약량을 추정
+    full_windows = len(parse_windows(pages)) if pages else 0
+    used_windows = llm_stats.get("windows", 0)
+    total_blocks = len(local["blocks"])
+    llm_blocks = len(local["leftovers"]) if total_blocks else 0
+    seconds_per_question = (llm_stats["seconds"] / llm_blocks if llm_blocks and llm_stats.get("seconds")
+                            else LLM_PARSE_SECONDS_PER_QUESTION)
+    report = {
+        "blocks": total_blocks,
+        "local_questions": len(local["questions"]),
+        "answer_key_entries": local["answer_key_entries"],
+        "answers_from_key": sum(1 for block in local["blocks"] if block["answer_source"] == "key"),
+        "llm_blocks": llm_blocks,
+        "no_answer_blocks": len(local["unanswered"]),
+        "llm_questions": len(llm_questions),
+        "local_share": round(len(local["questions"]) / total_blocks, 3) if total_blocks else 0.0,
+        "local_seconds": local_seconds,
+        "llm_seconds": llm_stats.get("seconds", 0.0),
+        "llm_windows": used_windows,
+        "llm_windows_avoided": max(full_windows - used_windows, 0),
+        "estimated_llm_seconds_saved": len(local["questions"]) * seconds_per_question,
+    }
+    print(f"OCR DEBUG: local parser handled {report['local_questions']}/{total_blocks} question blocks "
+          f"in {local_seconds * 1000:.1f}ms, {len(local['unanswered'])} without an answer, "
+          f"{len(llm_questions)} questions from LLM, "
+          f"~{report['estimated_llm_seconds_saved']:.1f}s of LLM time saved")
+    if stats is not None:
+        stats.update(llm_stats)
+        stats.update(report)
+        stats["questions"] = len(questions)
+        stats["seconds"] = time.perf_counter() - started
+    return questions
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+LLM 헤징(hedged request) 벤치마크
+LLM 게이트웨이로 서로 다른 프롬프트를 보내 헤징을 끈 경우와 켠 경우의 응답 시간 분포(p50/p95/p99)와
+추가로 보낸 요청 수(헤징 비용)를 비교합니다. LLM 응답 캐시는 사용하지 않습니다.
+
+느린 꼬리 응답을 주입한 로컬 스텁 서버로 실행하세요 (API 비용 없음):
+    python -m scripts.stub_llm_provider --port 9999 --latency 1 --jitter 0.3 --slow-rate 0.05 --slow-latency 8
+
+사용법 (backend 디렉토리에서):
+    ANTHROPIC_API_KEY=sk-stub ANTHROPIC_BASE_URL=http://127.0.0.1:9999 \\
+        python -m scripts.bench_hedging --requests 200 --concurrency 4
+"""
+
+import os
+
+os.environ["LLM_CACHE_DIR"] = ""  # 캐시 적중 없이 매번 호출 (llm_cache를 불러오기 전에 설정)
+
+import argparse
+import asyncio
+import statistics
+import time
+import uuid
+
+import llm_client
+from llm_cache import create_message
+
+
+def percentile(values: list, pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+async def run(requests: int, concurrency: int, model: str, hedge: bool) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+    before = llm_client.llm_gateway_stats()
+
+    async def one(i: int) -> None:
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                await create_message("bench", model=model, max_tokens=50, hedge=hedge,
+                                     messages=[{"role": "user", "content": f"hedging benchmark {uuid.uuid4().hex} #{i}"}])
+            except Exception as e:
+                errors += 1
+                print(f"request {i} failed: {e}")
+                return
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    after = llm_client.llm_gateway_stats()
+    return {
+        "hedge": hedge,
+        "seconds": time.perf_counter() - started,
+        "p50": statistics.median(latencies) if latencies else 0.0,
+        "p95": percentile(latencies, 95) if latencies else 0.0,
+        "p99": percentile(latencies, 99) if latencies else 0.0,
+        "max": max(latencies) if latencies else 0.0,
+        "errors": errors,
+        "upstream_calls": after["calls"] - before["calls"],
+        "hedges": after["hedges"] - before["hedges"],
+        "hedge_wins": after["hedge_wins"] - before["hedge_wins"],
+        "budget_denied": after["hedge_budget_denied"] - before["hedge_budget_denied"],
+    }
+
+
+async def main_async(args) -> None:
+    if not llm_client.AI_ENABLED:
+        print("ANTHROPIC_API_KEY가 설정되지 않았습니다. 스텁 서버를 쓰려면 ANTHROPIC_BASE_URL도 함께 지정하세요.")
+        return
+    # 헤징 기준(p95)을 계산할 응답 시간 표본을 먼저 모음
+    await run(max(args.warmup, llm_client.LLM_HEDGE_MIN_SAMPLES), args.concurrency, args.model, hedge=False)
+    results = [await run(args.requests, args.concurrency, args.model, hedge=False),
+               await run(args.requests, args.concurrency, args.model, hedge=True)]
+    await llm_client.close_async_client()
+
+    print(f"\n{'hedge':<6} {'p50':>7} {'p95':>7} {'p99':>7} {'max':>7} {'calls':>6} {'hedges':>7} {'wins':>5} {'denied':>6} {'errors':>6}")
+    for result in results:
+        print(f"{'on' if result['hedge'] else 'off':<6} {result['p50']:>7.2f} {result['p95']:>7.2f} "
+              f"{result['p99']:>7.2f} {result['max']:>7.2f} {result['upstream_calls']:>6} "
+              f"{result['hedges']:>7} {result['hedge_wins']:>5} {result['budget_denied']:>6} {result['errors']:>6}")
+    latency = llm_client.llm_gateway_stats()["latency_by_model"].get(args.model)
+    print(f"\nobserved latency: {latency}, budget {llm_client.LLM_HEDGE_BUDGET_PERCENT}% "
+          f"at p{llm_client.LLM_HEDGE_PERCENTILE:g}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare LLM latency with and without hedged requests")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--warmup", type=int, default=40, help="헤징 기준 계산용으로 먼저 보낼 요청 수")
+    parser.add_argument("--model", default="claude-3-haiku-20240307")
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+OCR 엔진 벤치마크
+같은 PDF 페이지들을 pytesseract(페이지마다 프로세스 실행)와 tesserocr(상주 엔진)로 인식해
+초당 처리 페이지 수를 비교합니다. --preprocess를 지정하면 이미지 전처리를 켠 경우도 측정해
+전처리에 드는 페이지당 시간과 그로 인해 줄어든 OCR 시간을 함께 보여줍니다.
+OCR 캐시는 사용하지 않습니다.
+
+사용법 (backend 디렉토리에서):
+    python -m scripts.benchmark_ocr sample.pdf --pages 10
+    python -m scripts.benchmark_ocr sample.pdf --pages 10 --preprocess
+    python -m scripts.benchmark_ocr sample.pdf --pages 10 --workers 4
+"""
+
+import argparse
+import time
+
+from pdf2image import convert_from_path
+
+import ocr_processor
+
+
+def benchmark_engine(name: str, images: list, repeat: int, preprocess: bool = False) -> dict:
+    """단일 프로세스에서 엔진 하나로 모든 페이지를 repeat번 인식하는 함수. 전처리와 OCR 시간을 따로 잽니다."""
+    started = time.perf_counter()
+    engine = ocr_processor.create_ocr_engine(name)
+    init_seconds = time.perf_counter() - started
+
+    preprocess_seconds = 0.0
+    ocr_seconds = 0.0
+    chars = 0
+    confidences = []
+    for _ in range(repeat):
+        for image in images:
+            if preprocess:
+                started = time.perf_counter()
+                image = ocr_processor.preprocess_image(image)
+                preprocess_seconds += time.perf_counter() - started
+            started = time.perf_counter()
+            text, confidence = engine.recognize(image)
+            ocr_seconds += time.perf_counter() - started
+            chars += len(text)
+            if confidence is not None:
+                confidences.append(confidence)
+    pages = len(images) * repeat
+    elapsed = preprocess_seconds + ocr_seconds
+    return {
+        "engine": engine.name,
+        "preprocess": preprocess,
+        "init_seconds": init_seconds,
+        "pages": pages,
+        "seconds": elapsed,
+        "preprocess_ms": preprocess_seconds * 1000 / pages,
+        "ocr_ms": ocr_seconds * 1000 / pages,
+        "pages_per_second": pages / elapsed if elapsed else 0.0,
+        "chars": chars,
+        "confidence": sum(confidences) / len(confidences) if confidences else 0.0,
+    }
+
+
+def benchmark_pipeline(name: str, pdf_path: str, page_numbers: list, workers: int,
+                       preprocess: bool = False) -> dict:
+    """렌더링과 병렬 워커를 포함한 전체 OCR 파이프라인(ocr_pdf_pages)을 측정하는 함수."""
+    ocr_processor.OCR_ENGINE = name
+    ocr_processor._ocr_engine = None
+    stats = {}
+    started = time.perf_counter()
+    pages = ocr_processor.ocr_pdf_pages(pdf_path, max_workers=workers, stats=stats, page_numbers=page_numbers,
+                                        preprocess=preprocess)
+    elapsed = time.perf_counter() - started
+    return {
+        "engine": ocr_processor._engine_name(name),
+        "preprocess": preprocess,
+        "pages": len(pages),
+        "seconds": elapsed,
+        "pages_per_second": len(pages) / elapsed if elapsed else 0.0,
+        "rerendered": len(stats.get("rerendered_pages", [])),
+        "workers": stats.get("workers"),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare OCR engines (pages/second)")
+    parser.add_argument("pdf_path")
+    parser.add_argument("--pages", type=int, default=5, help="벤치마크에 사용할 앞쪽 페이지 수")
+    parser.add_argument("--repeat", type=int, default=1, help="단일 프로세스 측정 반복 횟수")
+    parser.add_argument("--workers", type=int, default=0, help="지정하면 병렬 파이프라인도 측정")
+    parser.add_argument("--engine", action="append", choices=["pytesseract", "tesserocr"],
+                        help="측정할 엔진 (기본값: 둘 다)")
+    parser.add_argument("--preprocess", action="store_true", help="이미지 전처리를 켠 경우도 함께 측정")
+    args = parser.parse_args()
+
+    engines = args.engine or ["pytesseract", "tesserocr"]
+    if "tesserocr" in engines and ocr_processor.tesserocr is None:
+        print("tesserocr is not installed, skipping it (pip install tesserocr)")
+        engines = [name for name in engines if name != "tesserocr"]
+    modes = [False, True] if args.preprocess else [False]
+
+    ocr_processor.OCR_CACHE = None
+    print(f"Rendering {args.pages} pages of {args.pdf_path}...")
+    images = convert_from_path(args.pdf_path, dpi=ocr_processor.OCR_LOW_DPI, first_page=1, last_page=args.pages)
+    page_numbers = list(range(1, len(images) + 1))
+
+    print(f"\nSingle process ({len(images)} pages x {args.repeat}, {ocr_processor.OCR_LOW_DPI} DPI)")
+    print(f"{'engine':<12} {'prep':<4} {'init(s)':>8} {'prep(ms)':>9} {'ocr(ms)':>8} {'pages/s':>8} "
+          f"{'chars':>8} {'conf':>6}")
+    for name in engines:
+        baseline = None
+        for preprocess in modes:
+            result = benchmark_engine(name, images, args.repeat, preprocess)
+            print(f"{result['engine']:<12} {'on' if preprocess else 'off':<4} {result['init_seconds']:>8.2f} "
+                  f"{result['preprocess_ms']:>9.1f} {result['ocr_ms']:>8.1f} {result['pages_per_second']:>8.2f} "
+                  f"{result['chars']:>8} {result['confidence']:>6.1f}")
+            if baseline is None:
+                baseline = result
+            else:
+                saved = baseline["ocr_ms"] - result["ocr_ms"]
+                print(f"{'':<12} preprocessing adds {result['preprocess_ms']:.1f} ms/page, "
+                      f"saves {saved:.1f} ms/page of OCR (net {saved - result['preprocess_ms']:+.1f} ms/page)")
+
+    if args.workers:
+        print(f"\nPipeline (ocr_pdf_pages, {args.workers} workers)")
+        print(f"{'engine':<12} {'prep':<4} {'total(s)':>9} {'pages/s':>8} {'re-OCR':>7}")
+        for name in engines:
+            for preprocess in modes:
+                result = benchmark_pipeline(name, args.pdf_path, page_numbers, args.workers, preprocess)
+                print(f"{result['engine']:<12} {'on' if preprocess else 'off':<4} {result['seconds']:>9.2f} "
+                      f"{result['pages_per_second']:>8.2f} {result['rerendered']:>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+해설 API 동시성 부하 테스트
+실행 중인 API 서버에 서로 다른 문제의 /explain 요청을 동시에 보내, 요청들이 직렬화되지 않고
+겹쳐서 처리되는지(전체 소요 시간 ≈ 가장 느린 요청 하나) 확인합니다. 부하 중에는 GET /를 계속 호출해
+이벤트 루프가 막히지 않는지(응답 지연)도 함께 측정합니다.
+
+LLM 응답 캐시에 이미 있는 해설은 바로 반환되므로, 실제 API 호출을 측정하려면 서버를
+LLM_CACHE_DIR= (캐시 비활성화)로 실행하세요.
+
+사용법 (backend 디렉토리에서, 서버 실행 중):
+    python -m scripts.load_test_explain --username admin --password secret --requests 8
+    python -m scripts.load_test_explain --username admin --password secret --requests 8 --sequential
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+
+async def login(client: httpx.AsyncClient, username: str, password: str) -> str:
+    response = await client.post("/token", data={"username": username, "password": password})
+    response.raise_for_status()
+    return response.json()["access_token"]
+
+
+async def explain(client: httpx.AsyncClient, question_id: int) -> dict:
+    started = time.perf_counter()
+    response = await client.post(f"/explain/{question_id}")
+    return {
+        "question_id": question_id,
+        "status": response.status_code,
+        "seconds": time.perf_counter() - started,
+    }
+
+
+async def probe_loop(client: httpx.AsyncClient, stop: asyncio.Event, latencies: list) -> None:
+    """부하 중 가벼운 엔드포인트를 반복 호출해 응답 지연을 기록하는 함수 (이벤트 루프가 막히면 크게 늘어남)."""
+    while not stop.is_set():
+        started = time.perf_counter()
+        try:
+            await client.get("/")
+            latencies.append(time.perf_counter() - started)
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(0.05)
+
+
+async def run(args) -> None:
+    limits = httpx.Limits(max_connections=args.requests + 2)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout, limits=limits) as client:
+        token = await login(client, args.username, args.password)
+        client.headers["Authorization"] = f"Bearer {token}"
+
+        questions = (await client.get("/questions", params={"limit": args.requests})).json()
+        question_ids = [question["id"] for question in questions]
+        if not question_ids:
+            print("No questions found - upload a PDF first")
+            return
+        print(f"Explaining {len(question_ids)} questions "
+              f"({'sequentially' if args.sequential else 'concurrently'}) against {args.base_url}")
+
+        stop = asyncio.Event()
+        probe_latencies = []
+        probe = asyncio.create_task(probe_loop(client, stop, probe_latencies))
+        started = time.perf_counter()
+        if args.sequential:
+            results = [await explain(client, question_id) for question_id in question_ids]
+        else:
+            results = await asyncio.gather(*(explain(client, question_id) for question_id in question_ids))
+        elapsed = time.perf_counter() - started
+        stop.set()
+        await probe
+
+    print(f"\n{'question':>9} {'status':>7} {'seconds':>8}")
+    for result in results:
+        print(f"{result['question_id']:>9} {result['status']:>7} {result['seconds']:>8.2f}")
+
+    latencies = [result["seconds"] for result in results]
+    total = sum(latencies)
+    print(f"\nWall time:          {elapsed:.2f}s")
+    print(f"Sum of latencies:   {total:.2f}s (slowest {max(latencies):.2f}s, "
+          f"median {statistics.median(latencies):.2f}s)")
+    # 직렬화되면 1.0에 가깝고, 완전히 겹치면 요청 수에 가까워집니다.
+    print(f"Overlap factor:     {total / elapsed if elapsed else 0.0:.1f}x")
+    if probe_latencies:
+        print(f"GET / during load:  {len(probe_latencies)} probes, max {max(probe_latencies) * 1000:.0f} ms, "
+              f"median {statistics.median(probe_latencies) * 1000:.0f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that concurrent /explain requests overlap")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--username", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--requests", type=int, default=8, help="동시에 보낼 해설 요청 수 (서로 다른 문제)")
+    parser.add_argument("--sequential", action="store_true", help="비교용: 요청을 하나씩 보냄")
+    parser.add_argument("--timeout", type=float, default=180.0)
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+문제 파싱 리포트
+1) 저장된 OCR 문서마다 규칙 기반 로컬 파서만 실행해(LLM 호출 없음) 로컬에서 처리되는 문제 비율을 보여주고,
+2) 완료된 PDF 업로드 작업의 parse_stats를 모아 실제 LLM 호출 시간과 절약된 시간 추정치를 합산합니다.
+
+사용법 (backend 디렉토리에서):
+    python -m scripts.parse_report
+    python -m scripts.parse_report --document 12
+"""
+
+import argparse
+import json
+import time
+
+from main import SessionLocal, OCRDocument, ProcessingJob, get_document_pages
+from ocr_processor import low_confidence_pages
+from question_parser import parse_questions_locally, LLM_PARSE_SECONDS_PER_QUESTION
+
+
+def report_documents(db, document_id=None) -> None:
+    query = db.query(OCRDocument).order_by(OCRDocument.id)
+    if document_id is not None:
+        query = query.filter(OCRDocument.id == document_id)
+
+    print(f"{'doc':>5} {'blocks':>7} {'local':>6} {'key':>5} {'no ans':>7} {'llm':>5} {'share':>6} {'ms':>7}  filename")
+    totals = {"blocks": 0, "local": 0, "seconds": 0.0}
+    for document in query.all():
+        pages = get_document_pages(db, document)
+        started = time.perf_counter()
+        local = parse_questions_locally(pages, low_confidence_pages(pages))
+        elapsed = time.perf_counter() - started
+
+        blocks = len(local["blocks"])
+        no_answer = len(local["unanswered"])
+        from_key = sum(1 for block in local["blocks"] if block["answer_source"] == "key")
+        share = len(local["questions"]) / blocks if blocks else 0.0
+        print(f"{document.id:>5} {blocks:>7} {len(local['questions']):>6} {from_key:>5} {no_answer:>7} "
+              f"{len(local['leftovers']):>5} {share:>6.1%} {elapsed * 1000:>7.1f}  {document.filename}")
+        totals["blocks"] += blocks
+        totals["local"] += len(local["questions"])
+        totals["seconds"] += elapsed
+
+    share = totals["local"] / totals["blocks"] if totals["blocks"] else 0.0
+    print(f"\nTotal: {totals['local']}/{totals['blocks']} question blocks handled locally ({share:.1%}) "
+          f"in {totals['seconds']:.2f}s, ~{totals['local'] * LLM_PARSE_SECONDS_PER_QUESTION:.0f}s of LLM time saved "
+          f"(at {LLM_PARSE_SECONDS_PER_QUESTION}s/question)")
+
+
+def report_jobs(db) -> None:
+    jobs = db.query(ProcessingJob).filter(
+        ProcessingJob.job_type == "pdf_ingest",
+        ProcessingJob.status == "done"
+    ).all()
+
+    totals = {"jobs": 0, "blocks": 0, "local_questions": 0, "llm_questions": 0,
+              "llm_seconds": 0.0, "estimated_llm_seconds_saved": 0.0}
+    for job in jobs:
+        try:
+            parse_stats = json.loads(job.result or "{}").get("parse_stats") or {}
+        except ValueError:
+            continue
+        if "local_questions" not in parse_stats:
+            continue  # 로컬 파서 도입 이전 작업
+        totals["jobs"] += 1
+        for key in totals:
+            if key != "jobs":
+                totals[key] += parse_stats.get(key) or 0
+
+    print(f"\nCompleted upload jobs with parse stats: {totals['jobs']}")
+    if totals["jobs"]:
+        share = totals["local_questions"] / totals["blocks"] if totals["blocks"] else 0.0
+        print(f"  local questions: {totals['local_questions']} ({share:.1%} of question blocks)")
+        print(f"  LLM questions:   {totals['llm_questions']}")
+        print(f"  LLM parse time:  {totals['llm_seconds']:.1f}s")
+        print(f"  LLM time saved:  ~{totals['estimated_llm_seconds_saved']:.1f}s (estimated)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report the share of questions parsed without the LLM")
+    parser.add_argument("--document", type=int, help="특정 OCR 문서 ID만 분석")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        report_documents(db, args.document)
+        if args.document is None:
+            report_jobs(db)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
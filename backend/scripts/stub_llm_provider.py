@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+로컬 LLM 제공자 스텁 서버
+Anthropic Messages API(/v1/messages, 스트리밍 포함)와 Message Batches API(/v1/messages/batches)를
+흉내 내는 서버입니다. API 키나 비용 없이 해설 생성, 스트리밍, 해설 일괄 생성 작업과 부하 테스트를 실행할 수 있습니다.
+응답은 프롬프트 앞부분을 담은 고정 형식의 텍스트이며, 지연 시간 분포(변동, 느린 꼬리)와 오류 비율을 조절할 수 있습니다.
+
+사용법 (backend 디렉토리에서):
+    python -m scripts.stub_llm_provider --port 9999 --latency 1.0
+    python -m scripts.stub_llm_provider --port 9999 --no-batch       # 배치 API 미지원(404) -> 직접 호출 대체 확인
+    python -m scripts.stub_llm_provider --port 9999 --error-rate 0.2  # 20% 요청에 529(overloaded) 응답
+    python -m scripts.stub_llm_provider --port 9999 --jitter 0.3 --slow-rate 0.05 --slow-latency 8  # 느린 꼬리 응답 주입
+
+API 서버와 워커는 다음 환경 변수로 스텁을 사용합니다:
+    ANTHROPIC_API_KEY=sk-stub ANTHROPIC_BASE_URL=http://127.0.0.1:9999
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import uvicorn
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+app = FastAPI(title="Stub LLM provider")
+settings = {"latency": 1.0, "jitter": 0.0, "slow_rate": 0.0, "slow_latency": 10.0,
+            "batch_seconds": 5.0, "batch": True, "error_rate": 0.0, "chunks": 20}
+batches = {}
+stats = {"messages": 0, "streams": 0, "batches": 0, "batch_requests": 0, "errors": 0}
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _latency() -> float:
+    """요청마다 응답 지연을 뽑는 함수: 기본 지연 ± jitter 비율, slow_rate 확률로 slow_latency (꼬리 지연)."""
+    if random.random() < settings["slow_rate"]:
+        return settings["slow_latency"]
+    return max(0.0, settings["latency"] * (1 + random.uniform(-settings["jitter"], settings["jitter"])))
+
+
+def _reply_text(body: dict) -> str:
+    content = body["messages"][-1]["content"]
+    if isinstance(content, list):
+        content = " ".join(block.get("text", "") for block in content)
+    prompt = " ".join(content.split())
+    return f"[stub {body['model']}] {prompt[:80]}"
+
+
+def _message(body: dict, text: str) -> dict:
+    return {
+        "id": f"msg_{uuid.uuid4().hex[:24]}",
+        "type": "message",
+        "role": "assistant",
+        "model": body["model"],
+        "content": [{"type": "text", "text": text}],
+        "stop_reason": "end_turn",
+        "stop_sequence": None,
+        "usage": {"input_tokens": len(json.dumps(body["messages"])) // 4, "output_tokens": len(text) // 4},
+    }
+
+
+def _overloaded() -> JSONResponse:
+    stats["errors"] += 1
+    return JSONResponse(status_code=529, content={
+        "type": "error", "error": {"type": "overloaded_error", "message": "Overloaded (stub)"}
+    })
+
+
+async def _stream_events(body: dict, text: str):
+    def event(event_type: str, data: dict) -> str:
+        return f"event: {event_type}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+    message = _message(body, "")
+    message["content"] = []
+    message["stop_reason"] = None
+    yield event("message_start", {"type": "message_start", "message": message})
+    yield event("content_block_start", {"type": "content_block_start", "index": 0,
+                                        "content_block": {"type": "text", "text": ""}})
+    size = max(1, len(text) // settings["chunks"])
+    latency = _latency()
+    for start in range(0, len(text), size):
+        await asyncio.sleep(latency / settings["chunks"])
+        yield event("content_block_delta", {"type": "content_block_delta", "index": 0,
+                                            "delta": {"type": "text_delta", "text": text[start:start + size]}})
+    yield event("content_block_stop", {"type": "content_block_stop", "index": 0})
+    yield event("message_delta", {"type": "message_delta",
+                                  "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+                                  "usage": {"output_tokens": len(text) // 4}})
+    yield event("message_stop", {"type": "message_stop"})
+
+
+@app.post("/v1/messages")
+async def create_message(request: Request):
+    body = await request.json()
+    if random.random() < settings["error_rate"]:
+        return _overloaded()
+    text = _reply_text(body)
+    if body.get("stream"):
+        stats["streams"] += 1
+        return StreamingResponse(_stream_events(body, text), media_type="text/event-stream")
+    stats["messages"] += 1
+    await asyncio.sleep(_latency())
+    return _message(body, text)
+
+
+def _batch_response(batch: dict, request: Request) -> dict:
+    ended = time.time() >= batch["ends_at"]
+    total = len(batch["requests"])
+    return {
+        "id": batch["id"],
+        "type": "message_batch",
+        "processing_status": "ended" if ended else "in_progress",
+        "request_counts": {"processing": 0 if ended else total, "succeeded": total if ended else 0,
+                           "errored": 0, "canceled": 0, "expired": 0},
+        "created_at": batch["created_at"],
+        "expires_at": batch["expires_at"],
+        "ended_at": _now() if ended else None,
+        "archived_at": None,
+        "cancel_initiated_at": None,
+        "results_url": str(request.url_for("batch_results", batch_id=batch["id"])) if ended else None,
+    }
+
+
+def _require_batch_api() -> None:
+    if not settings["batch"]:
+        raise HTTPException(status_code=404, detail="Message Batches API is disabled (stub --no-batch)")
+
+
+@app.post("/v1/messages/batches")
+async def create_batch(request: Request):
+    _require_batch_api()
+    body = await request.json()
+    batch_id = f"msgbatch_{uuid.uuid4().hex[:24]}"
+    batches[batch_id] = {
+        "id": batch_id,
+        "requests": body["requests"],
+        "created_at": _now(),
+        "expires_at": (datetime.now(timezone.utc) + timedelta(days=1)).isoformat(),
+        "ends_at": time.time() + settings["batch_seconds"],
+    }
+    stats["batches"] += 1
+    stats["batch_requests"] += len(body["requests"])
+    return _batch_response(batches[batch_id], request)
+
+
+@app.get("/v1/messages/batches/{batch_id}")
+async def retrieve_batch(batch_id: str, request: Request):
+    _require_batch_api()
+    if batch_id not in batches:
+        raise HTTPException(status_code=404, detail="batch not found")
+    return _batch_response(batches[batch_id], request)
+
+
+@app.get("/v1/messages/batches/{batch_id}/results", name="batch_results")
+async def batch_results(batch_id: str):
+    _require_batch_api()
+    batch = batches.get(batch_id)
+    if batch is None or time.time() < batch["ends_at"]:
+        raise HTTPException(status_code=404, detail="results not available")
+    lines = []
+    for item in batch["requests"]:
+        params = item["params"]
+        lines.append(json.dumps({
+            "custom_id": item["custom_id"],
+            "result": {"type": "succeeded", "message": _message(params, _reply_text(params))},
+        }, ensure_ascii=False))
+    return Response("\n".join(lines) + "\n", media_type="application/binary")
+
+
+@app.get("/stats")
+async def get_stats():
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stub of the Anthropic Messages and Batches APIs")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9999)
+    parser.add_argument("--latency", type=float, default=1.0, help="메시지 응답 지연(초), 스트리밍은 전체 전송 시간")
+    parser.add_argument("--jitter", type=float, default=0.0, help="지연 시간 변동 비율 (0.3 = ±30%%)")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="--slow-latency로 느리게 응답할 요청 비율")
+    parser.add_argument("--slow-latency", type=float, default=10.0, help="느린 요청의 지연(초)")
+    parser.add_argument("--batch-seconds", type=float, default=5.0, help="배치가 끝나기까지 걸리는 시간(초)")
+    parser.add_argument("--no-batch", action="store_true", help="배치 API를 404로 응답")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="529(overloaded)로 응답할 메시지 요청 비율")
+    args = parser.parse_args()
+
+    settings.update(latency=args.latency, jitter=args.jitter, slow_rate=args.slow_rate,
+                    slow_latency=args.slow_latency, batch_seconds=args.batch_seconds, batch=not args.no_batch,
+                    error_rate=args.error_rate)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""
+parse_windows 윈도우 분할 테스트 (backend 디렉토리에서: python -m pytest tests)
+"""
+
+import ocr_processor
+from ocr_processor import expected_parse_output, max_expected_output, parse_windows, PARSE_MODEL
+
+# 한글로 빽빽한 한 페이지 (약 1,400자): 두 페이지를 합치면 파싱 모델의 최대 출력을 넘음
+DENSE_TEXT = ("가나다라마바사아자차카타파하 " * 6 + "\n") * 16
+
+
+def _dense_pages(count):
+    return [{"page": n, "text": DENSE_TEXT, "method": "ocr"} for n in range(1, count + 1)]
+
+
+def test_dense_pages_need_more_than_one_window():
+    pages = _dense_pages(2)
+    assert expected_parse_output(pages) > max_expected_output(PARSE_MODEL)
+
+
+def test_dense_windows_overlap(monkeypatch):
+    monkeypatch.setattr(ocr_processor, "LLM_PARSE_OVERLAP_PAGES", 1)
+    windows = parse_windows(_dense_pages(5))
+
+    assert len(windows) > 1
+    for previous, current in zip(windows, windows[1:]):
+        # 앞 윈도우의 마지막 조각이 다음 윈도우의 첫 조각으로 다시 들어가야 경계에 걸친 문제를 놓치지 않음
+        assert previous[-1] is current[0]
+        assert len(current) > 1
+
+
+def test_dense_windows_cover_document_within_budget(monkeypatch):
+    monkeypatch.setattr(ocr_processor, "LLM_PARSE_OVERLAP_PAGES", 1)
+    windows = parse_windows(_dense_pages(5))
+
+    budget = max_expected_output(PARSE_MODEL)
+    assert all(expected_parse_output(window) <= budget for window in windows)
+    for n in range(1, 6):
+        text = "".join(part["text"] for part in _unique_parts(windows) if part["page"] == n)
+        assert text == DENSE_TEXT
+
+
+def _unique_parts(windows):
+    seen, parts = set(), []
+    for window in windows:
+        for part in window:
+            if id(part) not in seen:
+                seen.add(id(part))
+                parts.append(part)
+    return parts
@@ -0,0 +1,118 @@
+import os
+import math
+from typing import Callable, List, Sequence, Tuple, TypeVar
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# LLM 요청 크기 계산: 보내기 전에 입력/예상 출력 토큰을 어림해 요청을 나누고 요청별 max_tokens를 정합니다.
+# 모델별 (컨텍스트 창, 최대 출력) 토큰 수. 목록에 없는 모델은 DEFAULT_MODEL_LIMITS를 사용합니다.
+MODEL_LIMITS = {
+    "claude-3-haiku-20240307": (200000, 4096),
+    "claude-3-5-sonnet-20240620": (200000, 4096),  # 8192 출력은 베타 헤더가 필요해 사용하지 않음
+}
+DEFAULT_MODEL_LIMITS = (200000, 4096)
+# 예상 출력 토큰에 곱하는 여유 비율과 더하는 고정 여유분 (추정 오차, JSON 닫는 괄호 등)
+LLM_OUTPUT_SAFETY_RATIO = float(os.getenv("LLM_OUTPUT_SAFETY_RATIO", "1.25"))
+LLM_OUTPUT_MARGIN_TOKENS = int(os.getenv("LLM_OUTPUT_MARGIN_TOKENS", "256"))
+
+T = TypeVar("T")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    토크나이저 없이 토큰 수를 어림하는 함수 (한도 계산용이므로 넉넉하게).
+    영문/숫자는 약 4글자당 1토큰, 한글 등 비ASCII 문자는 글자당 1토큰으로 계산합니다.
+    """
+    text = text or ""
+    ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+    return (ascii_chars + 3) // 4 + (len(text) - ascii_chars)
+
+
+def estimate_message_tokens(messages: List[dict]) -> int:
+    return sum(estimate_tokens(message["content"]) for message in messages)
+
+
+def model_limits(model: str) -> Tuple[int, int]:
+    """모델의 (컨텍스트 창, 최대 출력) 토큰 수."""
+    return MODEL_LIMITS.get(model, DEFAULT_MODEL_LIMITS)
+
+
+def output_max_tokens(model: str, expected_output_tokens: int) -> int:
+    """예상 출력 토큰에 여유를 더한 max_tokens를 모델의 최대 출력 이내로 정하는 함수."""
+    wanted = math.ceil(expected_output_tokens * LLM_OUTPUT_SAFETY_RATIO) + LLM_OUTPUT_MARGIN_TOKENS
+    return max(1, min(model_limits(model)[1], wanted))
+
+
+def max_expected_output(model: str) -> int:
+    """여유를 더해도 모델의 최대 출력을 넘지 않는 가장 큰 예상 출력 토큰 수 (요청을 나누는 기준)."""
+    return max(1, int((model_limits(model)[1] - LLM_OUTPUT_MARGIN_TOKENS) / LLM_OUTPUT_SAFETY_RATIO))
+
+
+def pack_by_tokens(items: Sequence[T], measure: Callable[[T], int], budget: int) -> List[List[T]]:
+    """
+    순서를 유지한 채 항목들을 토큰 합이 budget 이하인 묶음으로 나누는 함수.
+    혼자서 budget을 넘는 항목은 단독 묶음이 됩니다 (필요하면 split_text로 먼저 나누세요).
+    """
+    groups, current, used = [], [], 0
+    for item in items:
+        size = measure(item)
+        if current and used + size > budget:
+            groups.append(current)
+            current, used = [], 0
+        current.append(item)
+        used += size
+    if current:
+        groups.append(current)
+    return groups
+
+
+def _text_units(text: str, max_tokens: int) -> List[str]:
+    """텍스트를 줄 단위로 나누고, max_tokens를 넘는 줄은 글자 수로 다시 자르는 함수 (이어 붙이면 원문과 같음)."""
+    units = []
+    for line in text.splitlines(keepends=True):
+        if estimate_tokens(line) <= max_tokens:
+            units.append(line)
+            continue
+        # 토큰 추정은 글자당 최대 1토큰이므로 max_tokens 글자씩 자르면 항상 예산 이내
+        units.extend(line[i:i + max_tokens] for i in range(0, len(line), max(1, max_tokens)))
+    return units
+
+
+def split_text(text: str, max_tokens: int) -> List[str]:
+    """텍스트를 줄 경계에서 나눠 각 조각이 max_tokens 이하가 되게 하는 함수."""
+    if estimate_tokens(text) <= max_tokens:
+        return [text]
+    return ["".join(group) for group in pack_by_tokens(_text_units(text, max_tokens), estimate_tokens, max_tokens)]
+
+
+def split_text_evenly(text: str, parts: int) -> List[str]:
+    """텍스트를 줄 경계에서 토큰 수가 비슷한 parts개(이하)의 연속된 조각으로 나누는 함수."""
+    total = estimate_tokens(text)
+    if parts <= 1 or total == 0:
+        return [text]
+    target = math.ceil(total / parts)
+    return _even_groups(_text_units(text, target), target, parts)
+
+
+def _even_groups(units: List[str], target: int, parts: int) -> List[str]:
+    # 마지막 조각은 남은 줄을 모두 받으므로 조각 수가 parts를 넘지 않음
+    groups, current, used = [], [], 0
+    for unit in units:
+        size = estimate_tokens(unit)
+        if current and used + size > target and len(groups) < parts - 1:
+            groups.append("".join(current))
+            current, used = [], 0
+        current.append(unit)
+        used += size
+    if current:
+        groups.append("".join(current))
+    return groups
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """텍스트 앞부분을 max_tokens 이내로 자르는 함수 (가능하면 줄 경계에서)."""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    return split_text(text, max_tokens)[0]